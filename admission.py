@@ -0,0 +1,288 @@
+"""
+请求准入控制模块
+提供按客户端的令牌桶限流，以及基于检测队列深度的负载感知准入控制
+"""
+import ipaddress
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+
+# 清理已补满令牌桶的间隔（秒）
+SWEEP_INTERVAL_SECONDS = 60.0
+
+
+def full_at(tokens: float, rate: float, capacity: float, now: float) -> float:
+    """
+    令牌桶补满的时间：此后未访问的令牌桶与新桶等价，可以删除
+
+    按每个桶自己的速率和容量计算，多个限流器共用一个存储时互不影响
+    """
+    return now + (capacity - tokens) / rate
+
+
+class MemoryBucketStore:
+    """进程内令牌桶存储（每个 worker 独立计数）"""
+
+    def __init__(self):
+        # 客户端标识 -> (令牌数, 更新时间, 补满时间)
+        self._buckets: Dict[str, Tuple[float, float, float]] = {}
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+
+    def take(self, key: str, rate: float, capacity: float, now: float) -> Tuple[bool, float]:
+        """
+        从指定客户端的令牌桶中取出一个令牌
+
+        Args:
+            key: 客户端标识
+            rate: 每秒补充的令牌数
+            capacity: 桶容量（允许的突发请求数）
+            now: 当前时间戳
+
+        Returns:
+            (是否放行, 建议的重试等待秒数)
+        """
+        with self._lock:
+            if now - self._last_sweep > SWEEP_INTERVAL_SECONDS:
+                # 清理已补满的令牌桶，客户端标识很多时内存不会无限增长
+                self._last_sweep = now
+                self._buckets = {k: v for k, v in self._buckets.items() if v[2] > now}
+            tokens, updated, _ = self._buckets.get(key, (capacity, now, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now, full_at(tokens, rate, capacity, now))
+            return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+
+class SQLiteBucketStore:
+    """基于 SQLite 的令牌桶存储，多个 worker 进程共享同一个数据库文件"""
+
+    def __init__(self, db_path: str):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._connect()
+
+    def _connect(self):
+        self._pid = os.getpid()
+        self._last_sweep = 0.0
+        self._conn = sqlite3.connect(self.db_path, timeout=1.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL, full_at REAL)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(buckets)")}
+        if "full_at" not in columns:
+            # 旧版数据库没有补满时间，这些行在下次访问时补上
+            self._conn.execute("ALTER TABLE buckets ADD COLUMN full_at REAL")
+
+    def take(self, key: str, rate: float, capacity: float, now: float) -> Tuple[bool, float]:
+        """与 MemoryBucketStore.take 相同，状态保存在共享数据库中"""
+        with self._lock:
+            # SQLite 连接不能跨 fork 使用，预先 fork 的 worker 中重新连接
+            if self._pid != os.getpid():
+                self._connect()
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                row = self._conn.execute(
+                    "SELECT tokens, updated FROM buckets WHERE key = ?", (key,)
+                ).fetchone()
+                tokens, updated = row if row else (capacity, now)
+                tokens = min(capacity, tokens + (now - updated) * rate)
+                allowed = tokens >= 1
+                if allowed:
+                    tokens -= 1
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)",
+                    (key, tokens, now, full_at(tokens, rate, capacity, now))
+                )
+                if now - self._last_sweep > SWEEP_INTERVAL_SECONDS:
+                    # 清理已补满的令牌桶（每个进程每个清理周期最多一次）
+                    self._last_sweep = now
+                    self._conn.execute("DELETE FROM buckets WHERE full_at <= ?", (now,))
+                self._conn.execute("COMMIT")
+            except sqlite3.OperationalError:
+                # 数据库繁忙时放行，限流不应成为可用性瓶颈
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                return True, 0.0
+            return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+
+class RateLimiter:
+    """按客户端的令牌桶限流器"""
+
+    def __init__(self, per_minute: int, burst: int, store=None):
+        """
+        Args:
+            per_minute: 每分钟允许的请求数
+            burst: 允许的突发请求数（桶容量）
+            store: 令牌桶存储，默认使用进程内存储
+        """
+        self.rate = per_minute / 60.0
+        self.capacity = float(max(burst, 1))
+        self.store = store or MemoryBucketStore()
+
+    def check(self, key: str) -> Tuple[bool, float]:
+        """检查客户端是否允许发起请求，返回 (是否放行, 重试等待秒数)"""
+        return self.store.take(key, self.rate, self.capacity, time.time())
+
+
+class LoadMonitor:
+    """
+    检测负载监控
+
+    记录当前排队/处理中的检测请求数量以及各类请求的平均处理耗时，
+    用于准入控制（队列过深时优先丢弃视频流帧）
+    """
+
+    def __init__(self, ewma_alpha: float = 0.2):
+        self.ewma_alpha = ewma_alpha
+        self.queue_depth = 0
+        self.avg_seconds: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def track(self, kind: str):
+        """统计一次检测请求，从进入队列到处理完成"""
+        start = time.perf_counter()
+        with self._lock:
+            self.queue_depth += 1
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.queue_depth -= 1
+                previous = self.avg_seconds.get(kind)
+                if previous is None:
+                    self.avg_seconds[kind] = elapsed
+                else:
+                    self.avg_seconds[kind] = previous + self.ewma_alpha * (elapsed - previous)
+
+    def should_admit(self, kind: str, stream_limit: int, max_limit: int) -> bool:
+        """
+        判断是否接纳新的检测请求
+
+        Args:
+            kind: 请求类型，"stream" 为视频流帧，其他为图片上传
+            stream_limit: 视频流帧允许的最大队列深度
+            max_limit: 所有检测请求允许的最大队列深度
+
+        Returns:
+            是否接纳
+        """
+        limit = stream_limit if kind == "stream" else max_limit
+        return self.queue_depth < limit
+
+    def stream_hint(
+        self,
+        frame_width: int,
+        min_delay_ms: int,
+        max_delay_ms: int,
+        target_ms: int,
+        min_width: int,
+        max_width: int
+    ) -> Dict[str, int]:
+        """
+        根据当前队列深度和实测处理耗时，给摄像头客户端推荐下一帧的发送间隔和采集宽度
+
+        Args:
+            frame_width: 当前帧宽度（像素）
+            min_delay_ms: 最小发送间隔
+            max_delay_ms: 最大发送间隔
+            target_ms: 单帧目标处理耗时
+            min_width: 最小采集宽度
+            max_width: 最大采集宽度
+
+        Returns:
+            {"next_delay_ms": 下一帧发送间隔, "capture_width": 推荐采集宽度}
+        """
+        avg_ms = self.avg_seconds.get("stream", 0.0) * 1000
+        # 队列深度包含当前请求本身
+        waiting = max(0, self.queue_depth - 1)
+
+        delay = min_delay_ms + avg_ms * waiting + max(0.0, avg_ms - target_ms)
+        delay = int(min(max(delay, min_delay_ms), max_delay_ms))
+
+        width = frame_width or max_width
+        if avg_ms > 0:
+            # HOG 检测耗时与像素数成正比，按面积比例缩放宽度
+            width = width * (target_ms / avg_ms) ** 0.5
+        width = int(min(max(width, min_width), max_width)) // 16 * 16
+
+        return {"next_delay_ms": delay, "capture_width": width}
+
+    def snapshot(self) -> Dict[str, object]:
+        """返回当前负载指标"""
+        with self._lock:
+            return {
+                "queue_depth": self.queue_depth,
+                "avg_processing_ms": {
+                    kind: round(seconds * 1000, 2) for kind, seconds in self.avg_seconds.items()
+                }
+            }
+
+
+def parse_networks(addresses: Iterable[str]) -> Tuple:
+    """解析可信代理列表（IP 或 CIDR），无效项忽略"""
+    networks = []
+    for address in addresses:
+        try:
+            networks.append(ipaddress.ip_network(address.strip(), strict=False))
+        except ValueError:
+            pass
+    return tuple(networks)
+
+
+def is_trusted(host: Optional[str], networks: Tuple) -> bool:
+    """地址是否属于可信代理"""
+    if not host or not networks:
+        return False
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in networks)
+
+
+def get_client_key(
+    headers,
+    client_host: Optional[str],
+    api_keys: Iterable[str] = (),
+    trusted_proxies: Tuple = ()
+) -> str:
+    """
+    获取客户端标识：优先使用已配置的 API Key，其次是可信代理传入的真实 IP，最后是直连地址
+
+    客户端可以随意设置 X-API-Key 和 X-Forwarded-For，只有在配置中的 Key、
+    以及直连地址属于可信代理时的转发头才会被采用，否则每次更换请求头即可绕过限流
+
+    Args:
+        headers: 请求头
+        client_host: 直连客户端地址
+        api_keys: 有效的 API Key
+        trusted_proxies: parse_networks 解析的可信代理
+
+    Returns:
+        客户端标识字符串
+    """
+    api_key = headers.get("x-api-key")
+    if api_key and api_key in api_keys:
+        return f"key:{api_key}"
+    real_ip = None
+    if is_trusted(client_host, trusted_proxies):
+        real_ip = headers.get("x-real-ip")
+        if not real_ip:
+            # 从右向左跳过可信代理，第一个不可信的地址才是客户端
+            hops = [hop.strip() for hop in headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+            real_ip = next((hop for hop in reversed(hops) if not is_trusted(hop, trusted_proxies)), None)
+    return f"ip:{real_ip or client_host or 'unknown'}"
@@ -0,0 +1,136 @@
+"""
+识别结果标注模块
+在结果图片上绘制人脸框和人名标签
+
+- 支持中文的 TrueType 字体只加载一次（ANNOTATION_FONT，为空时在常见位置查找）
+- 每个人名的标签位图渲染一次后按 LRU 缓存，之后每次绘制只需要贴图
+- 设置 RESULT_IMAGE_MAX_SIDE 时先按整数倍缩小图片再绘制，绘制和 JPEG 编码的像素都更少
+"""
+import logging
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Sequence, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+logger = logging.getLogger(__name__)
+
+# 自动查找的字体（按顺序，前面的支持中文）
+FONT_CANDIDATES = [
+    "static/fonts/NotoSansCJK-Regular.ttc",
+    "static/fonts/NotoSansSC-Regular.otf",
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/google-noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",
+    "/usr/share/fonts/wenquanyi/wqy-microhei/wqy-microhei.ttc",
+    "/System/Library/Fonts/PingFang.ttc",
+    "/System/Library/Fonts/STHeiti Medium.ttc",
+    "C:/Windows/Fonts/msyh.ttc",
+    "C:/Windows/Fonts/simhei.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+]
+
+KNOWN_COLOR = (0, 255, 0)
+UNKNOWN_COLOR = (255, 0, 0)
+TEXT_COLOR = (255, 255, 255)
+BOX_WIDTH = 3
+LABEL_PADDING = 4
+
+_font = None
+_font_lock = threading.Lock()
+
+
+def load_font(path: str = "", size: int = 18) -> ImageFont.ImageFont:
+    """
+    加载标注字体（进程内只加载一次）
+
+    Args:
+        path: 字体文件，为空时按 FONT_CANDIDATES 查找
+        size: 字号（结果图片上的像素）
+
+    Returns:
+        字体；找不到 TrueType 字体时使用 Pillow 默认字体（不支持中文）
+    """
+    global _font
+    if _font is None:
+        with _font_lock:
+            if _font is None:
+                for candidate in ([path] if path else []) + FONT_CANDIDATES:
+                    if not Path(candidate).exists():
+                        continue
+                    try:
+                        _font = ImageFont.truetype(candidate, size)
+                        logger.info(f"标注字体: {candidate}")
+                        break
+                    except OSError as e:
+                        logger.warning(f"无法加载字体 {candidate}: {e}")
+                else:
+                    logger.warning("未找到支持中文的字体，人名标签使用默认字体（中文无法显示），可设置 ANNOTATION_FONT")
+                    _font = ImageFont.load_default()
+    return _font
+
+
+@lru_cache(maxsize=1024)
+def render_label(name: str, color: Tuple[int, int, int], font: ImageFont.ImageFont) -> Image.Image:
+    """渲染人名标签（背景色 + 白字），同一人名只渲染一次"""
+    x0, y0, x1, y1 = font.getbbox(name)
+    label = Image.new("RGB", (x1 - x0 + LABEL_PADDING * 2, y1 - y0 + LABEL_PADDING * 2), color)
+    ImageDraw.Draw(label).text((LABEL_PADDING - x0, LABEL_PADDING - y0), name, font=font, fill=TEXT_COLOR)
+    return label
+
+
+def reduce_factor(width: int, height: int, max_side: int) -> int:
+    """
+    缩小倍数：满足最长边不超过 max_side 的最小整数（0 表示不限制）
+
+    按整数倍块平均缩小比任意比例插值快一个数量级，结果图片可能比上限略小
+    """
+    if max_side <= 0 or max(width, height) <= max_side:
+        return 1
+    return -(-max(width, height) // max_side)
+
+
+def draw_annotations(
+    image_array: np.ndarray,
+    face_locations: Sequence,
+    face_names: Sequence[str],
+    font: ImageFont.ImageFont,
+    max_side: int = 0
+) -> Image.Image:
+    """
+    绘制人脸框和人名标签
+
+    Args:
+        image_array: RGB 图片
+        face_locations: 人脸位置 [(top, right, bottom, left), ...]（原图坐标）
+        face_names: 人名列表
+        font: load_font 返回的字体
+        max_side: 结果图片最长边上限，0 表示保持原尺寸
+
+    Returns:
+        绘制后的图片
+    """
+    height, width = image_array.shape[:2]
+    factor = reduce_factor(width, height, max_side)
+    image = Image.fromarray(image_array)
+    if factor > 1:
+        image = image.reduce(factor)
+    draw = ImageDraw.Draw(image)
+
+    for (top, right, bottom, left), name in zip(face_locations, face_names):
+        top, right, bottom, left = (v // factor for v in (top, right, bottom, left))
+        color = KNOWN_COLOR if name != "Unknown" else UNKNOWN_COLOR
+        draw.rectangle([left, top, right, bottom], outline=color, width=BOX_WIDTH)
+
+        # 标签贴在框底部，空间不够时放在框下方
+        label = render_label(name, color, font)
+        label_top = bottom - label.height if bottom - label.height >= top else bottom
+        draw.rectangle([left, label_top, max(right, left + label.width), label_top + label.height], fill=color)
+        image.paste(label, (left, label_top))
+
+    return image
+
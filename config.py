@@ -38,6 +38,12 @@ class Settings(BaseSettings):
     MAX_IMAGE_SIZE: int = 5 * 1024 * 1024  # 5MB
     DETECTION_TIMEOUT: int = 5  # 检测超时（秒）
     ENABLE_FACE_CACHE: bool = True  # 启用人脸特征缓存
+    WARMUP_ON_STARTUP: bool = True  # 启动后在后台线程加载模型和人脸库并预热，完成前 /ready 返回 503（Serverless 需关闭，首次请求时加载）
+    WARMUP_REJECT_REQUESTS: bool = False  # 预热完成前 /api/* 直接返回 503、WebSocket 以 1013 关闭（仅在 nginx 可把请求转给其他 worker 时开启，否则请求等待模型加载）
+    WARMUP_IMAGE_SIZES: List[int] = [640, 1280]  # 预热人脸检测的图片宽度（与常见上传尺寸、视频流采集宽度一致）
+    WARMUP_BATCH_SIZES: List[int] = [1, 8]  # 预热特征提取和比对的单张图片人脸数
+    ENCODE_WORKERS: int = 0  # 多人照片并行提取特征的进程数（0 或 1 为不并行）
+    ENCODE_PARALLEL_MIN_FACES: int = 24  # 人脸数达到该值时才并行提取特征
 
     # 缓存配置
     CACHE_DIR: str = os.getenv(
@@ -46,6 +52,51 @@ class Settings(BaseSettings):
     )
     FACE_ENCODINGS_CACHE: str = os.path.join(CACHE_DIR, "face_encodings.pkl")
 
+    # 人脸截图存储（供复核界面查看检测到的人脸）
+    CROP_STORE_ENABLED: bool = False
+    CROP_STORE_DIR: str = "uploads/crops"
+    CROP_STORE_MAX_MB: int = 512  # 总大小上限，超过后淘汰最久未访问的请求
+    CROP_SIZE: int = 112  # 截图最长边
+    CROP_FORMAT: str = "webp"  # "webp" 或 "jpeg"
+    CROP_QUALITY: int = 80
+
+    # 视频文件识别
+    VIDEO_MAX_BYTES: int = 500 * 1024 * 1024  # 上传视频的最大大小
+    VIDEO_SAMPLE_FPS: float = 2.0  # 每秒检测的帧数
+    VIDEO_SCAN_FPS: float = 6.0  # 解码帧率（场景变化时在两次定时检测之间额外检测）
+    VIDEO_SCENE_THRESHOLD: float = 0.12  # 缩略图平均差异超过该值视为场景变化
+    VIDEO_MAX_WIDTH: int = 1280  # 检测前缩小到的最大宽度
+    VIDEO_TRACK_SAMPLES: int = 3  # 每条轨迹最多提取特征的次数
+    VIDEO_WORKERS: int = 2  # 并行处理的进程数（按时间分段）
+    VIDEO_MIN_SEGMENT_SECONDS: float = 30.0  # 每个进程处理的最短时长
+
+    # 人脸库存储方式（百万级人脸库的内存优化）
+    # "float64": 全精度；"float16": 内存减为 1/4；
+    # "pq": 乘积量化，内存中每张人脸只占 GALLERY_PQ_SUBSPACES 字节，
+    #       候选用磁盘上内存映射的原始向量重排序（文件由特征缓存派生，删除后自动重建）
+    GALLERY_STORAGE: str = "float64"
+    GALLERY_PQ_SUBSPACES: int = 16  # PQ 子空间数量（需整除 128）
+    GALLERY_PQ_RERANK: int = 64  # PQ 粗排后精确重排序的候选数量
+
+    # 人脸库分片（由 scripts/shard_gallery.py 生成清单，各分片运行 shard_server.py）
+    SHARD_MANIFEST: str = os.getenv("SHARD_MANIFEST", "")  # 分片清单路径，为空时不分片
+    SHARD_TIMEOUT_MS: int = 300  # 等待分片响应的最长时间，超时的分片本次不参与合并
+    SHARD_TOKEN: str = os.getenv("SHARD_TOKEN", "")  # 主服务访问分片服务的共享密钥（X-Shard-Token），为空时分片服务拒绝检索和注册
+
+    # 人脸注册队列（后台批量提取特征）
+    ENROLL_QUEUE_DB: str = os.path.join(CACHE_DIR, "enrollment.db")
+    ENROLL_SPOOL_DIR: str = os.path.join(CACHE_DIR, "enroll_spool")  # 待处理图片暂存目录
+    ENROLL_WORKERS: int = 2  # 并行提取特征的进程数
+    ENROLL_MAX_ATTEMPTS: int = 3  # 单张图片最大尝试次数
+    ENROLL_MAX_BULK_FILES: int = 10000  # 批量导入单个压缩包最多图片数
+
+    # 注册图片质量检查与去重
+    ENROLL_REJECT_MULTI_FACE: bool = True  # 拒绝多人照片（关闭时注册最大的人脸）
+    ENROLL_MIN_FACE_SIZE: int = 80  # 人脸框最短边的最小像素数
+    ENROLL_MIN_SHARPNESS: float = 50.0  # 人脸区域的最小清晰度（拉普拉斯方差），0 表示不检查
+    ENROLL_DUPLICATE_DISTANCE: float = 0.3  # 与已注册人脸距离小于该值视为重复
+    ENROLL_DUPLICATE_ACTION: str = "reject"  # 与其他人重复时 "reject" 拒绝，"flag" 注册并标记
+
     # 存储配置
     STORAGE_TYPE: str = "supabase"  # "local", "s3", "supabase"
     SUPABASE_URL: str = os.getenv("SUPABASE_URL", "")
@@ -59,10 +110,61 @@ class Settings(BaseSettings):
     # 日志配置
     LOG_LEVEL: str = "INFO"
     LOG_DIR: str = "/var/log/face-recognition"
+    LOG_FORMAT: str = "json"  # "json"（结构化日志）或 "text"
+    LOG_TO_FILE: bool = False  # 同时写入 LOG_DIR/app.log（systemd 部署时 stdout 已写入文件，默认关闭）
+    LOG_STREAM_SAMPLE_RATE: float = 0.05  # 视频流帧请求日志的采样比例（出错和慢请求始终记录）
+    LOG_SLOW_REQUEST_MS: float = 1000  # 超过该耗时的请求始终记录
 
     # 安全配置
     RATE_LIMIT_PER_MINUTE: int = 60  # 每分钟最多请求数
     ENABLE_RATE_LIMIT: bool = True
+    ADMIN_TOKEN: str = os.getenv("ADMIN_TOKEN", "")  # 管理接口（性能分析、请求耗时追踪）令牌，为空时关闭
+    PROFILE_MAX_SECONDS: int = 60  # 单次性能分析的最长时间
+    RATE_LIMIT_BURST: int = 10  # 允许的突发请求数
+    STREAM_RATE_LIMIT_PER_MINUTE: int = 240  # 视频流帧单独限流（约4帧/秒）
+    RATE_LIMIT_BACKEND: str = "memory"  # "memory" 或 "sqlite"（多 worker 共享状态）
+    RATE_LIMIT_DB: str = os.path.join(CACHE_DIR, "rate_limit.db")
+    API_KEYS: List[str] = []  # 有效的 API Key（X-API-Key 在列表中时按 Key 独立限流，否则忽略）
+    TRUSTED_PROXIES: List[str] = ["127.0.0.1", "::1"]  # 只采用这些地址（IP 或 CIDR）转发的 X-Real-IP / X-Forwarded-For
+
+    # 准入控制（负载过高时优先丢弃视频流帧）
+    STREAM_SHED_QUEUE_DEPTH: int = 4  # 检测队列超过该深度时拒绝视频流帧
+    ADMISSION_MAX_QUEUE_DEPTH: int = 32  # 检测队列超过该深度时拒绝图片检测
+
+    # 视频流自适应帧率（服务端在响应中给出下一帧建议）
+    STREAM_MIN_INTERVAL_MS: int = 200  # 最小发送间隔
+    STREAM_MAX_INTERVAL_MS: int = 3000  # 最大发送间隔
+    STREAM_TARGET_LATENCY_MS: int = 300  # 单帧目标处理耗时
+    STREAM_MIN_CAPTURE_WIDTH: int = 320  # 最小采集宽度
+    STREAM_MAX_CAPTURE_WIDTH: int = 1280  # 最大采集宽度
+
+    # 视频流帧编码（通过 /api/stream/capabilities 和 client_hint 告知客户端）
+    STREAM_CAPTURE_QUALITY: float = 0.7  # 建议的 JPEG / WebP 编码质量（0~1），检测不需要高画质
+    STREAM_PREFER_WEBP: bool = True  # 建议浏览器支持时发送 WebP 帧（同等画质体积更小，服务端解码比 JPEG 稍慢；需要 Pillow 支持 WebP）
+    STREAM_GRAYSCALE: bool = False  # 建议客户端发送灰度帧（体积更小，但与彩色注册照的特征距离略有增大）
+
+    # 批量识别（/api/detect_batch，NDJSON 流式返回）
+    BATCH_MAX_FILES: int = 100  # 单次最多图片数
+    BATCH_DETECT_CONCURRENCY: int = 2  # 单个批量请求同时处理的图片数
+
+    # 视频流区域检测（只在上一帧人脸框附近检测）
+    ENABLE_ROI_DETECTION: bool = True
+    ROI_FULL_SCAN_INTERVAL: int = 10  # 每隔多少帧做一次全图检测
+    ROI_EXPAND_RATIO: float = 0.5  # 人脸框向四周扩展的比例
+    ROI_MAX_STREAMS: int = 1000  # 最多同时跟踪的视频流数量
+
+    # 结果图片标注
+    ANNOTATION_FONT: str = ""  # 人名标签字体（TrueType/OpenType，需支持中文），为空时在常见位置查找
+    ANNOTATION_FONT_SIZE: int = 18  # 标签字号（结果图片上的像素）
+    RESULT_IMAGE_MAX_SIDE: int = 0  # /api/detect 结果图片最长边上限（按整数倍缩小），0 表示保持原图尺寸
+
+    # 识别事件记录（考勤 / 签到，/api/detect_stream 识别出的已知人员写入 SQLite）
+    EVENT_LOG_ENABLED: bool = False
+    EVENT_LOG_DB: str = os.path.join(CACHE_DIR, "events.db")
+    EVENT_LOG_DEBOUNCE_SECONDS: float = 60.0  # 同一摄像头同一人在该时间内重复出现只记录一次
+    EVENT_LOG_BATCH_SIZE: int = 500  # 每批最多写入的事件数
+    EVENT_LOG_FLUSH_INTERVAL_MS: int = 1000  # 最长写入间隔
+    EVENT_LOG_RETENTION_DAYS: int = 90  # 事件保留天数，0 表示永久保留
 
     class Config:
         env_file = ".env"
@@ -95,8 +197,10 @@ def is_development() -> bool:
     return settings.ENVIRONMENT == "development"
 
 
-# 打印当前配置（仅开发环境）
-if is_development():
+def print_settings():
+    """打印当前配置（仅开发环境，在应用启动时调用，不在导入时执行）"""
+    if not is_development():
+        return
     print("=" * 50)
     print("当前配置:")
     print(f"  环境: {settings.ENVIRONMENT}")
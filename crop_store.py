@@ -0,0 +1,203 @@
+"""
+人脸截图存储模块
+检测到的人脸裁剪为小尺寸 WebP/JPEG 保存在磁盘（默认 uploads/crops），每次请求的截图保存在
+服务端生成的截图 ID 目录中（不使用客户端可指定的 X-Request-ID，不会覆盖其他请求的截图），
+供复核界面查看，不需要重新上传和检测
+
+- 请求线程只复制人脸区域并放入队列，缩放、编码和写文件在后台线程完成；队列满时丢弃，不阻塞请求
+- 总大小超过上限时按最近访问时间（目录修改时间）淘汰最旧的请求；
+  淘汰时扫描整个目录，多个 worker 进程共用同一目录时也能正确统计
+"""
+import json
+import logging
+import os
+import queue
+import re
+import shutil
+import threading
+import uuid
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# 截图 ID 用作目录名，查询时只接受安全字符
+_SAFE_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+META_FILE = "meta.json"
+
+
+class CropStore:
+    """按截图 ID 保存人脸截图，总大小受限的磁盘 LRU"""
+
+    def __init__(
+        self,
+        root: str,
+        max_bytes: int,
+        crop_size: int = 112,
+        image_format: str = "webp",
+        quality: int = 80,
+        queue_size: int = 256
+    ):
+        """
+        Args:
+            root: 存储目录
+            max_bytes: 总大小上限
+            crop_size: 截图最长边（像素）
+            image_format: "webp" 或 "jpeg"
+            quality: 压缩质量
+            queue_size: 待写入队列长度，满时丢弃新的截图
+        """
+        if image_format not in ("webp", "jpeg"):
+            raise ValueError(f"不支持的截图格式: {image_format}")
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.crop_size = crop_size
+        self.image_format = image_format
+        self.quality = quality
+        self.dropped = 0
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+        # 上次扫描得到的总大小加上之后写入的大小（超过上限时重新扫描并淘汰）
+        self._total = self._scan_total()
+
+    @staticmethod
+    def valid_id(crop_id: str) -> bool:
+        return bool(_SAFE_ID.match(crop_id or ""))
+
+    def submit(self, image: np.ndarray, face_locations: Sequence, names: Sequence[str]) -> Optional[str]:
+        """
+        提交一张图片的人脸截图（异步写入）
+
+        Args:
+            image: RGB 图片
+            face_locations: 人脸位置 [(top, right, bottom, left), ...]
+            names: 识别出的人名
+
+        Returns:
+            新生成的截图 ID，没有人脸或写入队列已满时返回 None
+        """
+        if not face_locations:
+            return None
+        height, width = image.shape[:2]
+        crops = []
+        for top, right, bottom, left in face_locations:
+            # 四周多留 20% 便于人工辨认；复制出来，不让队列持有整张图片
+            pad_y, pad_x = (bottom - top) // 5, (right - left) // 5
+            crops.append(image[max(0, top - pad_y):min(height, bottom + pad_y),
+                               max(0, left - pad_x):min(width, right + pad_x)].copy())
+        crop_id = uuid.uuid4().hex
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait((crop_id, crops, list(names)))
+            return crop_id
+        except queue.Full:
+            self.dropped += 1
+            return None
+
+    def crops(self, crop_id: str) -> Optional[List[Dict]]:
+        """截图列表，不存在时返回 None（同时更新访问时间）"""
+        directory = self._directory(crop_id)
+        if directory is None or not (directory / META_FILE).exists():
+            return None
+        os.utime(directory)
+        return json.loads((directory / META_FILE).read_text(encoding="utf-8"))
+
+    def path(self, crop_id: str, index: int) -> Optional[Path]:
+        """单张截图的文件路径"""
+        directory = self._directory(crop_id)
+        if directory is None:
+            return None
+        path = directory / f"{index}.{self.image_format}"
+        if not path.exists():
+            return None
+        os.utime(directory)
+        return path
+
+    def close(self, timeout: float = 5.0):
+        """写完队列中的截图后停止后台线程"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    # ------------------------------------------------------------------
+    # 后台写入
+    # ------------------------------------------------------------------
+
+    def _directory(self, crop_id: str) -> Optional[Path]:
+        return self.root / crop_id if self.valid_id(crop_id) else None
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._thread_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._write_loop, name="crop-store", daemon=True)
+                    self._thread.start()
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            try:
+                self._write(*item)
+            except Exception as e:
+                logger.warning(f"保存人脸截图失败: {e}")
+
+    def _write(self, crop_id: str, crops: List[np.ndarray], names: List[str]):
+        directory = self.root / crop_id
+        # 截图 ID 每次新生成，目录已存在时不覆盖（FileExistsError）
+        directory.mkdir()
+        meta, written = [], 0
+        for index, (crop, name) in enumerate(zip(crops, names)):
+            image = Image.fromarray(crop)
+            image.thumbnail((self.crop_size, self.crop_size))
+            buffer = BytesIO()
+            image.save(buffer, format=self.image_format.upper(), quality=self.quality)
+            (directory / f"{index}.{self.image_format}").write_bytes(buffer.getvalue())
+            written += buffer.tell()
+            meta.append({"index": index, "name": name, "width": image.width, "height": image.height})
+        meta_bytes = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+        (directory / META_FILE).write_bytes(meta_bytes)
+        written += len(meta_bytes)
+
+        self._total += written
+        if self._total > self.max_bytes:
+            self._evict()
+
+    def _scan(self) -> List:
+        entries = []
+        for directory in os.scandir(self.root):
+            if not directory.is_dir():
+                continue
+            try:
+                size = sum(f.stat().st_size for f in os.scandir(directory.path) if f.is_file())
+                entries.append((directory.stat().st_mtime, size, directory.path))
+            except FileNotFoundError:
+                # 其他 worker 进程同时淘汰了该目录
+                continue
+        return entries
+
+    def _scan_total(self) -> int:
+        return sum(size for _, size, _ in self._scan())
+
+    def _evict(self):
+        """删除最久未访问的请求，直到总大小降到上限的 90%"""
+        entries = sorted(self._scan())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        removed = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            removed += 1
+        self._total = total
+        logger.info(f"人脸截图超过上限，已淘汰 {removed} 个请求的截图", extra={"crop_store_bytes": total})
@@ -81,23 +81,44 @@ else
     echo -e "\n${GREEN}✅ 步骤6: 日志目录已存在${NC}"
 fi
 
-# 7. 重启服务
-echo -e "\n${YELLOW}🔄 步骤7: 重启服务...${NC}"
-sudo systemctl restart face-recognition-worker@1
-sudo systemctl restart face-recognition-worker@2
+# 7. 滚动重启服务（逐个重启，等待预热完成、/ready 返回 200 后再重启下一个，始终有 worker 在服务）
+echo -e "\n${YELLOW}🔄 步骤7: 滚动重启服务...${NC}"
 sudo systemctl reload nginx
 
-# 等待服务启动
-echo "  等待服务启动..."
-sleep 3
+# 等待 worker 就绪（模型加载 + 预热），最长 READY_TIMEOUT 秒
+READY_TIMEOUT=${READY_TIMEOUT:-180}
+wait_ready() {
+    local port=$1
+    for _ in $(seq 1 $READY_TIMEOUT); do
+        if curl -sf http://localhost:$port/ready >/dev/null 2>&1; then
+            return 0
+        fi
+        sleep 1
+    done
+    return 1
+}
+
+for port in 8001 8002; do
+    worker=$(($port - 8000))
+    sudo systemctl restart face-recognition-worker@$worker
+    echo "  等待 Worker $port 预热完成..."
+    if wait_ready $port; then
+        warmup_ms=$(curl -s http://localhost:$port/metrics | python3 -c "import json,sys; print(json.load(sys.stdin)['warmup']['stages_ms'].get('total', '?'))" 2>/dev/null || echo "?")
+        echo -e "${GREEN}  ✅ Worker $port: 已就绪（预热 ${warmup_ms} ms）${NC}"
+    else
+        echo -e "${RED}  ❌ Worker $port: ${READY_TIMEOUT} 秒内未就绪，停止部署（其余 worker 保持旧版本运行）${NC}"
+        sudo systemctl status face-recognition-worker@$worker --no-pager
+        exit 1
+    fi
+done
 
 # 8. 健康检查
 echo -e "\n${YELLOW}🏥 步骤8: 健康检查...${NC}"
 for port in 8001 8002; do
-    if curl -f http://localhost:$port/health >/dev/null 2>&1; then
+    if curl -f http://localhost:$port/ready >/dev/null 2>&1; then
         echo -e "${GREEN}  ✅ Worker $port: 运行正常${NC}"
     else
-        echo -e "${RED}  ❌ Worker $port: 启动失败${NC}"
+        echo -e "${RED}  ❌ Worker $port: 未就绪${NC}"
         sudo systemctl status face-recognition-worker@$(($port - 8000))
         exit 1
     fi
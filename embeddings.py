@@ -0,0 +1,59 @@
+"""
+人脸特征向量编解码模块
+将 128 维特征向量压缩为 base64 字符串传输（float16 约 344 字节，float32 约 684 字节）
+"""
+import base64
+from typing import List, Sequence, Union
+
+import numpy as np
+
+
+EMBEDDING_DIM = 128
+SUPPORTED_DTYPES = ("float16", "float32")
+
+
+def encode_embedding(encoding: np.ndarray, dtype: str = "float32") -> str:
+    """
+    将特征向量编码为 base64 字符串（小端字节序）
+
+    Args:
+        encoding: 128 维特征向量
+        dtype: 传输精度，"float16" 或 "float32"
+
+    Returns:
+        base64 字符串
+    """
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"不支持的精度: {dtype}")
+    data = np.asarray(encoding, dtype=np.dtype(dtype).newbyteorder("<")).tobytes()
+    return base64.b64encode(data).decode("ascii")
+
+
+def decode_embedding(data: Union[str, Sequence[float]], dtype: str = "float32") -> np.ndarray:
+    """
+    解码特征向量，支持 base64 字符串或浮点数列表
+
+    Args:
+        data: base64 字符串或长度为 128 的浮点数列表
+        dtype: base64 数据的精度，"float16" 或 "float32"
+
+    Returns:
+        float64 特征向量
+    """
+    if isinstance(data, str):
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"不支持的精度: {dtype}")
+        vector = np.frombuffer(base64.b64decode(data), dtype=np.dtype(dtype).newbyteorder("<"))
+    else:
+        vector = np.asarray(data, dtype=np.float64)
+
+    if vector.shape != (EMBEDDING_DIM,):
+        raise ValueError(f"特征向量维度错误: 需要 {EMBEDDING_DIM} 维，实际 {vector.size} 维")
+    return vector.astype(np.float64)
+
+
+def decode_embeddings(items: List[Union[str, Sequence[float]]], dtype: str = "float32") -> np.ndarray:
+    """批量解码特征向量，返回 (N, 128) 矩阵"""
+    if not items:
+        return np.empty((0, EMBEDDING_DIM), dtype=np.float64)
+    return np.stack([decode_embedding(item, dtype) for item in items])
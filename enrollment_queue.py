@@ -0,0 +1,422 @@
+"""
+人脸注册任务队列模块
+注册请求先写入本地 SQLite 持久化队列并立即返回任务 ID，
+后台线程分批取出任务，用进程池并行提取特征，再统一写入人脸库和存储。
+
+- 进程重启后未完成的任务会继续处理
+- 多个 worker 共用同一个队列数据库时，只有持有队列锁（<数据库>.lock）的一个进程处理任务，
+  该进程退出后由其他 worker 接管，并把它未处理完的条目重新排队
+- 同一人名 + 同一图片（SHA-256）已注册成功时直接跳过，重复提交是幂等的
+- 临时性错误（如上传存储失败）自动重试，最多 max_attempts 次
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from face_quality import DuplicateFaceError, QualityError
+
+try:
+    import fcntl
+except ImportError:  # Windows：不支持多 worker 共用队列，当前进程直接处理
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# 任务条目状态
+PENDING = "pending"
+PROCESSING = "processing"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+def encode_image_file(image_path: str, model_type: str = "hog") -> np.ndarray:
+    """
+    在进程池中检查图片质量并提取人脸特征
+
+    Args:
+        image_path: 图片路径
+        model_type: 人脸检测模型
+
+    Returns:
+        128 维特征向量
+
+    Raises:
+        QualityError: 图片不满足注册要求
+    """
+    import face_recognition
+    from face_detector import extract_enrollment_encoding
+
+    image = face_recognition.load_image_file(image_path)
+    return extract_enrollment_encoding(image, model_type)
+
+
+class EnrollmentQueue:
+    """基于 SQLite 的人脸注册任务队列"""
+
+    def __init__(self, db_path: str, spool_dir: str, workers: int = 2, max_attempts: int = 3,
+                 sync_interval: float = 5.0):
+        """
+        Args:
+            db_path: 队列数据库路径
+            spool_dir: 待处理图片的暂存目录
+            workers: 并行提取特征的进程数
+            max_attempts: 每个条目的最大尝试次数
+            sync_interval: 空闲时调用 on_sync 的间隔（秒）
+        """
+        self.db_path = db_path
+        self.spool_dir = Path(spool_dir)
+        self.workers = max(1, workers)
+        self.max_attempts = max_attempts
+        self.sync_interval = sync_interval
+        self._owner_file = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._conn: Optional[sqlite3.Connection] = None
+
+    # ------------------------------------------------------------------
+    # 数据库
+    # ------------------------------------------------------------------
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+            self.spool_dir.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=5.0, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    idempotency_key TEXT UNIQUE,
+                    created REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS items (
+                    item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_id TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    image_path TEXT,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    updated REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_items_job ON items (job_id);
+                CREATE INDEX IF NOT EXISTS idx_items_status ON items (status);
+                CREATE TABLE IF NOT EXISTS enrolled (
+                    name TEXT NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    PRIMARY KEY (name, sha256)
+                );
+            """)
+            self._conn = conn
+        return self._conn
+
+    # ------------------------------------------------------------------
+    # 提交与查询
+    # ------------------------------------------------------------------
+
+    def submit(self, items: List[Tuple[str, bytes]], kind: str = "single",
+               idempotency_key: Optional[str] = None) -> str:
+        """
+        提交注册任务
+
+        Args:
+            items: [(人名, 图片数据), ...]
+            kind: 任务类型（"single" 或 "bulk"）
+            idempotency_key: 幂等键（可选），相同的键重复提交时返回已有任务
+
+        Returns:
+            任务 ID
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._db()
+            if idempotency_key:
+                row = conn.execute(
+                    "SELECT job_id FROM jobs WHERE idempotency_key = ?", (idempotency_key,)
+                ).fetchone()
+                if row:
+                    return row["job_id"]
+
+            job_id = uuid.uuid4().hex
+            seen = set()
+            rows = []
+            for name, data in items:
+                digest = hashlib.sha256(data).hexdigest()
+                if (name, digest) in seen:
+                    continue
+                seen.add((name, digest))
+
+                already = conn.execute(
+                    "SELECT 1 FROM enrolled WHERE name = ? AND sha256 = ?", (name, digest)
+                ).fetchone()
+                if already:
+                    rows.append((job_id, name, digest, None, SKIPPED, now))
+                    continue
+
+                image_path = self.spool_dir / f"{digest}.img"
+                if not image_path.exists():
+                    image_path.write_bytes(data)
+                rows.append((job_id, name, digest, str(image_path), PENDING, now))
+
+            with conn:
+                conn.execute(
+                    "INSERT INTO jobs (job_id, kind, idempotency_key, created) VALUES (?, ?, ?, ?)",
+                    (job_id, kind, idempotency_key, now)
+                )
+                conn.executemany(
+                    "INSERT INTO items (job_id, name, sha256, image_path, status, updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+
+        self._wakeup.set()
+        return job_id
+
+    def job_status(self, job_id: str) -> Optional[Dict]:
+        """
+        查询任务进度
+
+        Args:
+            job_id: 任务 ID
+
+        Returns:
+            任务状态字典，任务不存在时返回 None
+        """
+        with self._lock:
+            conn = self._db()
+            job = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            counts = dict(conn.execute(
+                "SELECT status, COUNT(*) FROM items WHERE job_id = ? GROUP BY status", (job_id,)
+            ).fetchall())
+            errors = conn.execute(
+                "SELECT name, error FROM items WHERE job_id = ? AND status = ? LIMIT 100",
+                (job_id, FAILED)
+            ).fetchall()
+            # 已注册但被标记（如与他人近似重复）或因重复而跳过的条目
+            warnings = conn.execute(
+                "SELECT name, status, error FROM items "
+                "WHERE job_id = ? AND status IN (?, ?) AND error IS NOT NULL LIMIT 100",
+                (job_id, DONE, SKIPPED)
+            ).fetchall()
+
+        total = sum(counts.values())
+        finished = counts.get(DONE, 0) + counts.get(FAILED, 0) + counts.get(SKIPPED, 0)
+        return {
+            "job_id": job_id,
+            "kind": job["kind"],
+            "status": "completed" if finished == total else "running",
+            "total": total,
+            "done": counts.get(DONE, 0),
+            "failed": counts.get(FAILED, 0),
+            "skipped": counts.get(SKIPPED, 0),
+            "pending": counts.get(PENDING, 0) + counts.get(PROCESSING, 0),
+            "progress": round(finished / total, 4) if total else 1.0,
+            "errors": [{"name": row["name"], "error": row["error"]} for row in errors],
+            "warnings": [
+                {"name": row["name"], "status": row["status"], "warning": row["error"]} for row in warnings
+            ],
+        }
+
+    # ------------------------------------------------------------------
+    # 后台处理
+    # ------------------------------------------------------------------
+
+    def start(self, get_detector: Callable, save_path_for: Callable[[str], Optional[str]],
+              on_sync: Optional[Callable] = None):
+        """
+        启动后台线程：成为处理进程前只定期调用 on_sync，取得队列锁后开始处理任务
+
+        Args:
+            get_detector: 返回 FaceDetector 的函数
+            save_path_for: 根据人名返回本地保存路径（或 None）
+            on_sync: 接管队列时、每批处理完成后以及空闲时定期调用（如与其他 worker 同步特征缓存）
+        """
+        if self._thread is not None:
+            return
+        self._db()
+        self._thread = threading.Thread(
+            target=self._run, args=(get_detector, save_path_for, on_sync),
+            name="enrollment", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """停止后台处理线程"""
+        self._stopped.set()
+        self._wakeup.set()
+
+    @property
+    def is_owner(self) -> bool:
+        """当前进程是否持有队列锁（负责处理任务）"""
+        return self._owner_file is not None
+
+    def _acquire_ownership(self) -> bool:
+        """尝试取得队列锁，持有锁的进程退出后锁自动释放"""
+        if self._owner_file is not None:
+            return True
+        lock_file = open(f"{self.db_path}.lock", "a+b")
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+        self._owner_file = lock_file
+        with self._lock:
+            # 上一个处理进程退出时正在处理的条目重新排队（持有锁时不会有其他进程在处理）
+            with self._db() as conn:
+                conn.execute("UPDATE items SET status = ? WHERE status = ?", (PENDING, PROCESSING))
+        return True
+
+    def _release_ownership(self):
+        if self._owner_file is not None:
+            self._owner_file.close()
+            self._owner_file = None
+
+    def _sync(self, on_sync: Optional[Callable]):
+        if on_sync is None:
+            return
+        try:
+            on_sync()
+        except Exception as e:
+            logger.warning(f"注册队列同步回调失败: {e}")
+
+    def _wait(self, timeout: float):
+        self._wakeup.wait(timeout=timeout)
+        self._wakeup.clear()
+
+    def _claim(self, limit: int) -> List[sqlite3.Row]:
+        """取出一批待处理条目并标记为处理中"""
+        with self._lock:
+            conn = self._db()
+            # 多个 worker 进程共用同一个队列数据库，用写锁保证同一条目只被领取一次
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    "SELECT * FROM items WHERE status = ? ORDER BY item_id LIMIT ?", (PENDING, limit)
+                ).fetchall()
+                conn.executemany(
+                    "UPDATE items SET status = ?, attempts = attempts + 1, updated = ? WHERE item_id = ?",
+                    [(PROCESSING, time.time(), row["item_id"]) for row in rows]
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return rows
+
+    def _finish(self, row: sqlite3.Row, status: str, error: Optional[str] = None):
+        """记录条目处理结果"""
+        now = time.time()
+        with self._lock:
+            conn = self._db()
+            with conn:
+                conn.execute(
+                    "UPDATE items SET status = ?, error = ?, updated = ? WHERE item_id = ?",
+                    (status, error, now, row["item_id"])
+                )
+                if status == DONE:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO enrolled (name, sha256, created) VALUES (?, ?, ?)",
+                        (row["name"], row["sha256"], now)
+                    )
+                remaining = conn.execute(
+                    "SELECT COUNT(*) FROM items WHERE sha256 = ? AND status IN (?, ?)",
+                    (row["sha256"], PENDING, PROCESSING)
+                ).fetchone()[0]
+
+        # 暂存图片不再被任何条目引用时删除
+        if status != PENDING and not remaining and row["image_path"]:
+            Path(row["image_path"]).unlink(missing_ok=True)
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # 使用 spawn 创建进程池，避免 fork 多线程的服务进程
+        return ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def _run(self, get_detector: Callable, save_path_for: Callable, on_sync: Optional[Callable]):
+        # 其他 worker 正在处理队列时，只定期同步它注册的人脸
+        while not self._stopped.is_set() and not self._acquire_ownership():
+            self._sync(on_sync)
+            self._wait(self.sync_interval)
+        if self._stopped.is_set():
+            return
+        logger.info(f"进程 {os.getpid()} 开始处理人脸注册队列")
+        # 接管前先合并已有的注册结果，查重时能看到其他 worker 注册的人脸
+        self._sync(on_sync)
+
+        pool = self._new_pool()
+        last_sync = time.monotonic()
+        try:
+            while not self._stopped.is_set():
+                rows = self._claim(self.workers * 4)
+                if not rows:
+                    if time.monotonic() - last_sync >= self.sync_interval:
+                        self._sync(on_sync)
+                        last_sync = time.monotonic()
+                    self._wait(1.0)
+                    continue
+
+                detector = get_detector()
+                try:
+                    futures = {
+                        pool.submit(encode_image_file, row["image_path"], detector.model_type): row
+                        for row in rows
+                    }
+                except RuntimeError:
+                    # 解释器退出时进程池已关闭，条目保持处理中，下次启动后重新排队
+                    break
+
+                for future in as_completed(futures):
+                    row = futures[future]
+                    try:
+                        encoding = future.result()
+                        # 在本线程中逐个查重并写入，同一批内的重复图片也能被发现
+                        warning = detector.check_duplicate(row["name"], encoding)
+                        image_bytes = Path(row["image_path"]).read_bytes()
+                        detector.enroll_encoding(
+                            row["name"], encoding, image_bytes, save_path_for(row["name"])
+                        )
+                        self._finish(row, DONE, warning)
+                    except DuplicateFaceError as e:
+                        self._finish(row, SKIPPED if e.same_name else FAILED, str(e))
+                    except QualityError as e:
+                        self._finish(row, FAILED, str(e))
+                    except Exception as e:
+                        # 临时性错误：未达到最大次数时重新排队
+                        retry = row["attempts"] + 1 < self.max_attempts
+                        logger.warning(f"注册 {row['name']} 失败（第 {row['attempts'] + 1} 次）: {e}")
+                        self._finish(row, PENDING if retry else FAILED, str(e))
+
+                if any(isinstance(f.exception(), BrokenProcessPool) for f in futures if not f.cancelled()):
+                    # 子进程异常退出（如内存不足）后进程池不可再用，重新创建
+                    pool.shutdown(wait=False)
+                    pool = self._new_pool()
+
+                self._sync(on_sync)
+                last_sync = time.monotonic()
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+            # 当前批次处理完后才释放队列锁，接管的进程不会重复处理这些条目
+            self._release_ownership()
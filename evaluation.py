@@ -0,0 +1,242 @@
+"""
+识别准确性评估模块
+- 测试图片的特征向量只提取一次（进程池并行），按文件修改时间和大小缓存，重复评估时直接读取
+- 每张测试图片与人脸库的最近距离、最近人名、同名最近距离一次算出，
+  所有容差值在一次向量化计算中评估（不重新检测和编码）
+- 输出每个容差值的误识率 FAR、拒识率 FRR、识别率，ROC / DET 曲线和推荐容差值
+
+开集识别的定义：
+- 已知人脸（人脸库中有同名人脸）：最近距离 <= 容差值且最近人名正确为识别正确；
+  最近距离 > 容差值为拒识（FRR）；最近距离 <= 容差值但人名错误为误识别
+- 陌生人脸：最近距离 <= 容差值即为误识（FAR）
+- 未检测到人脸的图片单独统计，不计入各比率
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from gallery import atomic_write
+
+# 每次计算距离矩阵的测试图片数量（限制 (块大小, 人脸库大小) 矩阵的内存）
+DISTANCE_BLOCK = 64
+# 每提取多少张测试图片的特征写一次缓存，中断后重新运行时从已保存的部分继续
+CHECKPOINT_EVERY = 50
+DEFAULT_THRESHOLDS = np.round(np.arange(0.30, 0.8001, 0.01), 2)
+
+
+def encode_probe(path: str, model_type: str = "hog") -> Optional[np.ndarray]:
+    """
+    提取测试图片中最大人脸的特征向量
+
+    Args:
+        path: 图片路径
+        model_type: 人脸检测模型
+
+    Returns:
+        128 维特征向量，未检测到人脸时返回 None
+    """
+    import face_recognition
+
+    image = face_recognition.load_image_file(path)
+    locations = face_recognition.face_locations(image, model=model_type)
+    if not locations:
+        return None
+    box = max(locations, key=lambda b: (b[2] - b[0]) * (b[1] - b[3]))
+    return face_recognition.face_encodings(image, [box])[0]
+
+
+def _file_key(path: str) -> str:
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}|{stat.st_mtime_ns}|{stat.st_size}"
+
+
+def _save_probe_cache(cache_file: str, keys: Sequence[str], cached: Dict[str, np.ndarray]):
+    """原子写入特征缓存（先写临时文件再替换），只保存本次用到且已提取的条目"""
+    done = [key for key in keys if key in cached]
+    encodings = np.vstack([cached[key] for key in done]) if done else np.empty((0, 128))
+    path = Path(cache_file)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    atomic_write(path, lambda f: np.savez(f, keys=np.array(done), encodings=encodings))
+
+
+def compute_probe_encodings(
+    paths: Sequence[str],
+    cache_file: Optional[str] = None,
+    model_type: str = "hog",
+    workers: int = 4
+) -> np.ndarray:
+    """
+    提取测试图片的特征向量（带缓存，并行）
+
+    Args:
+        paths: 测试图片路径
+        cache_file: 特征缓存文件（.npz，可选），图片修改后自动重新提取；
+            提取过程中每 CHECKPOINT_EVERY 张写一次，中断后重新运行只提取剩余的图片
+        model_type: 人脸检测模型
+        workers: 进程数
+
+    Returns:
+        特征矩阵 (N, 128)，未检测到人脸的行为 NaN
+    """
+    keys = [f"{_file_key(path)}|{model_type}" for path in paths]
+    cached: Dict[str, np.ndarray] = {}
+    if cache_file and Path(cache_file).exists():
+        with np.load(cache_file, allow_pickle=False) as data:
+            cached = dict(zip(data["keys"].tolist(), data["encodings"]))
+
+    missing = [i for i, key in enumerate(keys) if key not in cached]
+    if missing:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max(1, workers), mp_context=context) as pool:
+            results = pool.map(encode_probe, [paths[i] for i in missing], [model_type] * len(missing),
+                               chunksize=max(1, len(missing) // (workers * 4)))
+            for done, (i, encoding) in enumerate(zip(missing, results), 1):
+                cached[keys[i]] = encoding if encoding is not None else np.full(128, np.nan)
+                if cache_file and done % CHECKPOINT_EVERY == 0 and done < len(missing):
+                    _save_probe_cache(cache_file, keys, cached)
+
+    if missing and cache_file:
+        # 只保存本次用到的条目，删除的测试图片不会一直留在缓存中
+        _save_probe_cache(cache_file, keys, cached)
+    return np.vstack([cached[key] for key in keys]) if keys else np.empty((0, 128))
+
+
+def nearest_distances(
+    probes: np.ndarray,
+    gallery_encodings: np.ndarray,
+    gallery_names: Sequence[str],
+    expected: Sequence[Optional[str]]
+) -> Dict[str, np.ndarray]:
+    """
+    计算每张测试图片与人脸库的最近距离
+
+    Args:
+        probes: 测试特征 (N, 128)，NaN 行表示未检测到人脸
+        gallery_encodings: 人脸库特征 (G, 128)
+        gallery_names: 人脸库人名
+        expected: 每张测试图片的真实人名（陌生人脸为 None）
+
+    Returns:
+        best_distance: 最近距离
+        best_index: 最近人脸在人脸库中的下标
+        genuine_distance: 与同名人脸的最近距离（陌生人脸或人脸库中没有同名人脸时为 inf）
+    """
+    gallery = np.asarray(gallery_encodings, dtype=np.float64)
+    names = np.asarray(gallery_names, dtype=object)
+    gallery_sq = np.einsum("ij,ij->i", gallery, gallery)
+
+    n = len(probes)
+    best_distance = np.full(n, np.inf)
+    best_index = np.full(n, -1)
+    genuine_distance = np.full(n, np.inf)
+    detected = ~np.isnan(probes).any(axis=1)
+    for start in range(0, n, DISTANCE_BLOCK):
+        rows = np.arange(start, min(start + DISTANCE_BLOCK, n))
+        rows = rows[detected[rows]]
+        if len(rows) == 0 or len(gallery) == 0:
+            continue
+        block = probes[rows]
+        sq = np.einsum("ij,ij->i", block, block)[:, None] + gallery_sq[None, :] - 2.0 * block @ gallery.T
+        distances = np.sqrt(np.maximum(sq, 0.0))
+        best_index[rows] = distances.argmin(axis=1)
+        best_distance[rows] = distances[np.arange(len(rows)), best_index[rows]]
+        same = names[None, :] == np.asarray([expected[i] for i in rows], dtype=object)[:, None]
+        genuine_distance[rows] = np.where(same, distances, np.inf).min(axis=1)
+    return {"best_distance": best_distance, "best_index": best_index, "genuine_distance": genuine_distance}
+
+
+def sweep_thresholds(
+    best_distance: np.ndarray,
+    name_correct: np.ndarray,
+    is_known: np.ndarray,
+    detected: np.ndarray,
+    thresholds: np.ndarray
+) -> Dict[str, np.ndarray]:
+    """
+    向量化计算每个容差值下的各项比率
+
+    Args:
+        best_distance: 最近距离 (N,)
+        name_correct: 最近人名是否正确 (N,)（陌生人脸为 False）
+        is_known: 是否为已知人脸 (N,)
+        detected: 是否检测到人脸 (N,)
+        thresholds: 容差值 (T,)
+
+    Returns:
+        各项比率，每项为 (T,) 数组：
+        far（陌生人脸误识率）、frr（已知人脸拒识率）、misid（已知人脸误识别率）、
+        dir（已知人脸正确识别率）、fnir（1 - dir）、accuracy（总体准确率）
+    """
+    accept = best_distance[:, None] <= thresholds[None, :]
+    known = is_known & detected
+    unknown = ~is_known & detected
+    n_known = max(int(known.sum()), 1)
+    n_unknown = max(int(unknown.sum()), 1)
+
+    correct = (accept & name_correct[:, None])[known].sum(axis=0)
+    rejected = (~accept)[known].sum(axis=0)
+    misidentified = (accept & ~name_correct[:, None])[known].sum(axis=0)
+    false_accept = accept[unknown].sum(axis=0)
+    correct_reject = unknown.sum() - false_accept
+
+    dir_rate = correct / n_known
+    return {
+        "thresholds": thresholds,
+        "far": false_accept / n_unknown,
+        "frr": rejected / n_known,
+        "misid": misidentified / n_known,
+        "dir": dir_rate,
+        "fnir": 1.0 - dir_rate,
+        "accuracy": (correct + correct_reject) / max(int(detected.sum()), 1)
+    }
+
+
+def recommend_threshold(sweep: Dict[str, np.ndarray], target_far: float = 0.01) -> Dict[str, float]:
+    """
+    推荐容差值：误识率不超过 target_far 时识别率最高的容差值（识别率相同的区间取中点，两侧都留有余量）；
+    没有满足条件的容差值时取等错误率（FAR ≈ FNIR）对应的容差值
+
+    Returns:
+        {"threshold", "far", "frr", "dir", "rule"}
+    """
+    thresholds = sweep["thresholds"]
+    eligible = np.flatnonzero(sweep["far"] <= target_far)
+    if len(eligible):
+        plateau = eligible[sweep["dir"][eligible] == sweep["dir"][eligible].max()]
+        best = int(plateau[len(plateau) // 2])
+        rule = f"FAR <= {target_far:g} 时识别率最高"
+    else:
+        best = int(np.abs(sweep["far"] - sweep["fnir"]).argmin())
+        rule = "等错误率"
+    return {
+        "threshold": float(thresholds[best]),
+        "far": float(sweep["far"][best]),
+        "frr": float(sweep["frr"][best]),
+        "dir": float(sweep["dir"][best]),
+        "rule": rule
+    }
+
+
+def curves(
+    best_distance: np.ndarray,
+    name_correct: np.ndarray,
+    is_known: np.ndarray,
+    detected: np.ndarray
+) -> Dict[str, List[List[float]]]:
+    """
+    ROC（FAR → 识别率）和 DET（FAR → 漏识率）曲线，在所有出现过的距离处取点
+
+    Returns:
+        {"roc": [[far, dir, threshold], ...], "det": [[far, fnir, threshold], ...]}
+    """
+    points = np.unique(best_distance[detected & np.isfinite(best_distance)])
+    if len(points) == 0:
+        return {"roc": [], "det": []}
+    sweep = sweep_thresholds(best_distance, name_correct, is_known, detected, points)
+    roc = np.column_stack([sweep["far"], sweep["dir"], points])
+    det = np.column_stack([sweep["far"], sweep["fnir"], points])
+    return {"roc": np.round(roc, 6).tolist(), "det": np.round(det, 6).tolist()}
@@ -0,0 +1,241 @@
+"""
+识别事件记录模块
+视频流（签到终端）识别出的已知人员按时间、摄像头、距离写入 SQLite（WAL 模式，只追加），
+按人名 / 时间范围查询，用于考勤统计
+
+- 请求线程只把识别结果放入内存队列（满时丢弃并计数），去重和写入在后台线程完成
+- 同一摄像头同一人在 debounce_seconds 内的重复识别只记录一次（签到终端每秒多帧，
+  连续出现的同一个人不会产生大量重复记录）
+- 后台线程每 flush_interval 秒或攒满 batch_size 条时一次事务批量写入
+- 多个 worker 进程可以共用同一个数据库（WAL 下读写互不阻塞）；去重状态在各进程内，
+  同一摄像头的帧分到不同 worker 时每个窗口最多各记录一次
+"""
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 每次查询最多返回的事件数
+MAX_QUERY_LIMIT = 10000
+
+# 清理过期事件的间隔（秒）
+PRUNE_INTERVAL = 3600
+
+
+class EventLog:
+    """识别事件记录（后台批量写入 SQLite）"""
+
+    def __init__(
+        self,
+        db_path: str,
+        debounce_seconds: float = 60.0,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        retention_days: int = 90,
+        queue_size: int = 10000
+    ):
+        """
+        Args:
+            db_path: 数据库路径
+            debounce_seconds: 同一摄像头同一人重复识别的去重时间窗口
+            batch_size: 每批最多写入的事件数
+            flush_interval: 最长写入间隔（秒）
+            retention_days: 事件保留天数，0 表示永久保留
+            queue_size: 待写入队列长度，满时丢弃新的事件
+        """
+        self.db_path = db_path
+        self.debounce_seconds = debounce_seconds
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.dropped = 0
+        self.written = 0
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        # (摄像头, 人名) -> 上次记录的时间，只在后台线程中访问
+        self._last_seen: Dict[Tuple[str, str], float] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=5.0, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self):
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS events (
+                event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ts REAL NOT NULL,
+                name TEXT NOT NULL,
+                camera TEXT NOT NULL,
+                distance REAL,
+                request_id TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_events_name_ts ON events (name, ts);
+            CREATE INDEX IF NOT EXISTS idx_events_ts ON events (ts);
+            CREATE INDEX IF NOT EXISTS idx_events_camera_ts ON events (camera, ts);
+        """)
+        conn.close()
+
+    # ------------------------------------------------------------------
+    # 记录与查询
+    # ------------------------------------------------------------------
+
+    def record(self, camera: str, sightings: Sequence[Tuple[str, float]], request_id: Optional[str] = None):
+        """
+        记录一帧中识别出的已知人员（只入队，不阻塞请求）
+
+        Args:
+            camera: 摄像头 ID
+            sightings: [(人名, 距离), ...]，不包含 Unknown
+            request_id: 请求 ID（可选，便于与日志对应）
+        """
+        if not sightings:
+            return
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait((time.time(), camera, list(sightings), request_id))
+        except queue.Full:
+            self.dropped += 1
+
+    def query(
+        self,
+        name: Optional[str] = None,
+        camera: Optional[str] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        limit: int = 1000
+    ) -> List[Dict]:
+        """
+        按人名、摄像头、时间范围查询事件（按时间升序）
+
+        Args:
+            name: 人名（可选）
+            camera: 摄像头 ID（可选）
+            start: 起始时间戳（含）
+            end: 结束时间戳（不含）
+            limit: 最多返回的事件数
+
+        Returns:
+            事件列表
+        """
+        where, params = self._filters(name, camera, start, end)
+        sql = f"SELECT event_id, ts, name, camera, distance, request_id FROM events{where} ORDER BY ts LIMIT ?"
+        conn = self._connect()
+        try:
+            rows = conn.execute(sql, params + [min(max(limit, 1), MAX_QUERY_LIMIT)]).fetchall()
+        finally:
+            conn.close()
+        return [dict(row) for row in rows]
+
+    def summary(
+        self,
+        camera: Optional[str] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None
+    ) -> List[Dict]:
+        """
+        时间范围内每个人的首次、末次出现时间和记录次数（考勤汇总）
+
+        Returns:
+            按首次出现时间排序的列表
+        """
+        where, params = self._filters(None, camera, start, end)
+        sql = (
+            "SELECT name, MIN(ts) AS first_seen, MAX(ts) AS last_seen, COUNT(*) AS sightings, "
+            f"json_group_array(DISTINCT camera) AS cameras FROM events{where} GROUP BY name ORDER BY first_seen"
+        )
+        conn = self._connect()
+        try:
+            rows = conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+        return [dict(row) | {"cameras": json.loads(row["cameras"])} for row in rows]
+
+    @staticmethod
+    def _filters(name, camera, start, end) -> Tuple[str, list]:
+        clauses, params = [], []
+        for column, op, value in (("name", "=", name), ("camera", "=", camera), ("ts", ">=", start), ("ts", "<", end)):
+            if value is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(value)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def close(self, timeout: float = 5.0):
+        """写完队列中的事件后停止后台线程"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    # ------------------------------------------------------------------
+    # 后台写入
+    # ------------------------------------------------------------------
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._thread_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._write_loop, name="event-log", daemon=True)
+                    self._thread.start()
+
+    def _debounce(self, ts: float, camera: str, sightings: List[Tuple[str, float]], request_id) -> List[tuple]:
+        rows = []
+        for name, distance in sightings:
+            key = (camera, name)
+            last = self._last_seen.get(key)
+            if last is not None and ts - last < self.debounce_seconds:
+                continue
+            self._last_seen[key] = ts
+            rows.append((ts, name, camera, distance, request_id))
+        return rows
+
+    def _write_loop(self):
+        conn = self._connect()
+        last_prune = 0.0
+        stopping = False
+        while not stopping:
+            rows = []
+            deadline = time.time() + self.flush_interval
+            while len(rows) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.time(), 0.001))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                rows.extend(self._debounce(*item))
+            try:
+                if rows:
+                    with conn:
+                        conn.executemany(
+                            "INSERT INTO events (ts, name, camera, distance, request_id) VALUES (?, ?, ?, ?, ?)", rows
+                        )
+                    self.written += len(rows)
+                if self.retention_days > 0 and time.time() - last_prune > PRUNE_INTERVAL:
+                    last_prune = time.time()
+                    self._prune(conn)
+            except Exception as e:
+                logger.warning(f"写入识别事件失败: {e}", extra={"events": len(rows)})
+        conn.close()
+
+    def _prune(self, conn: sqlite3.Connection):
+        """删除过期事件，同时清理不再需要的去重状态"""
+        cutoff = time.time() - self.retention_days * 86400
+        with conn:
+            removed = conn.execute("DELETE FROM events WHERE ts < ?", (cutoff,)).rowcount
+        if removed:
+            logger.info(f"已清理 {removed} 条过期识别事件")
+        stale = time.time() - self.debounce_seconds
+        self._last_seen = {key: ts for key, ts in self._last_seen.items() if ts >= stale}
@@ -0,0 +1,565 @@
+"""
+人脸识别服务 Python 客户端
+内部服务和测试脚本统一使用的 API 客户端，替代每次新建连接的 requests.post：
+
+- 连接池保持长连接（keep-alive），连续请求不再重复建立 TCP/TLS 连接
+- 同步（FaceClient）和 asyncio（AsyncFaceClient）两种接口
+- 503 / 429 和连接错误自动重试，指数退避并遵循 Retry-After
+- detect_many: 并发提交多张图片，限制同时进行的请求数，按完成顺序返回结果
+- detect_batch: 一次上传多张图片，逐行读取服务端流式返回的 NDJSON 结果
+- stream: 通过 WebSocket 连续识别视频帧（流水线发送，最多 window 帧在途）
+- binary=True 时请求 msgpack 二进制响应（需要 msgpack 包），layout="compact" 时人脸列表为平行数组，
+  两者结合时响应最小、解析最快（适合人脸多或帧率高的视频流）
+
+进程内测试时可以传入 http_client，例如 FaceClient(http_client=TestClient(app))，
+或 AsyncFaceClient(http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app), base_url="http://test"))
+
+使用方法：
+    with FaceClient("http://localhost:8000") as client:
+        result = client.detect("photo.jpg", top_k=3)
+        for index, result in client.detect_many(paths, concurrency=8):
+            ...
+        for result in client.stream(camera_frames(), stream_id="kiosk-1"):
+            ...
+"""
+import asyncio
+import base64
+import io
+import json
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from urllib.parse import urlencode
+
+import httpx
+
+# 自动重试的状态码（服务繁忙 / 限流）
+RETRY_STATUS = {429, 503}
+
+MSGPACK_MEDIA_TYPE = "application/x-msgpack"
+
+ImageInput = Union[bytes, str, Path, Any]
+
+
+class FaceAPIError(Exception):
+    """API 请求失败（重试后仍失败，或不可重试的错误）"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(f"HTTP {status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+
+def image_bytes(image: ImageInput) -> bytes:
+    """
+    将图片转换为上传用的字节
+
+    Args:
+        image: 图片数据（bytes）、文件路径、文件对象、PIL Image 或 RGB numpy 数组（后两者编码为 JPEG）
+    """
+    if isinstance(image, (bytes, bytearray)):
+        return bytes(image)
+    if isinstance(image, (str, Path)):
+        return Path(image).read_bytes()
+    if hasattr(image, "read"):
+        return image.read()
+    from PIL import Image
+
+    if not isinstance(image, Image.Image):
+        image = Image.fromarray(image)
+    buffer = io.BytesIO()
+    image.convert("RGB").save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def _error(response: httpx.Response) -> FaceAPIError:
+    try:
+        detail = response.json().get("detail", response.text)
+    except ValueError:
+        detail = response.text
+    return FaceAPIError(response.status_code, str(detail))
+
+
+def _headers(binary: bool, request_id: Optional[str] = None) -> Dict[str, str]:
+    headers = {"Accept": MSGPACK_MEDIA_TYPE} if binary else {}
+    if request_id:
+        headers["X-Request-ID"] = request_id
+    return headers
+
+
+def _unpackb(data: bytes) -> Dict:
+    import msgpack
+
+    return msgpack.unpackb(data, raw=False)
+
+
+def _decode(response: httpx.Response) -> Dict:
+    """按 Content-Type 解码响应（服务端未安装 msgpack 时仍返回 JSON）"""
+    if response.headers.get("content-type", "").startswith(MSGPACK_MEDIA_TYPE):
+        return _unpackb(response.content)
+    return response.json()
+
+
+def _decode_message(data: Union[str, bytes]) -> Dict:
+    """WebSocket 消息：二进制为 msgpack，文本为 JSON"""
+    return _unpackb(data) if isinstance(data, bytes) else json.loads(data)
+
+
+def _stream_path(stream_id: Optional[str], camera_id: Optional[str], top_k: int, layout: str, binary: bool) -> str:
+    query = {"stream_id": stream_id, "camera_id": camera_id, "top_k": str(top_k),
+             "layout": layout if layout != "objects" else None, "format": "msgpack" if binary else None}
+    query = urlencode({key: value for key, value in query.items() if value})
+    return "/ws/detect_stream" + (f"?{query}" if query else "")
+
+
+def _ws_url(base_url: str, path: str) -> str:
+    return base_url.rstrip("/").replace("https://", "wss://", 1).replace("http://", "ws://", 1) + path
+
+
+class _RetryPolicy:
+    """重试间隔：优先使用 Retry-After，否则指数退避（带随机抖动）"""
+
+    def __init__(self, max_retries: int, backoff: float, max_backoff: float):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def should_retry(self, attempt: int, response: Optional[httpx.Response]) -> bool:
+        if attempt >= self.max_retries:
+            return False
+        return response is None or response.status_code in RETRY_STATUS
+
+    def delay(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        if response is not None:
+            try:
+                return min(float(response.headers["retry-after"]), self.max_backoff)
+            except (KeyError, ValueError):
+                pass
+        return min(self.backoff * (2 ** attempt), self.max_backoff) * random.uniform(0.5, 1.0)
+
+
+class FaceClient:
+    """同步客户端（线程安全，多个线程可共用同一个实例和连接池）"""
+
+    def __init__(
+        self,
+        base_url: str = "http://localhost:8000",
+        timeout: float = 30.0,
+        max_retries: int = 3,
+        backoff: float = 0.2,
+        max_backoff: float = 5.0,
+        max_connections: int = 16,
+        admin_token: Optional[str] = None,
+        binary: bool = False,
+        http_client: Optional[httpx.Client] = None
+    ):
+        """
+        Args:
+            base_url: 服务地址
+            timeout: 单次请求超时（秒）
+            max_retries: 503 / 429 / 连接错误的最大重试次数
+            backoff: 首次重试的退避时间（秒），之后每次翻倍
+            max_backoff: 最长退避时间（秒）
+            max_connections: 连接池大小（也是 detect_many 的有效并发上限）
+            admin_token: 管理员令牌（管理接口使用）
+            binary: 识别接口请求 msgpack 二进制响应（需要 msgpack 包；结果图片为 JPEG 字节而不是 data URL）
+            http_client: 已有的 httpx.Client（如 Starlette TestClient，用于进程内测试）
+        """
+        headers = {"X-Admin-Token": admin_token} if admin_token else {}
+        self.binary = binary
+        self.retry = _RetryPolicy(max_retries, backoff, max_backoff)
+        self._owns_client = http_client is None
+        if http_client is None:
+            http_client = httpx.Client(
+                base_url=base_url,
+                timeout=timeout,
+                headers=headers,
+                limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+            )
+        else:
+            http_client.headers.update(headers)
+        self._http = http_client
+        # WebSocket 地址与 HTTP 请求使用同一个服务地址（传入 http_client 时以它的 base_url 为准）
+        self.base_url = str(http_client.base_url).rstrip("/") or base_url
+
+    def __enter__(self) -> "FaceClient":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._owns_client:
+            self._http.close()
+
+    def request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """发送请求，503 / 429 和连接错误按退避策略重试；失败时抛出 FaceAPIError"""
+        attempt = 0
+        while True:
+            try:
+                response = self._http.request(method, path, **kwargs)
+            except httpx.TransportError as e:
+                if not self.retry.should_retry(attempt, None):
+                    raise FaceAPIError(0, f"连接失败: {e}") from e
+                response = None
+            else:
+                if response.status_code < 400:
+                    return response
+                if not self.retry.should_retry(attempt, response):
+                    raise _error(response)
+            time.sleep(self.retry.delay(attempt, response))
+            attempt += 1
+
+    # ------------------------------------------------------------------
+    # 识别
+    # ------------------------------------------------------------------
+
+    def detect(self, image: ImageInput, top_k: int = 0, return_encodings: bool = False,
+               request_id: Optional[str] = None, layout: str = "objects") -> Dict:
+        """识别一张图片（/api/detect，返回带标注的结果图片）"""
+        return _decode(self.request(
+            "POST", "/api/detect",
+            files={"file": ("image.jpg", image_bytes(image), "application/octet-stream")},
+            data={"top_k": str(top_k), "return_encodings": str(return_encodings).lower(), "layout": layout},
+            headers=_headers(self.binary, request_id)
+        ))
+
+    def detect_frame(self, image: ImageInput, stream_id: Optional[str] = None,
+                     camera_id: Optional[str] = None, top_k: int = 0, layout: str = "objects") -> Dict:
+        """识别视频流中的一帧（/api/detect_stream，不返回图片）"""
+        data = {"image_data": base64.b64encode(image_bytes(image)).decode("ascii"), "top_k": str(top_k),
+                "layout": layout}
+        if stream_id:
+            data["stream_id"] = stream_id
+        if camera_id:
+            data["camera_id"] = camera_id
+        return _decode(self.request("POST", "/api/detect_stream", data=data, headers=_headers(self.binary)))
+
+    def detect_many(self, images: Iterable[ImageInput], concurrency: int = 4,
+                    **kwargs) -> Iterator[Tuple[int, Union[Dict, FaceAPIError]]]:
+        """
+        并发识别多张图片（每张一个 /api/detect 请求，复用连接池）
+
+        最多 concurrency 个请求同时进行，图片按需读取（可以传入生成器）
+
+        Args:
+            images: 图片序列
+            concurrency: 同时进行的请求数
+            **kwargs: 传给 detect 的参数
+
+        Yields:
+            (图片序号, 识别结果或 FaceAPIError)，按完成顺序
+        """
+        images = iter(enumerate(images))
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            pending = {}
+
+            def submit_next() -> bool:
+                for index, image in images:
+                    pending[pool.submit(self.detect, image, **kwargs)] = index
+                    return True
+                return False
+
+            for _ in range(max(1, concurrency)):
+                if not submit_next():
+                    break
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    error = future.exception()
+                    if error is not None and not isinstance(error, FaceAPIError):
+                        raise error
+                    yield index, error if error is not None else future.result()
+                    submit_next()
+
+    def detect_batch(self, images: List[ImageInput], top_k: int = 0, layout: str = "objects") -> Iterator[Dict]:
+        """
+        一次上传多张图片（/api/detect_batch），逐行读取服务端完成的结果
+
+        Yields:
+            每张图片的结果（含 index），按服务端完成顺序
+        """
+        files = [("files", (f"{i}.jpg", image_bytes(image), "application/octet-stream"))
+                 for i, image in enumerate(images)]
+        attempt = 0
+        while True:
+            with self._http.stream("POST", "/api/detect_batch", files=files,
+                                   data={"top_k": str(top_k), "layout": layout}) as response:
+                if response.status_code < 400:
+                    for line in response.iter_lines():
+                        if line:
+                            yield json.loads(line)
+                    return
+                response.read()
+                if not self.retry.should_retry(attempt, response):
+                    raise _error(response)
+            time.sleep(self.retry.delay(attempt, response))
+            attempt += 1
+
+    def stream(self, frames: Iterable[ImageInput], stream_id: Optional[str] = None, camera_id: Optional[str] = None,
+               top_k: int = 0, window: int = 2, layout: str = "objects") -> Iterator[Dict]:
+        """
+        通过 WebSocket 连续识别视频帧（/ws/detect_stream）
+
+        流水线发送：最多 window 帧已发送但未收到结果，网络往返与服务端处理重叠。
+        需要 websockets 包（uvicorn[standard] 已包含）；使用 TestClient 时走进程内连接。
+        binary=True 时服务端每帧回复 msgpack 二进制消息
+
+        Yields:
+            每帧的结果（含 seq，与帧的顺序一致）
+        """
+        path = _stream_path(stream_id, camera_id, top_k, layout, self.binary)
+        with self._websocket(path) as (send, receive):
+            in_flight = 0
+            for frame in frames:
+                send(image_bytes(frame))
+                in_flight += 1
+                if in_flight >= max(1, window):
+                    yield receive()
+                    in_flight -= 1
+            for _ in range(in_flight):
+                yield receive()
+
+    def _websocket(self, path: str):
+        if hasattr(self._http, "websocket_connect"):
+            return _TestClientSocket(self._http.websocket_connect(path))
+        from websockets.sync.client import connect
+
+        return _SyncSocket(connect(_ws_url(self.base_url, path)))
+
+    # ------------------------------------------------------------------
+    # 其他接口
+    # ------------------------------------------------------------------
+
+    def add_face(self, name: str, image: ImageInput, idempotency_key: Optional[str] = None) -> Dict:
+        """提交人脸注册任务（返回任务 ID，用 job 查询进度）"""
+        headers = {"Idempotency-Key": idempotency_key} if idempotency_key else None
+        return self.request(
+            "POST", "/api/add_face",
+            files={"file": ("image.jpg", image_bytes(image), "application/octet-stream")},
+            data={"name": name}, headers=headers
+        ).json()
+
+    def job(self, job_id: str) -> Dict:
+        return self.request("GET", f"/api/jobs/{job_id}").json()
+
+    def capabilities(self) -> Dict:
+        """视频流采集参数（建议的采集宽度、编码格式和质量等，见 /api/stream/capabilities）"""
+        return self.request("GET", "/api/stream/capabilities").json()
+
+    def health(self) -> Dict:
+        return self.request("GET", "/health").json()
+
+    def ready(self) -> bool:
+        """服务是否已加载完成（/ready 返回 200）"""
+        return self._http.get("/ready").status_code == 200
+
+
+class AsyncFaceClient:
+    """asyncio 客户端（同一个事件循环内共用连接池）"""
+
+    def __init__(
+        self,
+        base_url: str = "http://localhost:8000",
+        timeout: float = 30.0,
+        max_retries: int = 3,
+        backoff: float = 0.2,
+        max_backoff: float = 5.0,
+        max_connections: int = 16,
+        admin_token: Optional[str] = None,
+        binary: bool = False,
+        http_client: Optional[httpx.AsyncClient] = None
+    ):
+        """参数与 FaceClient 相同；http_client 为 httpx.AsyncClient（进程内测试可使用 ASGITransport）"""
+        headers = {"X-Admin-Token": admin_token} if admin_token else {}
+        self.binary = binary
+        self.retry = _RetryPolicy(max_retries, backoff, max_backoff)
+        self._owns_client = http_client is None
+        if http_client is None:
+            http_client = httpx.AsyncClient(
+                base_url=base_url,
+                timeout=timeout,
+                headers=headers,
+                limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+            )
+        else:
+            http_client.headers.update(headers)
+        self._http = http_client
+        # WebSocket 地址与 HTTP 请求使用同一个服务地址（传入 http_client 时以它的 base_url 为准）
+        self.base_url = str(http_client.base_url).rstrip("/") or base_url
+
+    async def __aenter__(self) -> "AsyncFaceClient":
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        if self._owns_client:
+            await self._http.aclose()
+
+    async def request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """发送请求，503 / 429 和连接错误按退避策略重试；失败时抛出 FaceAPIError"""
+        attempt = 0
+        while True:
+            try:
+                response = await self._http.request(method, path, **kwargs)
+            except httpx.TransportError as e:
+                if not self.retry.should_retry(attempt, None):
+                    raise FaceAPIError(0, f"连接失败: {e}") from e
+                response = None
+            else:
+                if response.status_code < 400:
+                    return response
+                if not self.retry.should_retry(attempt, response):
+                    raise _error(response)
+            await asyncio.sleep(self.retry.delay(attempt, response))
+            attempt += 1
+
+    async def detect(self, image: ImageInput, top_k: int = 0, return_encodings: bool = False,
+                     request_id: Optional[str] = None, layout: str = "objects") -> Dict:
+        """识别一张图片（/api/detect）"""
+        response = await self.request(
+            "POST", "/api/detect",
+            files={"file": ("image.jpg", image_bytes(image), "application/octet-stream")},
+            data={"top_k": str(top_k), "return_encodings": str(return_encodings).lower(), "layout": layout},
+            headers=_headers(self.binary, request_id)
+        )
+        return _decode(response)
+
+    async def detect_frame(self, image: ImageInput, stream_id: Optional[str] = None,
+                           camera_id: Optional[str] = None, top_k: int = 0, layout: str = "objects") -> Dict:
+        """识别视频流中的一帧（/api/detect_stream）"""
+        data = {"image_data": base64.b64encode(image_bytes(image)).decode("ascii"), "top_k": str(top_k),
+                "layout": layout}
+        if stream_id:
+            data["stream_id"] = stream_id
+        if camera_id:
+            data["camera_id"] = camera_id
+        return _decode(await self.request("POST", "/api/detect_stream", data=data, headers=_headers(self.binary)))
+
+    async def detect_many(self, images: Iterable[ImageInput], concurrency: int = 4,
+                          **kwargs) -> AsyncIterator[Tuple[int, Union[Dict, FaceAPIError]]]:
+        """
+        并发识别多张图片，最多 concurrency 个请求同时进行
+
+        Yields:
+            (图片序号, 识别结果或 FaceAPIError)，按完成顺序
+        """
+        images = iter(enumerate(images))
+        pending = set()
+
+        async def run(index: int, image: ImageInput):
+            try:
+                return index, await self.detect(image, **kwargs)
+            except FaceAPIError as e:
+                return index, e
+
+        def submit_next() -> bool:
+            for index, image in images:
+                pending.add(asyncio.ensure_future(run(index, image)))
+                return True
+            return False
+
+        for _ in range(max(1, concurrency)):
+            if not submit_next():
+                break
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    pending.discard(task)
+                    yield task.result()
+                    submit_next()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def detect_batch(self, images: List[ImageInput], top_k: int = 0,
+                           layout: str = "objects") -> AsyncIterator[Dict]:
+        """一次上传多张图片（/api/detect_batch），逐行读取服务端完成的结果"""
+        files = [("files", (f"{i}.jpg", image_bytes(image), "application/octet-stream"))
+                 for i, image in enumerate(images)]
+        attempt = 0
+        while True:
+            async with self._http.stream("POST", "/api/detect_batch", files=files,
+                                         data={"top_k": str(top_k), "layout": layout}) as response:
+                if response.status_code < 400:
+                    async for line in response.aiter_lines():
+                        if line:
+                            yield json.loads(line)
+                    return
+                await response.aread()
+                if not self.retry.should_retry(attempt, response):
+                    raise _error(response)
+            await asyncio.sleep(self.retry.delay(attempt, response))
+            attempt += 1
+
+    async def stream(self, frames: Iterable[ImageInput], stream_id: Optional[str] = None,
+                     camera_id: Optional[str] = None, top_k: int = 0, window: int = 2,
+                     layout: str = "objects") -> AsyncIterator[Dict]:
+        """
+        通过 WebSocket 连续识别视频帧（需要 websockets 包），最多 window 帧在途
+
+        Yields:
+            每帧的结果（含 seq）
+        """
+        import websockets
+
+        url = _ws_url(self.base_url, _stream_path(stream_id, camera_id, top_k, layout, self.binary))
+        async with websockets.connect(url) as websocket:
+            in_flight = 0
+            for frame in frames:
+                await websocket.send(image_bytes(frame))
+                in_flight += 1
+                if in_flight >= max(1, window):
+                    yield _decode_message(await websocket.recv())
+                    in_flight -= 1
+            for _ in range(in_flight):
+                yield _decode_message(await websocket.recv())
+
+    async def capabilities(self) -> Dict:
+        return (await self.request("GET", "/api/stream/capabilities")).json()
+
+    async def health(self) -> Dict:
+        return (await self.request("GET", "/health")).json()
+
+    async def ready(self) -> bool:
+        return (await self._http.get("/ready")).status_code == 200
+
+
+class _SyncSocket:
+    """websockets 同步连接 → (send, receive)"""
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def __enter__(self):
+        return self._connection.send, lambda: _decode_message(self._connection.recv())
+
+    def __exit__(self, *exc):
+        self._connection.close()
+
+
+class _TestClientSocket:
+    """Starlette TestClient 的进程内 WebSocket → (send, receive)"""
+
+    def __init__(self, context):
+        self._context = context
+
+    def __enter__(self):
+        session = self._context.__enter__()
+
+        def receive() -> Dict:
+            message = session.receive()
+            if message["type"] == "websocket.close":
+                raise FaceAPIError(0, f"WebSocket 连接已关闭: {message.get('reason') or message.get('code')}")
+            return _decode_message(message["bytes"] if message.get("bytes") is not None else message["text"])
+
+        return session.send_bytes, receive
+
+    def __exit__(self, *exc):
+        return self._context.__exit__(*exc)
@@ -4,13 +4,131 @@
 """
 import numpy as np
 from typing import List, Tuple, Optional
-import face_recognition
 from pathlib import Path
 import io
-import os
-from PIL import Image, ImageDraw, ImageFont
-from supabase import create_client, Client
+import logging
+import threading
+from PIL import Image
 from config import settings
+from gallery import FaceGallery
+from pq_gallery import PQGallery
+from sharding import ShardCoordinator
+from snapshot import Snapshot, SnapshotError, verify_delta
+from face_quality import DuplicateFaceError, QualityError, select_enrollment_face
+from log_config import ProgressLogger
+from annotation import draw_annotations, load_font
+
+logger = logging.getLogger(__name__)
+
+# face_recognition（导入时加载 dlib 及全部模型文件）和 supabase 较重，
+# 在首次使用时才导入，保证 import main 足够快（Serverless 冷启动）
+
+
+def distance_to_confidence(distances: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    将人脸距离换算为 0~1 的置信度
+
+    以容差值为分界：距离等于容差值时置信度为 0.5，
+    距离小于容差值时按非线性曲线快速接近 1，大于容差值时线性下降
+
+    Args:
+        distances: 人脸距离数组
+        tolerance: 容差值
+
+    Returns:
+        置信度数组
+    """
+    distances = np.asarray(distances, dtype=np.float64)
+    below = 1.0 - distances / (tolerance * 2.0)
+    below = below + (1.0 - below) * np.power(np.clip((below - 0.5) * 2, 0.0, None), 0.2)
+    above = (1.0 - distances) / ((1.0 - tolerance) * 2.0)
+    return np.clip(np.where(distances <= tolerance, below, above), 0.0, 1.0)
+
+
+# 并行提取特征时，每块区域在人脸框外保留的边距（相对人脸大小），
+# 关键点定位和特征对齐用到的像素都在裁剪范围内，结果与整图计算一致
+CROP_MARGIN = 0.5
+
+
+def batch_face_encodings(image: np.ndarray, face_locations: List) -> np.ndarray:
+    """
+    批量提取一张图片中所有人脸的特征向量
+
+    先定位全部人脸的关键点，再调用一次 dlib 特征网络（网络内部按小批量前向计算），
+    而不是像 face_recognition.face_encodings 那样每张人脸单独调用一次网络
+
+    Args:
+        image: RGB 图片
+        face_locations: 人脸位置 [(top, right, bottom, left), ...]
+
+    Returns:
+        特征矩阵 (N, 128)
+    """
+    if len(face_locations) == 0:
+        return np.empty((0, 128))
+    import dlib
+    from face_recognition import api
+
+    shapes = dlib.full_object_detections()
+    for top, right, bottom, left in face_locations:
+        shapes.append(api.pose_predictor_5_point(image, dlib.rectangle(left, top, right, bottom)))
+    descriptors = api.face_encoder.compute_face_descriptor(image, shapes, 1)
+    return np.array([np.array(descriptor) for descriptor in descriptors])
+
+
+_encode_pool = None
+_encode_pool_lock = threading.Lock()
+
+
+def _get_encode_pool(workers: int):
+    global _encode_pool
+    if _encode_pool is None:
+        with _encode_pool_lock:
+            if _encode_pool is None:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+
+                # spawn：服务进程中有多个线程，fork 不安全
+                _encode_pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+    return _encode_pool
+
+
+def parallel_face_encodings(image: np.ndarray, face_locations: List, workers: int) -> np.ndarray:
+    """
+    多进程提取多人照片的特征向量
+
+    人脸按水平位置分成 workers 组，每组只把包含这些人脸的区域发给工作进程，
+    避免每个进程都复制整张图片
+
+    Args:
+        image: RGB 图片
+        face_locations: 人脸位置 [(top, right, bottom, left), ...]
+        workers: 进程数
+
+    Returns:
+        特征矩阵 (N, 128)，顺序与 face_locations 一致
+    """
+    boxes = np.asarray(face_locations, dtype=np.int64).reshape(-1, 4)
+    order = np.argsort((boxes[:, 1] + boxes[:, 3]) / 2, kind="stable")
+    height, width = image.shape[:2]
+    pool = _get_encode_pool(workers)
+
+    futures = []
+    for group in np.array_split(order, workers):
+        if len(group) == 0:
+            continue
+        top, right, bottom, left = boxes[group].T
+        margin = int(max((bottom - top).max(), (right - left).max()) * CROP_MARGIN)
+        y0, x0 = max(0, top.min() - margin), max(0, left.min() - margin)
+        y1, x1 = min(height, bottom.max() + margin), min(width, right.max() + margin)
+        crop = np.ascontiguousarray(image[y0:y1, x0:x1])
+        shifted = [(int(t - y0), int(r - x0), int(b - y0), int(l - x0)) for t, r, b, l in boxes[group]]
+        futures.append((group, pool.submit(batch_face_encodings, crop, shifted)))
+
+    encodings = np.empty((len(boxes), 128))
+    for group, future in futures:
+        encodings[group] = future.result()
+    return encodings
 
 
 class FaceDetector:
@@ -24,8 +142,38 @@ class FaceDetector:
             model_type: 检测模型类型，'hog' 速度快但精度略低，'cnn' 精度高但需要GPU
         """
         self.model_type = model_type
-        self.known_face_encodings = []
-        self.known_face_names = []
+        # 容差值，越小越严格（可用 test_accuracy.py 的阈值扫描结果调整 FACE_TOLERANCE）
+        self.tolerance = settings.FACE_TOLERANCE
+        # 已知人脸库（特征向量保存在一块连续缓冲区中，PQ 模式下为 PQGallery）
+        self.gallery = FaceGallery(dtype=self._gallery_dtype())
+        # 分片模式下由协调器在各分片中检索（SHARD_MANIFEST），本地人脸库为空
+        self.shards: Optional[ShardCoordinator] = None
+        # 写入人脸库（注册、导入快照）时加锁，检索不加锁
+        self._write_lock = threading.Lock()
+
+    @staticmethod
+    def _gallery_dtype() -> str:
+        """全精度人脸库的存储精度"""
+        return "float16" if settings.GALLERY_STORAGE == "float16" else "float64"
+
+    @property
+    def known_face_names(self) -> List[str]:
+        """已知人脸的人名列表（分片模式下需要从所有分片获取，只用于列表接口）"""
+        if self.shards is not None:
+            return self.shards.names()
+        return self.gallery.names
+
+    @property
+    def known_face_count(self) -> int:
+        """已知人脸数量（分片模式下为各分片人脸数之和，带缓存）"""
+        if self.shards is not None:
+            return self.shards.count()
+        return len(self.gallery)
+
+    @property
+    def known_face_encodings(self) -> np.ndarray:
+        """已知人脸的特征矩阵 (N, 128)"""
+        return self.gallery.encodings
 
     def load_known_faces(self, faces_dir: str):
         """
@@ -34,31 +182,78 @@ class FaceDetector:
         Args:
             faces_dir: 包含人脸图片的目录路径，文件名即为人名
         """
-        # 优先尝试从 Supabase 加载
+        if settings.SHARD_MANIFEST:
+            self.shards = ShardCoordinator.from_manifest(
+                settings.SHARD_MANIFEST, settings.SHARD_TIMEOUT_MS, settings.SHARD_TOKEN
+            )
+            logger.info(f"分片模式: 通过 {len(self.shards.shards)} 个分片检索人脸库")
+            return
+
+        if settings.GALLERY_STORAGE != "pq":
+            self._load_gallery(faces_dir)
+            return
+
+        # PQ 模式：优先加载已有的 PQ 索引，否则加载全精度人脸库后训练量化
+        try:
+            pq = PQGallery.load(settings.FACE_ENCODINGS_CACHE, settings.GALLERY_PQ_RERANK)
+        except Exception as e:
+            logger.warning(f"读取 PQ 索引失败: {e}")
+            pq = None
+        if pq is not None and len(pq) > 0:
+            self.gallery = pq
+            logger.info(f"从 PQ 索引加载了 {len(pq)} 个人脸（常驻内存 {pq.memory_bytes / 1024 / 1024:.1f} MB）")
+            return
+
+        self._load_gallery(faces_dir)
+        if len(self.gallery) > 0:
+            self.gallery = PQGallery.build(
+                self.gallery,
+                settings.FACE_ENCODINGS_CACHE,
+                subspaces=settings.GALLERY_PQ_SUBSPACES,
+                rerank=settings.GALLERY_PQ_RERANK
+            )
+            logger.info(f"已为 {len(self.gallery)} 个人脸生成 PQ 索引")
+
+    def _load_gallery(self, faces_dir: str):
+        """加载全精度人脸库：特征缓存 > Supabase > 本地目录"""
+        # 优先使用预计算的特征缓存（scripts/precompute_encodings.py 生成）
+        if settings.ENABLE_FACE_CACHE:
+            try:
+                cached = FaceGallery.load(settings.FACE_ENCODINGS_CACHE, self._gallery_dtype())
+            except Exception as e:
+                logger.warning(f"读取特征缓存失败: {e}")
+                cached = None
+            if cached is not None and len(cached) > 0:
+                self.gallery = cached
+                logger.info(f"从特征缓存加载了 {len(cached)} 个人脸")
+                return
+
+        import face_recognition
+
+        # 其次尝试从 Supabase 加载
         if settings.STORAGE_TYPE == "supabase" and settings.SUPABASE_URL and settings.SUPABASE_KEY:
             try:
-                print(f"正在从 Supabase Bucket '{settings.SUPABASE_BUCKET}' 加载人脸...")
-                supabase: Client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+                logger.info(f"正在从 Supabase Bucket '{settings.SUPABASE_BUCKET}' 加载人脸...")
+                supabase = get_supabase_client()
                 files = supabase.storage.from_(settings.SUPABASE_BUCKET).list()
-                
-                count = 0
+                files = [file for file in files if file['name'].lower().endswith(('.jpg', '.jpeg', '.png'))]
+
+                # 按时间间隔汇总进度，不逐个文件输出
+                progress = ProgressLogger(logger, "从 Supabase 加载人脸", total=len(files))
                 for file in files:
-                    if file['name'].lower().endswith(('.jpg', '.jpeg', '.png')):
-                        print(f"加载: {file['name']}")
-                        data = supabase.storage.from_(settings.SUPABASE_BUCKET).download(file['name'])
-                        image_file = io.BytesIO(data)
-                        image = face_recognition.load_image_file(image_file)
-                        encodings = face_recognition.face_encodings(image)
-
-                        if encodings:
-                            name = Path(file['name']).stem
-                            self.known_face_encodings.append(encodings[0])
-                            self.known_face_names.append(name)
-                            count += 1
-                print(f"从 Supabase 加载了 {count} 个人脸")
+                    data = supabase.storage.from_(settings.SUPABASE_BUCKET).download(file['name'])
+                    image_file = io.BytesIO(data)
+                    image = face_recognition.load_image_file(image_file)
+                    encodings = face_recognition.face_encodings(image)
+
+                    if encodings:
+                        name = Path(file['name']).stem
+                        self.gallery.add(name, encodings[0])
+                    progress.update(ok=bool(encodings))
+                progress.finish()
                 return
             except Exception as e:
-                print(f"从 Supabase 加载失败: {e}")
+                logger.error(f"从 Supabase 加载失败: {e}")
                 # 失败后尝试本地加载
 
         faces_path = Path(faces_dir)
@@ -66,7 +261,9 @@ class FaceDetector:
             faces_path.mkdir(parents=True)
             return
 
-        for image_path in faces_path.glob("*.jpg"):
+        image_paths = list(faces_path.glob("*.jpg"))
+        progress = ProgressLogger(logger, "从本地目录加载人脸", total=len(image_paths))
+        for image_path in image_paths:
             # 加载图片
             image = face_recognition.load_image_file(str(image_path))
             # 获取人脸编码
@@ -75,92 +272,149 @@ class FaceDetector:
             if encodings:
                 # 使用文件名（去除扩展名）作为人名
                 name = image_path.stem
-                self.known_face_encodings.append(encodings[0])
-                self.known_face_names.append(name)
+                self.gallery.add(name, encodings[0])
+            progress.update(ok=bool(encodings))
+        if image_paths:
+            progress.finish()
 
-    def detect_faces(self, image: np.ndarray) -> Tuple[List, List]:
+    def locate_faces(self, image: np.ndarray) -> List:
         """
-        检测图片中的所有人脸
+        只定位人脸位置，不做编码和比对
 
         Args:
             image: 输入图片（numpy array RGB格式）
 
+        Returns:
+            人脸位置列表 [(top, right, bottom, left), ...]
+        """
+        import face_recognition
+
+        return face_recognition.face_locations(image, model=self.model_type)
+
+    def encode_faces(self, image: np.ndarray, face_locations: Optional[List] = None) -> Tuple[List, np.ndarray]:
+        """
+        定位人脸并提取 128 维特征向量
+
+        Args:
+            image: 输入图片（numpy array RGB格式）
+            face_locations: 已知的人脸位置（可选），传入时跳过人脸定位
+
         Returns:
             face_locations: 人脸位置列表 [(top, right, bottom, left), ...]
-            face_names: 识别出的人名列表
+            face_encodings: 特征矩阵 (N, 128)，与人脸位置一一对应
         """
         # face_recognition 使用 RGB，如果你传入的是 BGR (OpenCV格式)，需要转换
         # 但我们现在改用 PIL 读取，默认就是 RGB，所以这里不需要转换了
         # 只要确保传入的 image 是 RGB 格式的 numpy array
-        
+
         # 检测人脸位置
-        face_locations = face_recognition.face_locations(image, model=self.model_type)
-
-        # 获取人脸编码
-        face_encodings = face_recognition.face_encodings(image, face_locations)
-
-        # 识别人脸
-        face_names = []
-        for face_encoding in face_encodings:
-            name = "Unknown"
-
-            if self.known_face_encodings:
-                # 比对人脸
-                matches = face_recognition.compare_faces(
-                    self.known_face_encodings,
-                    face_encoding,
-                    tolerance=0.5  # 容差值，越小越严格（从0.6优化为0.5）
-                )
+        if face_locations is None:
+            face_locations = self.locate_faces(image)
 
-                # 计算人脸距离
-                face_distances = face_recognition.face_distance(
-                    self.known_face_encodings,
-                    face_encoding
-                )
+        # 整张图片的人脸批量提取特征；人脸很多时按区域分给多个进程
+        workers = settings.ENCODE_WORKERS
+        if workers > 1 and len(face_locations) >= settings.ENCODE_PARALLEL_MIN_FACES:
+            face_encodings = parallel_face_encodings(image, face_locations, workers)
+        else:
+            face_encodings = batch_face_encodings(image, face_locations)
+
+        return face_locations, face_encodings
+
+    def detect_faces(self, image: np.ndarray, face_locations: Optional[List] = None) -> Tuple[List, List]:
+        """
+        检测图片中的所有人脸
+
+        Args:
+            image: 输入图片（numpy array RGB格式）
+            face_locations: 已知的人脸位置（可选），传入时跳过人脸定位
+
+        Returns:
+            face_locations: 人脸位置列表 [(top, right, bottom, left), ...]
+            face_names: 识别出的人名列表
+        """
+        face_locations, face_encodings = self.encode_faces(image, face_locations)
+        return face_locations, self.identify(face_encodings)
+
+    def identify(self, face_encodings: List) -> List[str]:
+        """
+        将特征向量与已知人脸比对，返回人名（未匹配为 "Unknown"）
+
+        Args:
+            face_encodings: 特征向量列表
+
+        Returns:
+            识别出的人名列表
+        """
+        return self.names_from_matches(self.match_encodings(face_encodings, top_k=1))
+
+    def names_from_matches(self, matches: List[List[Tuple[str, float, float]]]) -> List[str]:
+        """
+        从检索结果中取最佳候选，距离超过容差值时为 "Unknown"
+
+        Args:
+            matches: match_encodings 的返回结果
+
+        Returns:
+            识别出的人名列表
+        """
+        return [
+            candidates[0][0] if candidates and candidates[0][1] <= self.tolerance else "Unknown"
+            for candidates in matches
+        ]
 
-                if len(face_distances) > 0:
-                    best_match_index = np.argmin(face_distances)
-                    if matches[best_match_index]:
-                        name = self.known_face_names[best_match_index]
+    def match_encodings(self, encodings: np.ndarray, top_k: int = 5) -> List[List[Tuple[str, float, float]]]:
+        """
+        检索与每个特征向量最相似的前 k 个已知人脸
 
-            face_names.append(name)
+        检索由人脸库完成：全精度/float16 人脸库一次矩阵乘法算出所有距离，
+        PQ 人脸库先查表粗排再用原始向量重排序
 
-        return face_locations, face_names
+        Args:
+            encodings: 查询特征向量 (M, 128)
+            top_k: 每个查询返回的候选数量
+
+        Returns:
+            每个查询的候选列表 [[(人名, 距离, 置信度), ...], ...]，按距离升序
+        """
+        if len(encodings) == 0:
+            return []
+        return [
+            [
+                (name, distance, float(confidence))
+                for (name, distance), confidence in zip(
+                    candidates, distance_to_confidence([d for _, d in candidates], self.tolerance)
+                )
+            ]
+            for candidates in self._search(np.asarray(encodings), top_k)
+        ]
+
+    def _search(self, encodings: np.ndarray, top_k: int) -> List[List[Tuple[str, float]]]:
+        """在本地人脸库或各分片中检索，返回每个查询的 [(人名, 距离), ...]"""
+        if self.shards is not None:
+            return self.shards.search(encodings, top_k)
+        indices, distances = self.gallery.search(encodings, top_k)
+        names = self.gallery.names
+        return [
+            [(names[i], float(distance)) for i, distance in zip(row_indices, row_distances)]
+            for row_indices, row_distances in zip(indices, distances)
+        ]
 
     def draw_faces(self, image_array: np.ndarray, face_locations: List, face_names: List) -> Image.Image:
         """
         在图片上绘制人脸框和名字
 
+        字体只加载一次，人名标签位图按 LRU 缓存；设置 RESULT_IMAGE_MAX_SIDE 时在缩小后的图片上绘制
+
         Args:
             image_array: 输入图片 (numpy array)
-            face_locations: 人脸位置列表
+            face_locations: 人脸位置列表（原图坐标）
             face_names: 人名列表
 
         Returns:
             绘制后的图片 (PIL Image 对象)
         """
-        # 将 numpy array 转换为 PIL Image
-        pil_image = Image.fromarray(image_array)
-        draw = ImageDraw.Draw(pil_image)
-
-        for (top, right, bottom, left), name in zip(face_locations, face_names):
-            # 绘制矩形框
-            color = (0, 255, 0) if name != "Unknown" else (255, 0, 0) # Green or Red
-            
-            # PIL 的 rectangle 需要 [x0, y0, x1, y1]
-            draw.rectangle([left, top, right, bottom], outline=color, width=3)
-
-            # 绘制标签背景
-            text_width = len(name) * 10 # 估算宽度
-            text_height = 20
-            draw.rectangle([left, bottom - text_height - 10, right, bottom], fill=color, outline=color)
-
-            # 绘制文字
-            # 默认字体可能不支持中文，这里为了简单使用默认字体
-            # 如果需要中文支持，需要加载字体文件
-            draw.text((left + 6, bottom - text_height - 5), name, fill=(255, 255, 255))
-
-        return pil_image
+        font = load_font(settings.ANNOTATION_FONT, settings.ANNOTATION_FONT_SIZE)
+        return draw_annotations(image_array, face_locations, face_names, font, settings.RESULT_IMAGE_MAX_SIDE)
 
     def add_known_face(self, image: np.ndarray, name: str, save_path: Optional[str] = None) -> bool:
         """
@@ -174,52 +428,214 @@ class FaceDetector:
         Returns:
             是否成功添加
         """
-        encodings = face_recognition.face_encodings(image)
+        try:
+            encoding = extract_enrollment_encoding(image, self.model_type)
+            warning = self.check_duplicate(name, encoding)
+        except QualityError as e:
+            logger.warning(f"无法添加人脸 {name}: {e}")
+            return False
+        if warning:
+            logger.warning(warning)
+
+        # 将 numpy array 转回图片字节
+        img_byte_arr = io.BytesIO()
+        Image.fromarray(image).save(img_byte_arr, format='JPEG')
+        try:
+            self.enroll_encoding(name, encoding, img_byte_arr.getvalue(), save_path)
+        except Exception as e:
+            logger.error(f"保存人脸图片失败: {e}")
+            return False
+        return True
+
+    def check_duplicate(self, name: str, encoding: np.ndarray) -> Optional[str]:
+        """
+        检查新特征是否与人脸库中的人脸近似重复
+
+        同一人的重复照片不再注册（只会增大人脸库、拖慢比对）；
+        与其他人重复时按 ENROLL_DUPLICATE_ACTION 拒绝或标记
 
-        if encodings:
-            self.known_face_encodings.append(encodings[0])
-            self.known_face_names.append(name)
+        Args:
+            name: 待注册的人名
+            encoding: 待注册的特征向量
+
+        Returns:
+            标记模式下的提示信息，无重复时返回 None
+
+        Raises:
+            DuplicateFaceError: 判定为重复且需要拒绝
+        """
+        candidates = self._search(np.asarray(encoding)[None, :], 1)[0]
+        if not candidates or candidates[0][1] >= settings.ENROLL_DUPLICATE_DISTANCE:
+            return None
+
+        existing, distance = candidates[0]
+        if existing == name:
+            raise DuplicateFaceError(f"已注册过相同的人脸: {name}（距离 {distance:.3f}）", same_name=True)
+
+        message = f"与已注册的 {existing} 近似重复（距离 {distance:.3f}）"
+        if settings.ENROLL_DUPLICATE_ACTION == "flag":
+            return message
+        raise DuplicateFaceError(message, same_name=False)
+
+    def enroll_encoding(
+        self,
+        name: str,
+        encoding: np.ndarray,
+        image_bytes: Optional[bytes] = None,
+        save_path: Optional[str] = None
+    ):
+        """
+        将已提取的特征向量加入人脸库，并保存原图
+
+        先保存图片再加入人脸库：保存失败时抛出异常且人脸库不变，调用方可以安全重试
+
+        Args:
+            name: 人名
+            encoding: 128 维特征向量
+            image_bytes: 图片数据（可选），非 JPEG 格式会转换为 JPEG
+            save_path: 本地保存路径（可选，仅本地存储模式使用）
+        """
+        if image_bytes is not None:
+            if not image_bytes.startswith(b"\xff\xd8"):
+                img_byte_arr = io.BytesIO()
+                Image.open(io.BytesIO(image_bytes)).convert("RGB").save(img_byte_arr, format='JPEG')
+                image_bytes = img_byte_arr.getvalue()
 
-            # 保存到 Supabase
             if settings.STORAGE_TYPE == "supabase" and settings.SUPABASE_URL and settings.SUPABASE_KEY:
-                try:
-                    supabase: Client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
-                    
-                    # 将 numpy array 转回图片字节
-                    pil_image = Image.fromarray(image)
-                    img_byte_arr = io.BytesIO()
-                    pil_image.save(img_byte_arr, format='JPEG')
-                    file_bytes = img_byte_arr.getvalue()
-                    
-                    file_name = f"{name}.jpg"
-                    # upsert=True 覆盖同名文件
-                    supabase.storage.from_(settings.SUPABASE_BUCKET).upload(
-                        file_name, 
-                        file_bytes, 
-                        file_options={"content-type": "image/jpeg", "upsert": "true"}
-                    )
-                    return True
-                except Exception as e:
-                    print(f"上传到 Supabase 失败: {e}")
-                    return False
-
-            # 保存图片到本地
-            if save_path:
-                pil_image = Image.fromarray(image)
-                pil_image.save(save_path)
-
-            return True
-        return False
-
-
-# 全局人脸检测器实例（在应用启动时初始化）
+                # upsert=True 覆盖同名文件
+                get_supabase_client().storage.from_(settings.SUPABASE_BUCKET).upload(
+                    f"{name}.jpg",
+                    image_bytes,
+                    file_options={"content-type": "image/jpeg", "upsert": "true"}
+                )
+            elif save_path:
+                # 保存图片到本地
+                Path(save_path).write_bytes(image_bytes)
+
+        if self.shards is not None:
+            self.shards.add(name, encoding)
+        else:
+            with self._write_lock:
+                self.gallery.add(name, encoding)
+
+    def sync_gallery(self, cache_file: str, replace: bool = False):
+        """
+        与其他 worker 共用的特征缓存文件同步：写入本进程新增的人脸，加载其他 worker 新增或导入的人脸
+
+        Args:
+            cache_file: 特征缓存路径
+            replace: 用本进程人脸库整体替换文件（导入全量快照后）
+        """
+        # 分片模式下人脸保存在各分片中，由分片服务自行保存
+        if self.shards is not None:
+            return
+        with self._write_lock:
+            # PQ 模式导入全量快照时已写出新的 PQ 文件，合并即可
+            if replace and not isinstance(self.gallery, PQGallery):
+                self.gallery.save(cache_file, self.model_type)
+            else:
+                self.gallery = self.gallery.sync(cache_file, self.model_type)
+
+    def apply_snapshot(self, snapshot: Snapshot):
+        """
+        导入人脸库快照：全量快照替换整个人脸库，增量快照追加到人脸库末尾
+
+        PQ 模式下快照附带码本时直接使用，写出 PQ 文件后内存映射加载，否则重新训练；
+        导入后由调用方保存人脸库（sync_gallery，全量快照时 replace=True）
+
+        Args:
+            snapshot: read_snapshot 读取的快照
+
+        Raises:
+            SnapshotError: 分片模式，或增量快照的基准与本地人脸库不一致
+        """
+        if self.shards is not None:
+            raise SnapshotError("分片模式下人脸库保存在各分片中，请在分片服务上导入快照", conflict=True)
+        if snapshot.meta["model_type"] != self.model_type:
+            logger.warning(f"快照的检测模型 {snapshot.meta['model_type']} 与本节点 {self.model_type} 不同")
+
+        with self._write_lock:
+            if snapshot.is_delta:
+                verify_delta(self.gallery, snapshot)
+                self.gallery.add_many(snapshot.names, snapshot.encodings)
+                return
+            if settings.GALLERY_STORAGE != "pq" or (snapshot.codebooks is None and not snapshot.names):
+                gallery = FaceGallery(capacity=len(snapshot.names), dtype=self._gallery_dtype())
+                gallery.add_many(snapshot.names, snapshot.encodings)
+            elif snapshot.codebooks is not None:
+                PQGallery(
+                    snapshot.names, snapshot.codebooks, snapshot.codes, snapshot.encodings
+                ).save(settings.FACE_ENCODINGS_CACHE, self.model_type)
+                gallery = PQGallery.load(settings.FACE_ENCODINGS_CACHE, settings.GALLERY_PQ_RERANK)
+            else:
+                full = FaceGallery(capacity=len(snapshot.names), dtype="float32")
+                full.add_many(snapshot.names, snapshot.encodings)
+                gallery = PQGallery.build(
+                    full,
+                    settings.FACE_ENCODINGS_CACHE,
+                    subspaces=settings.GALLERY_PQ_SUBSPACES,
+                    rerank=settings.GALLERY_PQ_RERANK
+                )
+            self.gallery = gallery
+
+
+def extract_enrollment_encoding(image: np.ndarray, model_type: str = "hog") -> np.ndarray:
+    """
+    检查注册图片质量并提取要注册的人脸特征
+
+    Args:
+        image: RGB 图片
+        model_type: 人脸检测模型
+
+    Returns:
+        128 维特征向量
+
+    Raises:
+        QualityError: 未检测到人脸、多人照片、人脸过小或过于模糊
+    """
+    import face_recognition
+
+    face_locations = face_recognition.face_locations(image, model=model_type)
+    box = select_enrollment_face(
+        image,
+        face_locations,
+        min_face_size=settings.ENROLL_MIN_FACE_SIZE,
+        min_sharpness=settings.ENROLL_MIN_SHARPNESS,
+        reject_multi_face=settings.ENROLL_REJECT_MULTI_FACE
+    )
+    return face_recognition.face_encodings(image, [box])[0]
+
+
+_supabase_client = None
+
+
+def get_supabase_client():
+    """获取共享的 Supabase 客户端（首次调用时创建，避免每次上传都新建连接）"""
+    global _supabase_client
+    if _supabase_client is None:
+        from supabase import create_client
+        _supabase_client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+    return _supabase_client
+
+
+# 全局人脸检测器实例（首次使用或启动预热时初始化）
 face_detector = None
+_face_detector_lock = threading.Lock()
 
 def get_face_detector() -> FaceDetector:
     """获取全局人脸检测器实例"""
     global face_detector
     if face_detector is None:
-        face_detector = FaceDetector(model_type="hog")
-        # 加载已知人脸（从 models 目录）
-        face_detector.load_known_faces("models/known_faces")
+        # 加锁避免并发请求重复加载模型和人脸库
+        with _face_detector_lock:
+            if face_detector is None:
+                detector = FaceDetector(model_type="hog")
+                # 加载已知人脸（从 models 目录）
+                detector.load_known_faces("models/known_faces")
+                face_detector = detector
     return face_detector
+
+
+def is_face_detector_ready() -> bool:
+    """全局人脸检测器是否已完成加载"""
+    return face_detector is not None
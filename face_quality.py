@@ -0,0 +1,97 @@
+"""
+注册图片质量检查模块
+在提取特征之前拒绝不适合作为注册样本的图片：
+- 多人合照（无法确定注册的是哪张人脸）
+- 人脸过小（特征不稳定）
+- 人脸区域模糊（拉普拉斯方差过低）
+"""
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+Box = Tuple[int, int, int, int]  # (top, right, bottom, left)
+
+# 计算清晰度前把人脸区域缩放到固定宽度，使不同分辨率的图片可比
+SHARPNESS_WIDTH = 128
+
+
+class QualityError(Exception):
+    """注册图片不满足质量要求（永久性错误，不重试）"""
+
+
+class DuplicateFaceError(QualityError):
+    """人脸已注册（与人脸库中的某张人脸近似重复）"""
+
+    def __init__(self, message: str, same_name: bool):
+        super().__init__(message)
+        self.same_name = same_name
+
+
+def sharpness(image: np.ndarray, box: Optional[Box] = None) -> float:
+    """
+    估计图片（或人脸区域）的清晰度：灰度图拉普拉斯响应的方差
+
+    Args:
+        image: RGB 图片 (H, W, 3)
+        box: 人脸位置（可选），只计算该区域
+
+    Returns:
+        拉普拉斯方差，越大越清晰，模糊图片通常低于 50
+    """
+    if box is not None:
+        top, right, bottom, left = box
+        image = image[max(top, 0):bottom, max(left, 0):right]
+    gray = Image.fromarray(image).convert("L")
+    if gray.width > 0 and gray.width != SHARPNESS_WIDTH:
+        height = max(3, round(gray.height * SHARPNESS_WIDTH / gray.width))
+        gray = gray.resize((SHARPNESS_WIDTH, height), Image.BILINEAR)
+
+    g = np.asarray(gray, dtype=np.float64)
+    if g.shape[0] < 3 or g.shape[1] < 3:
+        return 0.0
+    laplacian = (
+        g[:-2, 1:-1] + g[2:, 1:-1] + g[1:-1, :-2] + g[1:-1, 2:] - 4.0 * g[1:-1, 1:-1]
+    )
+    return float(laplacian.var())
+
+
+def select_enrollment_face(
+    image: np.ndarray,
+    face_locations: List[Box],
+    min_face_size: int = 0,
+    min_sharpness: float = 0.0,
+    reject_multi_face: bool = True
+) -> Box:
+    """
+    检查注册图片并选出要注册的人脸
+
+    Args:
+        image: RGB 图片
+        face_locations: 检测到的人脸位置
+        min_face_size: 人脸框最短边的最小像素数
+        min_sharpness: 人脸区域的最小拉普拉斯方差
+        reject_multi_face: 多张人脸时是否拒绝（否则选最大的一张）
+
+    Returns:
+        要注册的人脸位置
+
+    Raises:
+        QualityError: 图片不满足质量要求
+    """
+    if not face_locations:
+        raise QualityError("图片中未检测到人脸")
+    if len(face_locations) > 1 and reject_multi_face:
+        raise QualityError(f"图片中有 {len(face_locations)} 张人脸，请使用单人照片")
+
+    box = max(face_locations, key=lambda b: (b[2] - b[0]) * (b[1] - b[3]))
+    top, right, bottom, left = box
+    size = min(bottom - top, right - left)
+    if size < min_face_size:
+        raise QualityError(f"人脸过小（{size} 像素，至少需要 {min_face_size} 像素）")
+
+    if min_sharpness > 0:
+        score = sharpness(image, box)
+        if score < min_sharpness:
+            raise QualityError(f"人脸区域过于模糊（清晰度 {score:.1f}，至少需要 {min_sharpness:.0f}）")
+    return box
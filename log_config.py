@@ -0,0 +1,185 @@
+"""
+日志配置模块
+- JSON 结构化日志（每行一个 JSON 对象），自动附带当前请求 ID
+- 请求线程只把日志记录放入内存队列（QueueHandler），由后台 QueueListener 线程写 stdout / 文件，
+  写日志不会阻塞请求处理
+- 长时间加载任务按时间间隔输出进度，不逐个文件打印
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Optional
+
+# 当前请求 ID（由请求日志中间件设置，线程池中执行的代码同样可以读取）
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+# LogRecord 的标准属性，其余属性（extra=...）作为结构化字段输出
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+
+class RequestIdFilter(logging.Filter):
+    """为日志记录附加当前请求 ID"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "request_id"):
+            record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """将日志记录格式化为单行 JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+            "pid": record.process,
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_setup_args: Optional[tuple] = None
+
+
+def _build_handlers(fmt: str, log_dir: Optional[str]):
+    if fmt == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s")
+
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if log_dir:
+        try:
+            Path(log_dir).mkdir(parents=True, exist_ok=True)
+            handlers.append(logging.handlers.RotatingFileHandler(
+                os.path.join(log_dir, "app.log"), maxBytes=10 * 1024 * 1024, backupCount=5, encoding="utf-8"
+            ))
+            error_handler = logging.handlers.RotatingFileHandler(
+                os.path.join(log_dir, "error.log"), maxBytes=10 * 1024 * 1024, backupCount=5, encoding="utf-8"
+            )
+            error_handler.setLevel(logging.ERROR)
+            handlers.append(error_handler)
+        except OSError as e:
+            print(f"无法写入日志目录 {log_dir}，只输出到 stdout: {e}", file=sys.stderr)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def setup_logging(level: str = "INFO", fmt: str = "json", log_dir: Optional[str] = None):
+    """
+    配置全局日志：根 logger 只挂一个 QueueHandler，实际输出在后台线程完成
+
+    Args:
+        level: 日志级别
+        fmt: "json" 或 "text"
+        log_dir: 日志文件目录（可选），为空时只输出到 stdout
+    """
+    global _listener, _setup_args
+    if _listener is not None:
+        _listener.stop()
+    _setup_args = (level, fmt, log_dir)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    # uvicorn 的日志统一走同一条管道
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers.clear()
+        uvicorn_logger.propagate = True
+    # 请求日志由应用中间件记录（带请求 ID 和阶段耗时），不重复输出 uvicorn 的访问日志
+    logging.getLogger("uvicorn.access").setLevel(logging.WARNING)
+    # httpx 每个请求输出一条 INFO（分片检索时每帧 N 条）
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(
+        log_queue, *_build_handlers(fmt, log_dir), respect_handler_level=True
+    )
+    _listener.start()
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+def _restart_after_fork():
+    """fork 出的子进程中没有后台写日志线程，重新配置一份"""
+    global _listener
+    if _setup_args is not None:
+        _listener = None
+        setup_logging(*_setup_args)
+
+
+atexit.register(_stop_listener)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+class ProgressLogger:
+    """按时间间隔输出长任务的进度（替代逐项打印）"""
+
+    def __init__(self, logger: logging.Logger, label: str, total: Optional[int] = None, interval: float = 5.0):
+        """
+        Args:
+            logger: 输出进度的 logger
+            label: 任务名称
+            total: 总数（可选）
+            interval: 输出间隔（秒）
+        """
+        self.logger = logger
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.failed = 0
+        self._start = time.time()
+        self._last = self._start
+
+    def update(self, ok: bool = True):
+        """完成一项"""
+        self.done += 1
+        if not ok:
+            self.failed += 1
+        now = time.time()
+        if now - self._last >= self.interval:
+            self._last = now
+            self._log("进行中")
+
+    def finish(self):
+        """输出最终统计"""
+        self._log("完成")
+
+    def _log(self, state: str):
+        elapsed = time.time() - self._start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        total = f"/{self.total}" if self.total is not None else ""
+        self.logger.info(
+            f"{self.label}{state}: {self.done}{total}（失败 {self.failed}，{rate:.1f} 个/秒）",
+            extra={"progress_done": self.done, "progress_total": self.total,
+                   "progress_failed": self.failed, "elapsed_s": round(elapsed, 2)}
+        )
@@ -2,34 +2,244 @@
 FastAPI 后端服务
 提供人脸识别 Web API
 """
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Header, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.background import BackgroundTask
+from pydantic import BaseModel
 import numpy as np
 import base64
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional, Tuple, Union
 import logging
 import os
 import io
+import threading
+import zipfile
+import asyncio
+import hmac
+import json
+import random
+import tempfile
+import time
+import uuid
+from datetime import datetime
 from PIL import Image
 
-from face_detector import get_face_detector
-from config import settings
+from face_detector import get_face_detector, is_face_detector_ready
+from config import settings, print_settings
+from admission import (
+    LoadMonitor, MemoryBucketStore, RateLimiter, SQLiteBucketStore, get_client_key, parse_networks
+)
+from roi_tracker import StreamROITracker
+from embeddings import SUPPORTED_DTYPES, decode_embeddings, encode_embedding
+from enrollment_queue import EnrollmentQueue
+from profiling import RequestTrace, profiled, start_session, stop_session
+from log_config import request_id_var, setup_logging
+from video import VideoOptions, process_video
+from annotation import load_font
+from crop_store import CropStore
+from event_log import EventLog
+from snapshot import SnapshotError, export_snapshot, gallery_checksum, read_snapshot
+from warmup import run_warmup
+from serialization import (
+    MSGPACK_MEDIA_TYPE, SUPPORTED_LAYOUTS, FastJSONResponse, accepts_msgpack, dumps, negotiated_response, packb, shape_faces
+)
 
-# 配置日志
-logging.basicConfig(level=logging.INFO)
+# 配置日志（JSON 结构化日志，由后台线程写出，不阻塞请求）
+setup_logging(
+    level=settings.LOG_LEVEL,
+    fmt=settings.LOG_FORMAT,
+    log_dir=settings.LOG_DIR if settings.LOG_TO_FILE else None
+)
 logger = logging.getLogger(__name__)
+access_logger = logging.getLogger("access")
 
 # 创建 FastAPI 应用
 app = FastAPI(
     title="人脸识别系统",
     description="基于 Python + face_recognition (Pillow) 的在线人脸识别系统",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
+)
+
+# 限流器（视频流帧与其他接口分开计数）
+rate_limiter = None
+stream_rate_limiter = None
+if settings.ENABLE_RATE_LIMIT:
+    if settings.RATE_LIMIT_BACKEND == "sqlite":
+        bucket_store = SQLiteBucketStore(settings.RATE_LIMIT_DB)
+    else:
+        bucket_store = MemoryBucketStore()
+    rate_limiter = RateLimiter(settings.RATE_LIMIT_PER_MINUTE, settings.RATE_LIMIT_BURST, bucket_store)
+    stream_rate_limiter = RateLimiter(
+        settings.STREAM_RATE_LIMIT_PER_MINUTE, settings.RATE_LIMIT_BURST, bucket_store
+    )
+
+# 限流时采用其转发头的可信代理
+trusted_proxies = parse_networks(settings.TRUSTED_PROXIES)
+
+# 检测负载监控
+load_monitor = LoadMonitor()
+
+# 视频流区域检测跟踪器
+roi_tracker = StreamROITracker(
+    full_scan_interval=settings.ROI_FULL_SCAN_INTERVAL,
+    expand_ratio=settings.ROI_EXPAND_RATIO,
+    max_streams=settings.ROI_MAX_STREAMS
+)
+
+# 人脸注册队列（注册请求立即返回任务 ID，后台批量提取特征）
+enrollment_queue = EnrollmentQueue(
+    db_path=settings.ENROLL_QUEUE_DB,
+    spool_dir=settings.ENROLL_SPOOL_DIR,
+    workers=settings.ENROLL_WORKERS,
+    max_attempts=settings.ENROLL_MAX_ATTEMPTS
 )
 
-# 配置 CORS（允许跨域请求）
+# 需要进行人脸检测的接口及其请求类型
+DETECTION_PATHS = {
+    "/api/detect": "upload",
+    "/api/detect_stream": "stream",
+    "/api/detect_video": "video",
+}
+
+
+# 视频上传请求中除视频外的部分（multipart 分隔符、表单字段）允许的大小
+VIDEO_FORM_OVERHEAD = 64 * 1024
+
+
+def content_length(request: Request) -> int:
+    """请求头中的 Content-Length，缺失或无效时返回 0"""
+    try:
+        return int(request.headers.get("content-length", 0))
+    except ValueError:
+        return 0
+
+
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    """
+    限流与准入控制
+
+    在读取请求体之前完成判断，被拒绝的请求不会解码图片；
+    检测队列过深时优先丢弃视频流帧，图片上传和人脸注册照常处理
+    """
+    path = request.url.path
+    if not path.startswith("/api/"):
+        return await call_next(request)
+
+    # 预热完成前直接拒绝（nginx 把 503 转给其他 worker，请求不必等待模型加载）
+    if reject_while_warming():
+        return JSONResponse(
+            {"success": False, "detail": "服务正在预热，请稍后再试"},
+            status_code=503,
+            headers={"Retry-After": "1"}
+        )
+
+    kind = DETECTION_PATHS.get(path)
+
+    # 视频在读取请求体之前按 Content-Length 拒绝，不必先把整个文件接收到磁盘
+    if kind == "video" and content_length(request) > settings.VIDEO_MAX_BYTES + VIDEO_FORM_OVERHEAD:
+        return JSONResponse(
+            {"success": False, "detail": f"视频超过 {settings.VIDEO_MAX_BYTES // 1024 // 1024} MB"},
+            status_code=413
+        )
+
+    if rate_limiter is not None:
+        limiter = stream_rate_limiter if kind == "stream" else rate_limiter
+        client_key = get_client_key(
+            request.headers, request.client.host if request.client else None, settings.API_KEYS, trusted_proxies
+        )
+        allowed, retry_after = limiter.check(f"{'stream' if kind == 'stream' else 'api'}:{client_key}")
+        if not allowed:
+            return JSONResponse(
+                {"success": False, "detail": "请求过于频繁，请稍后再试"},
+                status_code=429,
+                headers={"Retry-After": str(max(1, int(retry_after + 0.999)))}
+            )
+
+    if kind is None:
+        return await call_next(request)
+
+    if not load_monitor.should_admit(
+        kind, settings.STREAM_SHED_QUEUE_DEPTH, settings.ADMISSION_MAX_QUEUE_DEPTH
+    ):
+        return JSONResponse(
+            {"success": False, "detail": "服务器繁忙，请稍后再试"},
+            status_code=503,
+            headers={"Retry-After": "1"}
+        )
+
+    with load_monitor.track(kind):
+        return await call_next(request)
+
+
+# 只在出错时记录日志的接口（负载均衡器频繁探测）
+QUIET_PATHS = {"/health", "/ready", "/metrics"}
+
+
+def log_request(request: Request, status: int, duration_ms: float):
+    """
+    记录一条请求日志（含各阶段耗时）
+
+    视频流帧请求按 LOG_STREAM_SAMPLE_RATE 采样，出错和慢请求始终记录
+    """
+    path = request.url.path
+    failed = status >= 500
+    slow = duration_ms >= settings.LOG_SLOW_REQUEST_MS
+    sample_rate = 1.0
+    if not failed and not slow:
+        if path in QUIET_PATHS or path.startswith("/static/"):
+            return
+        if DETECTION_PATHS.get(path) == "stream":
+            sample_rate = settings.LOG_STREAM_SAMPLE_RATE
+            if random.random() >= sample_rate:
+                return
+
+    fields = {
+        "method": request.method,
+        "path": path,
+        "status": status,
+        "duration_ms": round(duration_ms, 3),
+        "client": request.client.host if request.client else None,
+    }
+    if sample_rate < 1.0:
+        fields["sample_rate"] = sample_rate
+    trace = getattr(request.state, "trace", None)
+    if trace is not None and trace.stages:
+        fields["stages"] = {name: round(ms, 3) for name, ms in trace.stages.items()}
+    access_logger.log(
+        logging.WARNING if failed or slow else logging.INFO,
+        f"{request.method} {path} {status} {duration_ms:.1f}ms",
+        extra=fields
+    )
+
+
+@app.middleware("http")
+async def request_logging(request: Request, call_next):
+    """
+    请求日志：分配请求 ID（或沿用请求头 X-Request-ID），处理期间的所有日志都带有该 ID
+
+    放在准入控制之外，被限流和拒绝的请求同样记录
+    """
+    request_id = request.headers.get("x-request-id", "")[:64] or uuid.uuid4().hex[:16]
+    token = request_id_var.set(request_id)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = request_id
+        return response
+    finally:
+        log_request(request, status, (time.perf_counter() - start) * 1000)
+        request_id_var.reset(token)
+
+
+# 配置 CORS（允许跨域请求，放在准入控制之外，保证 429/503 响应也带有 CORS 头）
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -49,14 +259,151 @@ if settings.STORAGE_TYPE == "local":
     except Exception as e:
         logger.warning(f"无法创建本地目录 (可能在只读环境中): {e}")
 
+# 人脸截图存储（按请求 ID 保存，供复核界面查看）
+crop_store: Optional[CropStore] = None
+if settings.CROP_STORE_ENABLED:
+    try:
+        crop_store = CropStore(
+            settings.CROP_STORE_DIR,
+            settings.CROP_STORE_MAX_MB * 1024 * 1024,
+            settings.CROP_SIZE,
+            settings.CROP_FORMAT,
+            settings.CROP_QUALITY
+        )
+    except Exception as e:
+        logger.warning(f"无法启用人脸截图存储 (可能在只读环境中): {e}")
+
+# 识别事件记录（签到终端的视频流识别结果，按人名 / 时间范围查询）
+event_log: Optional[EventLog] = None
+if settings.EVENT_LOG_ENABLED:
+    try:
+        event_log = EventLog(
+            settings.EVENT_LOG_DB,
+            debounce_seconds=settings.EVENT_LOG_DEBOUNCE_SECONDS,
+            batch_size=settings.EVENT_LOG_BATCH_SIZE,
+            flush_interval=settings.EVENT_LOG_FLUSH_INTERVAL_MS / 1000,
+            retention_days=settings.EVENT_LOG_RETENTION_DAYS
+        )
+    except Exception as e:
+        logger.warning(f"无法启用识别事件记录 (可能在只读环境中): {e}")
+
+
+# 启动预热状态（WARMUP_ON_STARTUP 时预热完成前 /ready 返回 503，WARMUP_REJECT_REQUESTS 时 /api/* 也返回 503）
+warmup_state = {"status": "pending" if settings.WARMUP_ON_STARTUP else "disabled", "stages_ms": {}, "errors": []}
+
+
+def warming_up() -> bool:
+    """是否正在启动预热（加载失败时不再拦截请求，由请求按需重试加载）"""
+    return warmup_state["status"] in ("pending", "running")
+
+
+def reject_while_warming() -> bool:
+    """预热完成前是否直接拒绝请求（未开启时请求等待模型加载完成）"""
+    return settings.WARMUP_REJECT_REQUESTS and warming_up()
+
+
+def warmup():
+    """加载人脸识别模型和已知人脸库，用合成数据预热识别流程后标记就绪"""
+    warmup_state["status"] = "running"
+    trace = RequestTrace(enabled=True)
+    try:
+        logger.info("正在初始化人脸检测器...")
+        with trace.stage("load"):
+            detector = get_face_detector()
+            # 标注字体也在启动时加载，首个检测请求不需要等待
+            load_font(settings.ANNOTATION_FONT, settings.ANNOTATION_FONT_SIZE)
+        logger.info(f"已加载 {len(detector.known_face_names)} 个已知人脸")
+    except Exception as e:
+        logger.error(f"加载人脸检测器失败: {e}")
+        warmup_state.update(status="failed", stages_ms=trace.summary(), errors=[f"load: {e}"])
+        return
+    errors = run_warmup(detector, settings.WARMUP_IMAGE_SIZES, settings.WARMUP_BATCH_SIZES, trace)
+    warmup_state.update(status="done", stages_ms=trace.summary(), errors=errors)
+    logger.info(f"人脸识别系统启动成功！预热耗时 {warmup_state['stages_ms']['total'] / 1000:.1f} 秒")
+
+
+def enrollment_save_path(name: str) -> Optional[str]:
+    """注册图片的本地保存路径（仅本地存储模式）"""
+    if settings.STORAGE_TYPE == "local":
+        return f"models/known_faces/{name}.jpg"
+    return None
+
+
+def sync_gallery_cache(replace: bool = False):
+    """
+    与其他 worker 共用的特征缓存同步（注册队列每批完成后和空闲时定期调用）：
+    写入本进程新注册或导入的人脸，加载其他 worker 新增的人脸，重启后直接加载最新的人脸库
+    """
+    # 模型尚未加载时不同步（加载时读取的就是最新的缓存）
+    if settings.ENABLE_FACE_CACHE and is_face_detector_ready():
+        get_face_detector().sync_gallery(settings.FACE_ENCODINGS_CACHE, replace)
+
 
 @app.on_event("startup")
 async def startup_event():
-    """应用启动时初始化人脸检测器"""
-    logger.info("正在初始化人脸检测器...")
-    detector = get_face_detector()
-    logger.info(f"已加载 {len(detector.known_face_names)} 个已知人脸")
-    logger.info("人脸识别系统启动成功！")
+    """应用启动：模型在后台线程加载并预热，不阻塞服务监听（预热完成前 /ready 返回 503）"""
+    print_settings()
+    if settings.WARMUP_ON_STARTUP:
+        threading.Thread(target=warmup, name="warmup", daemon=True).start()
+    try:
+        enrollment_queue.start(get_face_detector, enrollment_save_path, sync_gallery_cache)
+    except Exception as e:
+        logger.warning(f"无法启动人脸注册队列 (可能在只读环境中): {e}")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭：停止注册队列（未完成的任务下次启动后继续处理），写完待保存的人脸截图和识别事件"""
+    enrollment_queue.stop()
+    if crop_store is not None:
+        crop_store.close()
+    if event_log is not None:
+        event_log.close()
+
+
+def is_admin(token: Optional[str]) -> bool:
+    """校验管理员令牌（未配置 ADMIN_TOKEN 时管理功能关闭）"""
+    return bool(settings.ADMIN_TOKEN) and token is not None and hmac.compare_digest(token, settings.ADMIN_TOKEN)
+
+
+def trace_requested(request: Request) -> bool:
+    """请求头 X-Trace: 1 且携带管理员令牌时返回各阶段耗时"""
+    return request.headers.get("x-trace", "").lower() in ("1", "true") and \
+        is_admin(request.headers.get("x-admin-token"))
+
+
+def start_trace(request: Request) -> RequestTrace:
+    """记录请求各阶段耗时（写入请求日志，X-Trace 时同时返回给客户端）"""
+    trace = RequestTrace(enabled=True)
+    request.state.trace = trace
+    return trace
+
+
+def traced_response(content: dict, trace: RequestTrace, request: Request) -> Response:
+    """
+    识别结果响应：按 Accept 请求头返回 msgpack 或 JSON，
+    并附加阶段耗时（响应体 trace 字段和 Server-Timing 响应头）
+    """
+    accept = request.headers.get("accept")
+    if not trace_requested(request):
+        return negotiated_response(content, accept)
+    content["trace"] = trace.summary()
+    return negotiated_response(content, accept, headers={"Server-Timing": trace.server_timing()})
+
+
+# 单次请求最多返回的候选人数量
+MAX_TOP_K = 100
+
+
+def clamp_top_k(top_k: int) -> int:
+    """将请求的候选数量限制在 1~MAX_TOP_K 之间"""
+    return max(1, min(top_k, MAX_TOP_K))
+
+
+def check_layout(layout: str):
+    """校验人脸列表布局参数"""
+    if layout not in SUPPORTED_LAYOUTS:
+        raise HTTPException(status_code=400, detail=f"不支持的人脸列表布局: {layout}")
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -78,169 +425,737 @@ async def read_root():
 
 
 @app.post("/api/detect")
-async def detect_faces(file: UploadFile = File(...)):
+async def detect_faces(
+    request: Request,
+    file: UploadFile = File(...),
+    return_encodings: bool = Form(False),
+    encoding_dtype: str = Form("float32"),
+    top_k: int = Form(0),
+    layout: str = Form("objects")
+):
     """
     检测上传图片中的人脸
 
     Args:
         file: 上传的图片文件
+        return_encodings: 是否返回每张人脸的 128 维特征向量（base64）
+        encoding_dtype: 特征向量精度，"float16" 或 "float32"
+        top_k: 大于 0 时为每张人脸返回前 k 个候选人及距离、置信度
+        layout: 人脸列表布局，"objects" 或 "compact"（按字段组成的平行数组）
 
     Returns:
-        JSON 响应，包含检测结果
+        JSON 响应，包含检测结果（请求头 X-Trace: 1 时附带各阶段耗时）；
+        Accept: application/x-msgpack 时返回 msgpack，结果图片为 JPEG 字节
     """
+    if encoding_dtype not in SUPPORTED_DTYPES:
+        raise HTTPException(status_code=400, detail=f"不支持的特征精度: {encoding_dtype}")
+    check_layout(layout)
+
+    trace = start_trace(request)
     try:
         # 读取上传的图片
         contents = await file.read()
         
         # 使用 Pillow 读取图片
-        try:
-            image = Image.open(io.BytesIO(contents)).convert("RGB")
-            image_array = np.array(image)
-        except Exception as e:
-             raise HTTPException(status_code=400, detail="无法读取图片文件")
+        with trace.stage("decode"):
+            try:
+                image = Image.open(io.BytesIO(contents)).convert("RGB")
+                image_array = np.array(image)
+            except Exception:
+                 raise HTTPException(status_code=400, detail="无法读取图片文件")
 
         # 获取人脸检测器
         detector = get_face_detector()
 
-        # 检测人脸
-        face_locations, face_names = detector.detect_faces(image_array)
+        # 检测人脸（在线程池中执行，避免阻塞事件循环）
+        with trace.stage("detect"):
+            face_locations = await run_in_threadpool(profiled, detector.locate_faces, image_array)
+        with trace.stage("encode"):
+            face_locations, face_encodings = await run_in_threadpool(
+                profiled, detector.encode_faces, image_array, face_locations
+            )
+        with trace.stage("match"):
+            matches = await run_in_threadpool(
+                profiled, detector.match_encodings, face_encodings, clamp_top_k(top_k)
+            )
+            face_names = detector.names_from_matches(matches)
 
         # 绘制人脸框 (返回的是 PIL Image 对象)
-        result_image_pil = detector.draw_faces(image_array, face_locations, face_names)
+        with trace.stage("draw"):
+            result_image_pil = await run_in_threadpool(
+                profiled, detector.draw_faces, image_array, face_locations, face_names
+            )
 
-        # 将结果图片编码为 base64
-        buffer = io.BytesIO()
-        result_image_pil.save(buffer, format="JPEG")
-        img_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
+        # 将结果图片编码为 JPEG（JSON 响应中为 base64 data URL，msgpack 响应直接返回字节）
+        with trace.stage("jpeg"):
+            buffer = io.BytesIO()
+            result_image_pil.save(buffer, format="JPEG")
+            if accepts_msgpack(request.headers.get("accept")):
+                result_image = buffer.getvalue()
+            else:
+                result_image = f"data:image/jpeg;base64,{base64.b64encode(buffer.getvalue()).decode('ascii')}"
 
         # 返回结果
-        return JSONResponse({
+        result = {
             "success": True,
             "face_count": len(face_locations),
-            "faces": [
-                {
-                    "name": name,
-                    "location": {
-                        "top": top,
-                        "right": right,
-                        "bottom": bottom,
-                        "left": left
-                    }
-                }
-                for (top, right, bottom, left), name in zip(face_locations, face_names)
-            ],
-            "result_image": f"data:image/jpeg;base64,{img_base64}"
-        })
+            **shape_faces(face_locations, face_names, matches if top_k > 0 else None, layout),
+            "result_image": result_image
+        }
+        if return_encodings:
+            encodings = [encode_embedding(encoding, encoding_dtype) for encoding in face_encodings]
+            if layout == "compact":
+                result["encodings"] = encodings
+            else:
+                for face, encoding in zip(result["faces"], encodings):
+                    face["encoding"] = encoding
+            result["encoding_dtype"] = encoding_dtype
+        if crop_store is not None:
+            crop_id = crop_store.submit(image_array, face_locations, face_names)
+            if crop_id is not None:
+                result["crops_url"] = f"/api/crops/{crop_id}"
+        return traced_response(result, trace, request)
 
     except Exception as e:
         logger.error(f"检测人脸时出错: {str(e)}")
         raise HTTPException(status_code=500, detail=f"处理失败: {str(e)}")
 
 
+def decode_image(data: bytes) -> np.ndarray:
+    """
+    解码图片数据为 RGB 数组
+
+    Raises:
+        ValueError: 无法读取图片
+    """
+    try:
+        return np.array(Image.open(io.BytesIO(data)).convert("RGB"))
+    except Exception:
+        raise ValueError("无法读取图片数据")
+
+
+def decode_base64(image_data: str) -> bytes:
+    """解码 base64 图片数据（可带 data URL 前缀）"""
+    if ',' in image_data:
+        image_data = image_data.split(',')[1]
+    try:
+        return base64.b64decode(image_data)
+    except Exception:
+        raise ValueError("无法读取图片数据")
+
+
+def decode_frame(data: Union[bytes, str], max_width: int) -> Tuple[np.ndarray, int]:
+    """
+    解码视频流帧（JPEG / WebP / PNG，彩色或灰度，str 为 base64）
+
+    宽度超过 max_width 的 JPEG 在解码时直接按 1/2、1/4 或 1/8 缩小（DCT 域缩放，
+    比完整解码更快），检测只需要 max_width 左右的分辨率
+
+    Returns:
+        (RGB 数组, 原始帧宽度)，两者宽度不同时人脸位置需要按比例换算回原始帧坐标
+
+    Raises:
+        ValueError: 无法读取图片
+    """
+    if isinstance(data, str):
+        data = decode_base64(data)
+    try:
+        image = Image.open(io.BytesIO(data))
+        frame_width = image.width
+        if 0 < max_width < frame_width:
+            image.draft("RGB", (max_width, image.height * max_width // frame_width))
+        return np.array(image.convert("RGB")), frame_width
+    except Exception:
+        raise ValueError("无法读取图片数据")
+
+
+def capture_hint(frame_width: int) -> dict:
+    """
+    视频流客户端的采集建议
+
+    Returns:
+        {"next_delay_ms", "capture_width"（按当前负载）, "quality"（编码质量 0~1）}
+    """
+    hint = load_monitor.stream_hint(
+        frame_width=frame_width,
+        min_delay_ms=settings.STREAM_MIN_INTERVAL_MS,
+        max_delay_ms=settings.STREAM_MAX_INTERVAL_MS,
+        target_ms=settings.STREAM_TARGET_LATENCY_MS,
+        min_width=settings.STREAM_MIN_CAPTURE_WIDTH,
+        max_width=settings.STREAM_MAX_CAPTURE_WIDTH
+    )
+    hint["quality"] = settings.STREAM_CAPTURE_QUALITY
+    return hint
+
+
+async def recognize_frame(
+    image_array: np.ndarray,
+    stream_id: Optional[str],
+    camera_id: Optional[str],
+    top_k: int,
+    trace: RequestTrace,
+    layout: str = "objects",
+    frame_width: Optional[int] = None
+) -> dict:
+    """
+    识别视频流中的一帧（HTTP 与 WebSocket 接口共用）
+
+    Args:
+        frame_width: 客户端原始帧宽度（解码时缩小了帧时给出，返回的人脸位置换算回原始帧坐标）
+
+    Returns:
+        响应内容：人脸列表和下一帧建议（不含结果图片）
+    """
+    # 获取人脸检测器
+    detector = get_face_detector()
+
+    # 检测人脸（在线程池中执行，避免阻塞事件循环）
+    with trace.stage("detect"):
+        if stream_id and settings.ENABLE_ROI_DETECTION:
+            face_locations = await run_in_threadpool(
+                profiled, roi_tracker.locate_faces, stream_id, image_array, detector.locate_faces
+            )
+        else:
+            face_locations = await run_in_threadpool(profiled, detector.locate_faces, image_array)
+    with trace.stage("encode"):
+        face_locations, face_encodings = await run_in_threadpool(
+            profiled, detector.encode_faces, image_array, face_locations
+        )
+    with trace.stage("match"):
+        matches = await run_in_threadpool(
+            profiled, detector.match_encodings, face_encodings, clamp_top_k(top_k)
+        )
+        face_names = detector.names_from_matches(matches)
+    if event_log is not None:
+        event_log.record(
+            camera_id or stream_id or "default",
+            [(name, candidates[0][1]) for name, candidates in zip(face_names, matches) if name != "Unknown"],
+            request_id_var.get()
+        )
+
+    frame_width = frame_width or image_array.shape[1]
+    if frame_width != image_array.shape[1]:
+        scale = frame_width / image_array.shape[1]
+        face_locations = [tuple(int(round(v * scale)) for v in location) for location in face_locations]
+
+    # 根据服务器负载给客户端推荐下一帧的发送间隔、采集分辨率和编码质量
+    client_hint = capture_hint(frame_width)
+
+    # 不返回图片，减少数据传输量
+    return {
+        "success": True,
+        "face_count": len(face_locations),
+        **shape_faces(face_locations, face_names, matches if top_k > 0 else None, layout),
+        "client_hint": client_hint
+    }
+
+
+@app.get("/api/stream/capabilities")
+async def stream_capabilities():
+    """
+    视频流客户端的采集参数：按检测实际需要的分辨率和画质采集、编码，不再传输服务端用不到的像素
+
+    Returns:
+        capture_width: 建议采集宽度（按当前负载，之后每帧的 client_hint 会继续调整）
+        min_capture_width / max_capture_width: 采集宽度范围，超过上限的 JPEG 帧在解码时缩小
+        quality: 建议编码质量（0~1）
+        formats: 可以发送的帧格式（按优先顺序，浏览器不支持时使用后面的格式）
+        grayscale: 是否建议发送灰度帧
+        next_delay_ms: 建议发送间隔
+        transports / layouts / msgpack: 可用的接口、人脸列表布局以及是否支持 msgpack 响应
+    """
+    from PIL import features
+
+    formats = ["image/jpeg"]
+    if settings.STREAM_PREFER_WEBP and features.check("webp"):
+        formats.insert(0, "image/webp")
+    return {
+        **capture_hint(0),
+        "min_capture_width": settings.STREAM_MIN_CAPTURE_WIDTH,
+        "max_capture_width": settings.STREAM_MAX_CAPTURE_WIDTH,
+        "formats": formats,
+        "grayscale": settings.STREAM_GRAYSCALE,
+        "transports": {"http": "/api/detect_stream", "websocket": "/ws/detect_stream"},
+        "layouts": list(SUPPORTED_LAYOUTS),
+        "msgpack": accepts_msgpack(MSGPACK_MEDIA_TYPE)
+    }
+
+
 @app.post("/api/detect_stream")
-async def detect_faces_stream(image_data: str = Form(...)):
+async def detect_faces_stream(
+    request: Request,
+    image_data: str = Form(...),
+    stream_id: Optional[str] = Form(None),
+    camera_id: Optional[str] = Form(None),
+    top_k: int = Form(0),
+    layout: str = Form("objects")
+):
     """
     检测视频流中的人脸（接收 base64 编码的图片）
 
     Args:
-        image_data: base64 编码的图片数据
+        image_data: base64 编码的图片数据（JPEG / WebP / PNG，可以是灰度图）
+        stream_id: 视频流标识（可选），提供时只在上一帧人脸附近检测，定期全图检测
+        camera_id: 摄像头 ID（可选，识别事件记录中使用，默认为 stream_id）
+        top_k: 大于 0 时为每张人脸返回前 k 个候选人及距离、置信度
+        layout: 人脸列表布局，"objects" 或 "compact"
 
     Returns:
-        JSON 响应，包含检测结果
+        JSON 响应，包含检测结果（请求头 X-Trace: 1 时附带各阶段耗时）；
+        Accept: application/x-msgpack 时返回 msgpack
     """
+    check_layout(layout)
+    trace = start_trace(request)
     try:
-        # 解码 base64 图片
-        if ',' in image_data:
-            image_data = image_data.split(',')[1]
+        with trace.stage("decode"):
+            try:
+                image_array, frame_width = decode_frame(image_data, settings.STREAM_MAX_CAPTURE_WIDTH)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        result = await recognize_frame(image_array, stream_id, camera_id, top_k, trace, layout, frame_width)
+        return traced_response(result, trace, request)
 
-        img_bytes = base64.b64decode(image_data)
-        
-        # 使用 Pillow 读取图片
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"检测视频流时出错: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"处理失败: {str(e)}")
+
+
+@app.websocket("/ws/detect_stream")
+async def detect_stream_ws(websocket: WebSocket):
+    """
+    通过 WebSocket 连续识别视频流（一个连接复用于整个视频流，省去每帧的 HTTP 开销）
+
+    客户端消息：
+        二进制消息     一帧图片（JPEG/PNG），使用当前连接参数
+        {"stream_id", "camera_id", "top_k", "layout"}    更新连接参数（也可以在 URL 查询参数中给出）
+        {"image_data": base64, "seq": n, ...}   一帧图片（可同时更新参数）
+
+    每帧回复一条 JSON 文本消息（与 /api/detect_stream 相同，附带 seq，未给出时为帧序号）；
+    URL 查询参数 format=msgpack 时回复 msgpack 二进制消息（服务端未安装 msgpack 时回复错误并关闭连接）。
+    负载过高或超过限流时回复 success=false 和 retry_after_ms，连接保持
+    """
+    await websocket.accept()
+    if reject_while_warming():
+        await websocket.close(code=1013, reason="服务正在预热，请稍后重连")
+        return
+    binary = websocket.query_params.get("format") == "msgpack"
+    if binary and not accepts_msgpack(MSGPACK_MEDIA_TYPE):
+        await websocket.send_json({"success": False, "detail": "服务端未安装 msgpack，请使用 JSON 格式"})
+        await websocket.close(code=1003)
+        return
+    try:
+        top_k = int(websocket.query_params.get("top_k") or 0)
+    except ValueError:
+        await websocket.send_json({"success": False, "detail": "top_k 应为整数"})
+        await websocket.close(code=1003)
+        return
+    params = {
+        "stream_id": websocket.query_params.get("stream_id"),
+        "camera_id": websocket.query_params.get("camera_id"),
+        "top_k": top_k,
+        "layout": websocket.query_params.get("layout") or "objects",
+    }
+
+    async def reply(content: dict):
+        if binary:
+            await websocket.send_bytes(packb(content))
+        else:
+            await websocket.send_text(dumps(content).decode("utf-8"))
+
+    client_key = get_client_key(
+        websocket.headers, websocket.client.host if websocket.client else None, settings.API_KEYS, trusted_proxies
+    )
+    connection_id = uuid.uuid4().hex[:12]
+    frames = 0
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            seq = frames
+            if message.get("bytes") is not None:
+                data = message["bytes"]
+            else:
+                try:
+                    payload = json.loads(message.get("text") or "")
+                except ValueError:
+                    await reply({"success": False, "detail": "消息不是有效的 JSON"})
+                    continue
+                if not isinstance(payload, dict):
+                    await reply({"success": False, "detail": "消息应为 JSON 对象"})
+                    continue
+                updates = {key: payload[key] for key in params if key in payload}
+                if "top_k" in updates:
+                    try:
+                        updates["top_k"] = int(updates["top_k"] or 0)
+                    except (TypeError, ValueError):
+                        await reply({"success": False, "detail": "top_k 应为整数"})
+                        continue
+                params.update(updates)
+                if "image_data" not in payload:
+                    continue
+                data = payload["image_data"]
+                seq = payload.get("seq", seq)
+            frames += 1
+            await reply(await recognize_ws_frame(data, seq, params, client_key, connection_id))
+    except WebSocketDisconnect:
+        pass
+    logger.info(f"WebSocket 视频流连接关闭，共 {frames} 帧", extra={"connection": connection_id})
+
+
+async def recognize_ws_frame(data, seq, params: dict, client_key: str, connection_id: str) -> dict:
+    """WebSocket 单帧：限流和准入控制与 HTTP 视频流帧相同"""
+    if params["layout"] not in SUPPORTED_LAYOUTS:
+        return {"success": False, "seq": seq, "detail": f"不支持的人脸列表布局: {params['layout']}"}
+    if stream_rate_limiter is not None:
+        allowed, retry_after = stream_rate_limiter.check(f"stream:{client_key}")
+        if not allowed:
+            return {"success": False, "seq": seq, "detail": "请求过于频繁，请稍后再试",
+                    "retry_after_ms": int(retry_after * 1000)}
+    if not load_monitor.should_admit("stream", settings.STREAM_SHED_QUEUE_DEPTH, settings.ADMISSION_MAX_QUEUE_DEPTH):
+        return {"success": False, "seq": seq, "detail": "服务器繁忙，请稍后再试", "retry_after_ms": 1000}
+
+    token = request_id_var.set(f"{connection_id}-{seq}")
+    trace = RequestTrace(enabled=False)
+    try:
+        with load_monitor.track("stream"):
+            image_array, frame_width = decode_frame(data, settings.STREAM_MAX_CAPTURE_WIDTH)
+            result = await recognize_frame(
+                image_array, params["stream_id"], params["camera_id"], params["top_k"], trace,
+                params["layout"], frame_width
+            )
+        return {**result, "seq": seq}
+    except ValueError as e:
+        return {"success": False, "seq": seq, "detail": str(e)}
+    except Exception as e:
+        logger.error(f"WebSocket 视频流帧处理失败: {e}")
+        return {"success": False, "seq": seq, "detail": f"处理失败: {str(e)}"}
+    finally:
+        request_id_var.reset(token)
+
+
+@app.post("/api/detect_batch")
+async def detect_faces_batch(
+    files: List[UploadFile] = File(...),
+    top_k: int = Form(0),
+    layout: str = Form("objects")
+):
+    """
+    批量识别多张图片，结果以 NDJSON 流式返回（每完成一张输出一行，按完成顺序）
+
+    每行: {"index": 上传顺序, "filename", "success", "face_count", "faces"}，失败时为 {"index", "success": false, "detail"}；
+    不返回结果图片。最多同时处理 BATCH_DETECT_CONCURRENCY 张，每张单独计入负载监控
+
+    Args:
+        files: 图片文件（最多 BATCH_MAX_FILES 张）
+        top_k: 大于 0 时为每张人脸返回前 k 个候选人及距离、置信度
+        layout: 人脸列表布局，"objects" 或 "compact"
+    """
+    check_layout(layout)
+    if len(files) > settings.BATCH_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"单次最多 {settings.BATCH_MAX_FILES} 张图片")
+    if not load_monitor.should_admit("upload", settings.STREAM_SHED_QUEUE_DEPTH, settings.ADMISSION_MAX_QUEUE_DEPTH):
+        raise HTTPException(status_code=503, detail="服务器繁忙，请稍后再试", headers={"Retry-After": "1"})
+    uploads = [(index, file.filename, await file.read()) for index, file in enumerate(files)]
+    semaphore = asyncio.Semaphore(max(1, settings.BATCH_DETECT_CONCURRENCY))
+
+    async def process(index: int, filename: str, data: bytes) -> dict:
+        async with semaphore:
+            try:
+                with load_monitor.track("upload"):
+                    image_array = await run_in_threadpool(decode_image, data)
+                    detector = get_face_detector()
+                    face_locations = await run_in_threadpool(profiled, detector.locate_faces, image_array)
+                    face_locations, face_encodings = await run_in_threadpool(
+                        profiled, detector.encode_faces, image_array, face_locations
+                    )
+                    matches = await run_in_threadpool(
+                        profiled, detector.match_encodings, face_encodings, clamp_top_k(top_k)
+                    )
+                    face_names = detector.names_from_matches(matches)
+            except ValueError as e:
+                return {"index": index, "filename": filename, "success": False, "detail": str(e)}
+            except Exception as e:
+                logger.error(f"批量识别第 {index} 张图片时出错: {e}")
+                return {"index": index, "filename": filename, "success": False, "detail": f"处理失败: {str(e)}"}
+        return {
+            "index": index, "filename": filename, "success": True, "face_count": len(face_locations),
+            **shape_faces(face_locations, face_names, matches if top_k > 0 else None, layout)
+        }
+
+    async def results():
+        tasks = [asyncio.ensure_future(process(*upload)) for upload in uploads]
         try:
-            image = Image.open(io.BytesIO(img_bytes)).convert("RGB")
-            image_array = np.array(image)
-        except Exception:
-            raise HTTPException(status_code=400, detail="无法读取图片数据")
+            for task in asyncio.as_completed(tasks):
+                yield dumps(await task) + b"\n"
+        finally:
+            # 客户端提前断开时取消未开始的图片
+            for task in tasks:
+                task.cancel()
 
-        # 获取人脸检测器
-        detector = get_face_detector()
+    return StreamingResponse(results(), media_type="application/x-ndjson")
 
-        # 检测人脸
-        face_locations, face_names = detector.detect_faces(image_array)
 
-        # 返回结果（不返回图片，减少数据传输量）
-        return JSONResponse({
-            "success": True,
-            "face_count": len(face_locations),
-            "faces": [
-                {
-                    "name": name,
-                    "location": {
-                        "top": top,
-                        "right": right,
-                        "bottom": bottom,
-                        "left": left
-                    }
-                }
-                for (top, right, bottom, left), name in zip(face_locations, face_names)
-            ]
-        })
+def spool_video(upload: UploadFile) -> Tuple[str, bool]:
+    """
+    取得上传视频的文件路径（解码器需要文件路径）
+
+    上传的视频已由 Starlette 接收到临时文件中：Linux 上直接通过 /proc/<pid>/fd 使用该文件
+    （按时间分段处理的子进程和 ffmpeg 也能打开），不再复制；其他系统分块复制到临时文件
+
+    Args:
+        upload: 上传的视频，处理完成前不能关闭
+
+    Returns:
+        (文件路径, 是否为复制出的临时文件，用完后需要删除)
+
+    Raises:
+        ValueError: 超过 VIDEO_MAX_BYTES（未带 Content-Length 的上传只能在接收完成后判断）
+    """
+    if upload.size is not None and upload.size > settings.VIDEO_MAX_BYTES:
+        raise ValueError(f"视频超过 {settings.VIDEO_MAX_BYTES // 1024 // 1024} MB")
+    source = upload.file
+    # 内存中的小文件在 fileno() 时写入磁盘
+    path = f"/proc/{os.getpid()}/fd/{source.fileno()}"
+    if os.path.exists(path):
+        return path, False
+
+    source.seek(0)
+    suffix = Path(upload.filename or "").suffix[:10] or ".mp4"
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as target:
+        written = 0
+        while True:
+            chunk = source.read(1024 * 1024)
+            if not chunk:
+                break
+            written += len(chunk)
+            if written > settings.VIDEO_MAX_BYTES:
+                target.close()
+                os.unlink(target.name)
+                raise ValueError(f"视频超过 {settings.VIDEO_MAX_BYTES // 1024 // 1024} MB")
+            target.write(chunk)
+    return target.name, True
+
 
+@app.post("/api/detect_video")
+async def detect_faces_video(
+    file: UploadFile = File(...),
+    sample_fps: float = Form(settings.VIDEO_SAMPLE_FPS),
+    scene_threshold: float = Form(settings.VIDEO_SCENE_THRESHOLD)
+):
+    """
+    识别视频文件中出现的人（监控录像等）
+
+    按 sample_fps 抽帧检测（场景变化时额外检测），同一个人的连续出现合并为一条轨迹，
+    每条轨迹只提取少量几次特征，按多数投票确定身份
+
+    Args:
+        file: 视频文件
+        sample_fps: 每秒检测的帧数
+        scene_threshold: 场景变化阈值（0~1）
+
+    Returns:
+        JSON 响应，包含每条轨迹的人名、时间段，以及每个人出现的时间段汇总
+    """
+    if not 0 < sample_fps <= 30:
+        raise HTTPException(status_code=400, detail="sample_fps 应在 0~30 之间")
+    if not 0 <= scene_threshold <= 1:
+        raise HTTPException(status_code=400, detail="scene_threshold 应在 0~1 之间")
+
+    try:
+        path, spooled = await run_in_threadpool(spool_video, file)
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    options = VideoOptions(
+        sample_fps=sample_fps,
+        scan_fps=settings.VIDEO_SCAN_FPS,
+        scene_threshold=scene_threshold,
+        max_width=settings.VIDEO_MAX_WIDTH,
+        track_samples=settings.VIDEO_TRACK_SAMPLES,
+        model_type=settings.FACE_MODEL
+    )
+    try:
+        detector = get_face_detector()
+        result = await run_in_threadpool(
+            process_video, path, detector, options,
+            settings.VIDEO_WORKERS, settings.VIDEO_MIN_SEGMENT_SECONDS
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"无法读取视频: {str(e)}")
     except Exception as e:
-        logger.error(f"检测视频流时出错: {str(e)}")
+        logger.error(f"识别视频时出错: {str(e)}")
         raise HTTPException(status_code=500, detail=f"处理失败: {str(e)}")
+    finally:
+        if spooled:
+            os.unlink(path)
+
+    return FastJSONResponse({"success": True, **result})
+
+
+class MatchRequest(BaseModel):
+    """特征向量检索请求"""
+    embeddings: List[Union[str, List[float]]]  # base64 字符串或浮点数列表
+    dtype: str = "float32"  # base64 数据的精度
+    top_k: int = 5
+
+
+@app.post("/api/match")
+async def match_embeddings(request: MatchRequest):
+    """
+    直接用特征向量检索已知人脸（跳过图片解码和人脸检测）
+
+    Args:
+        request: 特征向量列表、精度和候选数量
+
+    Returns:
+        JSON 响应，每个特征向量的候选人及距离
+    """
+    try:
+        queries = decode_embeddings(request.embeddings, request.dtype)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    detector = get_face_detector()
+    matches = await run_in_threadpool(detector.match_encodings, queries, clamp_top_k(request.top_k))
+
+    return JSONResponse({
+        "success": True,
+        "results": [
+            {
+                "matches": [
+                    {"name": name, "distance": round(distance, 6), "confidence": round(confidence, 4)}
+                    for name, distance, confidence in candidates
+                ]
+            }
+            for candidates in matches
+        ]
+    })
 
 
 @app.post("/api/add_face")
 async def add_known_face(
     name: str = Form(...),
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    idempotency_key: Optional[str] = Header(None)
 ):
     """
-    添加新的已知人脸
+    添加新的已知人脸（加入注册队列，立即返回任务 ID）
 
     Args:
         name: 人名
         file: 人脸图片
+        idempotency_key: Idempotency-Key 请求头（可选），重试时返回同一个任务
 
     Returns:
-        JSON 响应
+        JSON 响应，包含任务 ID，进度通过 /api/jobs/{job_id} 查询
     """
+    contents = await file.read()
+    if len(contents) > settings.MAX_IMAGE_SIZE:
+        raise HTTPException(status_code=413, detail="图片文件过大")
+
+    # 只校验图片格式，人脸检测和特征提取在后台完成
     try:
-        # 读取上传的图片
-        contents = await file.read()
-        
-        # 使用 Pillow 读取图片
-        try:
-            image = Image.open(io.BytesIO(contents)).convert("RGB")
-            image_array = np.array(image)
-        except Exception:
-            raise HTTPException(status_code=400, detail="无法读取图片")
+        Image.open(io.BytesIO(contents))
+    except Exception:
+        raise HTTPException(status_code=400, detail="无法读取图片")
 
-        # 获取人脸检测器
-        detector = get_face_detector()
+    try:
+        job_id = await run_in_threadpool(
+            enrollment_queue.submit, [(name, contents)], "single", idempotency_key
+        )
+    except Exception as e:
+        logger.error(f"添加人脸时出错: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"处理失败: {str(e)}")
 
-        # 保存路径
-        save_path = None
-        if settings.STORAGE_TYPE == "local":
-            save_path = f"models/known_faces/{name}.jpg"
+    return JSONResponse({
+        "success": True,
+        "job_id": job_id,
+        "message": f"已提交人脸注册: {name}"
+    }, status_code=202)
 
-        # 添加人脸
-        success = detector.add_known_face(image_array, name, save_path)
 
-        if success:
-            return JSONResponse({
-                "success": True,
-                "message": f"成功添加人脸: {name}",
-                "total_known_faces": len(detector.known_face_names)
-            })
-        else:
-            raise HTTPException(status_code=400, detail="图片中未检测到人脸")
+def read_bulk_archive(archive) -> List[tuple]:
+    """
+    读取批量导入的压缩包，文件名（不含扩展名）作为人名
+
+    Args:
+        archive: zip 文件对象
+
+    Returns:
+        [(人名, 图片数据), ...]
+    """
+    items = []
+    with zipfile.ZipFile(archive) as zf:
+        for info in zf.infolist():
+            path = Path(info.filename)
+            if info.is_dir() or "__MACOSX" in path.parts or path.name.startswith("."):
+                continue
+            if path.suffix.lower() not in (".jpg", ".jpeg", ".png"):
+                continue
+            if info.file_size > settings.MAX_IMAGE_SIZE:
+                logger.warning(f"跳过过大的图片: {info.filename}")
+                continue
+            if len(items) >= settings.ENROLL_MAX_BULK_FILES:
+                raise ValueError(f"压缩包中的图片超过 {settings.ENROLL_MAX_BULK_FILES} 张")
+            items.append((path.stem, zf.read(info)))
+    return items
 
+
+@app.post("/api/add_faces_bulk")
+async def add_known_faces_bulk(
+    file: UploadFile = File(...),
+    idempotency_key: Optional[str] = Header(None)
+):
+    """
+    批量导入已知人脸（zip 压缩包，每个文件为 人名.jpg）
+
+    Args:
+        file: zip 压缩包
+        idempotency_key: Idempotency-Key 请求头（可选），重试时返回同一个任务
+
+    Returns:
+        JSON 响应，包含任务 ID 和图片数量
+    """
+    try:
+        items = await run_in_threadpool(read_bulk_archive, file.file)
+    except (zipfile.BadZipFile, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"无法读取压缩包: {str(e)}")
+    if not items:
+        raise HTTPException(status_code=400, detail="压缩包中没有图片")
+
+    try:
+        job_id = await run_in_threadpool(enrollment_queue.submit, items, "bulk", idempotency_key)
     except Exception as e:
-        logger.error(f"添加人脸时出错: {str(e)}")
+        logger.error(f"批量导入人脸时出错: {str(e)}")
         raise HTTPException(status_code=500, detail=f"处理失败: {str(e)}")
 
+    return JSONResponse({
+        "success": True,
+        "job_id": job_id,
+        "total": len(items),
+        "message": f"已提交 {len(items)} 张人脸图片"
+    }, status_code=202)
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """
+    查询注册任务进度
+
+    Args:
+        job_id: 任务 ID
+
+    Returns:
+        JSON 响应，包含各状态的图片数量、进度和失败原因
+    """
+    status = await run_in_threadpool(enrollment_queue.job_status, job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return JSONResponse({"success": True, **status})
+
 
 @app.get("/api/known_faces")
 async def get_known_faces():
@@ -251,24 +1166,293 @@ async def get_known_faces():
         JSON 响应，包含已知人脸名称列表
     """
     try:
-        detector = get_face_detector()
+        # 分片模式下需要请求所有分片，在线程池中执行
+        names = await run_in_threadpool(list_known_faces)
         return JSONResponse({
             "success": True,
-            "known_faces": detector.known_face_names,
-            "total": len(detector.known_face_names)
+            "known_faces": names,
+            "total": len(names)
         })
     except Exception as e:
         logger.error(f"获取已知人脸列表时出错: {str(e)}")
         raise HTTPException(status_code=500, detail=f"处理失败: {str(e)}")
 
 
+@app.get("/api/crops/{crop_id}")
+async def list_crops(crop_id: str, x_admin_token: Optional[str] = Header(None)):
+    """
+    获取一次检测请求保存的人脸截图列表（需要 X-Admin-Token）
+
+    Args:
+        crop_id: 截图 ID（/api/detect 响应中的 crops_url）
+
+    Returns:
+        每张人脸的序号、识别结果、截图尺寸和图片地址
+    """
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="需要管理员令牌")
+    crops = await run_in_threadpool(crop_store.crops, crop_id) if crop_store is not None else None
+    if crops is None:
+        raise HTTPException(status_code=404, detail="截图不存在或已被淘汰")
+    for crop in crops:
+        crop["url"] = f"/api/crops/{crop_id}/{crop['index']}"
+    return {"crop_id": crop_id, "crops": crops}
+
+
+@app.get("/api/crops/{crop_id}/{index}")
+async def get_crop(crop_id: str, index: int, x_admin_token: Optional[str] = Header(None)):
+    """获取单张人脸截图（需要 X-Admin-Token）"""
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="需要管理员令牌")
+    path = crop_store.path(crop_id, index) if crop_store is not None else None
+    if path is None:
+        raise HTTPException(status_code=404, detail="截图不存在或已被淘汰")
+    return FileResponse(path, media_type=f"image/{crop_store.image_format}")
+
+
+def parse_time(value: Optional[str]) -> Optional[float]:
+    """解析查询参数中的时间：Unix 时间戳或 ISO 8601（不带时区时按服务器本地时间）"""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"无法解析时间: {value}")
+
+
+@app.get("/api/events")
+async def list_events(
+    name: Optional[str] = None,
+    camera: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    limit: int = 1000,
+    x_admin_token: Optional[str] = Header(None)
+):
+    """
+    查询识别事件（需要 X-Admin-Token）
+
+    Args:
+        name: 人名（可选）
+        camera: 摄像头 ID（可选）
+        start: 起始时间（含），Unix 时间戳或 ISO 8601，如 2024-09-02T08:00:00
+        end: 结束时间（不含）
+        limit: 最多返回的事件数
+
+    Returns:
+        按时间升序的事件列表
+    """
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="需要管理员令牌")
+    if event_log is None:
+        raise HTTPException(status_code=404, detail="未启用识别事件记录 (EVENT_LOG_ENABLED)")
+    events = await run_in_threadpool(event_log.query, name, camera, parse_time(start), parse_time(end), limit)
+    return {"count": len(events), "events": events}
+
+
+@app.get("/api/events/summary")
+async def events_summary(
+    camera: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    x_admin_token: Optional[str] = Header(None)
+):
+    """时间范围内每个人的首次、末次出现时间和记录次数（考勤汇总，需要 X-Admin-Token）"""
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="需要管理员令牌")
+    if event_log is None:
+        raise HTTPException(status_code=404, detail="未启用识别事件记录 (EVENT_LOG_ENABLED)")
+    people = await run_in_threadpool(event_log.summary, camera, parse_time(start), parse_time(end))
+    return {"count": len(people), "people": people}
+
+
+@app.get("/metrics")
+async def metrics():
+    """负载指标端点"""
+    snapshot = load_monitor.snapshot()
+    if is_face_detector_ready() and get_face_detector().shards is not None:
+        snapshot["shards"] = get_face_detector().shards.stats()
+    if crop_store is not None:
+        snapshot["crops_dropped"] = crop_store.dropped
+    if event_log is not None:
+        snapshot["events_written"] = event_log.written
+        snapshot["events_dropped"] = event_log.dropped
+    snapshot["warmup"] = warmup_state
+    return snapshot
+
+
+def write_snapshot(since: int, base: Optional[str]) -> Tuple[str, dict]:
+    """导出人脸库快照到临时文件，返回 (文件路径, 元数据)"""
+    detector = get_face_detector()
+    if detector.shards is not None:
+        raise SnapshotError("分片模式下人脸库保存在各分片中，请在分片服务上导出快照", conflict=True)
+    fd, path = tempfile.mkstemp(suffix=".npz")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            meta = export_snapshot(detector.gallery, f, detector.model_type, since, base)
+    except Exception:
+        os.unlink(path)
+        raise
+    return path, meta
+
+
+def import_snapshot(source) -> dict:
+    """导入人脸库快照并保存特征缓存"""
+    snapshot = read_snapshot(source)
+    detector = get_face_detector()
+    if snapshot.is_delta:
+        # 增量快照以共享缓存的最新内容为基准（包括其他 worker 注册的人脸）
+        sync_gallery_cache()
+    detector.apply_snapshot(snapshot)
+    sync_gallery_cache(replace=not snapshot.is_delta)
+    return snapshot.meta
+
+
+@app.get("/admin/gallery")
+async def admin_gallery_state(x_admin_token: Optional[str] = Header(None)):
+    """人脸库状态：人脸数量和校验和（增量同步时作为基准，需要 X-Admin-Token）"""
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="需要管理员令牌")
+    detector = get_face_detector()
+    if detector.shards is not None:
+        raise HTTPException(status_code=409, detail="分片模式下人脸库保存在各分片中")
+    gallery = detector.gallery
+    count = len(gallery)
+    checksum = await run_in_threadpool(gallery_checksum, gallery, count)
+    return {"count": count, "checksum": checksum, "model_type": detector.model_type,
+            "storage": settings.GALLERY_STORAGE}
+
+
+@app.get("/admin/gallery/snapshot")
+async def admin_export_snapshot(
+    since: int = 0,
+    base: Optional[str] = None,
+    x_admin_token: Optional[str] = Header(None)
+):
+    """
+    导出人脸库快照（需要 X-Admin-Token）
+
+    Args:
+        since: 大于 0 时导出增量快照，只包含第 since 个之后注册的人脸
+        base: 接收方前 since 个人脸的校验和，与本节点不一致时返回 409（需要全量快照）
+
+    Returns:
+        快照文件（.npz），响应头附带人脸数量和校验和
+    """
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="需要管理员令牌")
+    try:
+        path, meta = await run_in_threadpool(write_snapshot, since, base)
+    except SnapshotError as e:
+        raise HTTPException(status_code=409 if e.conflict else 400, detail=str(e))
+    headers = {"X-Gallery-Count": str(meta["count"]), "X-Gallery-Checksum": meta["checksum"]}
+    return FileResponse(
+        path,
+        media_type="application/octet-stream",
+        filename=f"gallery-{meta['kind']}-{meta['count']}.npz",
+        headers=headers,
+        background=BackgroundTask(os.unlink, path)
+    )
+
+
+@app.post("/admin/gallery/snapshot")
+async def admin_import_snapshot(file: UploadFile = File(...), x_admin_token: Optional[str] = Header(None)):
+    """
+    导入人脸库快照（需要 X-Admin-Token）
+
+    全量快照替换当前人脸库，增量快照追加到末尾（本节点状态必须等于快照的基准，否则返回 409）。
+    只更新处理该请求的 worker，其他 worker 重启后从特征缓存加载
+
+    Returns:
+        导入后的人脸数量和校验和
+    """
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="需要管理员令牌")
+    try:
+        meta = await run_in_threadpool(import_snapshot, file.file)
+    except SnapshotError as e:
+        raise HTTPException(status_code=409 if e.conflict else 400, detail=str(e))
+    logger.info(f"已导入人脸库{'增量' if meta['kind'] == 'delta' else '全量'}快照，共 {meta['count']} 个人脸")
+    return {"success": True, "kind": meta["kind"], "count": meta["count"], "checksum": meta["checksum"]}
+
+
+@app.post("/admin/profile")
+async def admin_profile(
+    seconds: float = 10.0,
+    mode: str = "sampling",
+    output: str = "",
+    interval_ms: float = 5.0,
+    x_admin_token: Optional[str] = Header(None)
+):
+    """
+    对当前 worker 进行限时性能分析（需要 X-Admin-Token）
+
+    Args:
+        seconds: 分析时长（最长 PROFILE_MAX_SECONDS 秒）
+        mode: "sampling" 采样所有线程的调用栈；"cprofile" 对识别路径做确定性分析
+        output: sampling 模式固定为折叠栈文本；cprofile 模式为 "pstats"（二进制，默认）或 "text"
+        interval_ms: 采样间隔（sampling 模式）
+
+    Returns:
+        折叠栈文本（flamegraph.pl / speedscope）或 pstats 数据
+    """
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="需要管理员令牌")
+    if mode not in ("sampling", "cprofile"):
+        raise HTTPException(status_code=400, detail=f"不支持的分析模式: {mode}")
+
+    session = start_session(mode, max(interval_ms, 1.0))
+    if session is None:
+        raise HTTPException(status_code=409, detail="已有性能分析正在进行")
+    try:
+        await asyncio.sleep(min(max(seconds, 0.1), settings.PROFILE_MAX_SECONDS))
+    finally:
+        await run_in_threadpool(stop_session, session)
+
+    headers = {"X-Profile-Samples": str(session.samples), "X-Profile-Worker": str(os.getpid())}
+    if mode == "sampling":
+        return PlainTextResponse(session.collapsed(), headers=headers)
+    if output == "text":
+        return PlainTextResponse(session.pstats_text(), headers=headers)
+    headers["Content-Disposition"] = f'attachment; filename="profile-{os.getpid()}.pstats"'
+    return Response(session.pstats_dump(), media_type="application/octet-stream", headers=headers)
+
+
+def list_known_faces() -> List[str]:
+    """已知人脸的人名列表"""
+    return list(get_face_detector().known_face_names)
+
+
+def known_faces_count() -> int:
+    """已知人脸数量（分片模式下读取各分片的人脸数，带缓存）"""
+    return get_face_detector().known_face_count
+
+
 @app.get("/health")
 async def health_check():
-    """健康检查端点"""
-    detector = get_face_detector()
+    """健康检查端点（存活检查，不触发模型加载）"""
+    ready = is_face_detector_ready()
     return {
         "status": "healthy",
-        "known_faces_count": len(detector.known_face_names)
+        "ready": ready,
+        "known_faces_count": await run_in_threadpool(known_faces_count) if ready else 0
+    }
+
+
+@app.get("/ready")
+async def readiness_check():
+    """就绪检查端点：模型和人脸库加载并预热完成后返回 200，否则返回 503"""
+    if warming_up():
+        return JSONResponse({"status": "warming_up" if is_face_detector_ready() else "loading"}, status_code=503)
+    if not is_face_detector_ready():
+        return JSONResponse({"status": "loading"}, status_code=503)
+    return {
+        "status": "ready",
+        "known_faces_count": await run_in_threadpool(known_faces_count)
     }
 
 
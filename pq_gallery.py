@@ -0,0 +1,405 @@
+"""
+乘积量化（PQ）人脸库模块
+面向百万级人脸库的内存受限部署：
+
+- 128 维特征切分为 m 个子空间，每个子空间用 256 个聚类中心量化，
+  每张人脸在内存中只占 m 字节（m=16 时为 float64 的 1/64）
+- 检索时先用非对称距离（ADC，查询向量不量化，查表求和）筛出候选，
+  再从磁盘上内存映射的 float32 原始向量中读取候选行精确重排序
+- 原始向量文件只追加写入，新注册的人脸不会改写已映射的页；多个 worker 共用时用 sync
+  加锁合并，从文件当前的行数开始追加，从不截断其他进程正在映射的文件
+
+文件格式（由特征缓存路径派生）:
+    face_encodings.pq.npz       码本、编码、人名
+    face_encodings.vectors.f32  float32 原始向量（按行连续存放）
+"""
+import mmap
+import time
+import uuid
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from gallery import FaceGallery, atomic_write, cache_lock, file_stamp, merge_top_k
+
+# 训练码本时最多使用的样本数（每个聚类中心约 64 个样本已足够）
+PQ_TRAIN_SAMPLES = 16384
+PQ_TRAIN_ITERATIONS = 15
+
+
+def pq_paths(cache_file: str) -> Tuple[Path, Path]:
+    """由特征缓存路径得到 PQ 索引文件和原始向量文件的路径"""
+    path = Path(cache_file)
+    stem = path.with_suffix("")
+    return stem.with_name(stem.name + ".pq.npz"), stem.with_name(stem.name + ".vectors.f32")
+
+
+def _squared_distances(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """计算每个样本到每个聚类中心的平方距离 (n, k)"""
+    return (
+        np.einsum("ij,ij->i", x, x)[:, None]
+        - 2.0 * (x @ centroids.T)
+        + np.einsum("ij,ij->i", centroids, centroids)[None, :]
+    )
+
+
+def train_codebooks(vectors: np.ndarray, subspaces: int, seed: int = 0) -> np.ndarray:
+    """
+    用 k-means 为每个子空间训练码本
+
+    Args:
+        vectors: 训练样本 (N, dim)
+        subspaces: 子空间数量（需整除 dim）
+        seed: 随机种子
+
+    Returns:
+        码本 (subspaces, ksub, dim / subspaces)，ksub 最多 256
+    """
+    n, dim = vectors.shape
+    if dim % subspaces != 0:
+        raise ValueError(f"特征维度 {dim} 不能被子空间数量 {subspaces} 整除")
+    rng = np.random.default_rng(seed)
+    if n > PQ_TRAIN_SAMPLES:
+        vectors = vectors[np.sort(rng.choice(n, PQ_TRAIN_SAMPLES, replace=False))]
+        n = PQ_TRAIN_SAMPLES
+    vectors = np.asarray(vectors, dtype=np.float32)
+
+    ksub = min(256, n)
+    dsub = dim // subspaces
+    codebooks = np.empty((subspaces, ksub, dsub), dtype=np.float32)
+    for j in range(subspaces):
+        x = vectors[:, j * dsub:(j + 1) * dsub]
+        centroids = x[rng.choice(n, ksub, replace=False)].copy()
+        for _ in range(PQ_TRAIN_ITERATIONS):
+            assign = np.argmin(_squared_distances(x, centroids), axis=1)
+            counts = np.bincount(assign, minlength=ksub)
+            sums = np.stack([np.bincount(assign, weights=x[:, d], minlength=ksub) for d in range(dsub)], axis=1)
+            # 空簇保留原中心
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+        codebooks[j] = centroids
+    return codebooks
+
+
+def encode_vectors(vectors: np.ndarray, codebooks: np.ndarray, block_rows: int = 65536) -> np.ndarray:
+    """
+    将特征向量量化为 PQ 编码
+
+    Args:
+        vectors: 特征向量 (N, dim)
+        codebooks: 码本 (m, ksub, dsub)
+
+    Returns:
+        编码 (N, m)，uint8
+    """
+    m, _, dsub = codebooks.shape
+    codes = np.empty((len(vectors), m), dtype=np.uint8)
+    for start in range(0, len(vectors), block_rows):
+        block = np.asarray(vectors[start:start + block_rows], dtype=np.float32)
+        for j in range(m):
+            sub = block[:, j * dsub:(j + 1) * dsub]
+            codes[start:start + len(block), j] = np.argmin(_squared_distances(sub, codebooks[j]), axis=1)
+    return codes
+
+
+class PQGallery:
+    """乘积量化人脸库（内存中只保存 PQ 编码，原始向量内存映射在磁盘上）"""
+
+    def __init__(
+        self,
+        names: List[str],
+        codebooks: np.ndarray,
+        codes: np.ndarray,
+        vectors: np.ndarray,
+        vectors_file: Optional[Path] = None,
+        rerank: int = 64
+    ):
+        """
+        Args:
+            names: 人名列表
+            codebooks: 码本 (m, ksub, dsub)
+            codes: PQ 编码 (N, m)
+            vectors: 原始向量 (N, dim)，通常是内存映射数组
+            vectors_file: 原始向量文件（用于追加新注册的人脸）
+            rerank: 精确重排序的候选数量
+        """
+        self.dim = codebooks.shape[0] * codebooks.shape[2]
+        self.names = list(names)
+        self.codebooks = codebooks
+        self.rerank = rerank
+        self.vectors_file = vectors_file
+        self._codes = codes
+        self._vectors = vectors
+        # 加载后新注册的人脸：PQ 编码追加到 _codes，原始向量先放在内存中，保存时追加写入文件
+        self._extra = FaceGallery(self.dim, dtype="float32")
+        self._count = len(names)
+        # 与 PQ 文件的同步状态，含义同 FaceGallery._cache_state
+        self._cache_state: Optional[tuple] = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def encodings(self) -> np.ndarray:
+        """全部原始向量 (N, dim)。有新注册的人脸时会拼接出一份内存拷贝，只用于离线处理"""
+        base = self._vectors
+        if len(self._extra) == 0:
+            return base
+        return np.vstack([base, self._extra.encodings])
+
+    @property
+    def codes(self) -> np.ndarray:
+        """PQ 编码 (N, m)"""
+        return self._codes[:self._count]
+
+    @property
+    def memory_bytes(self) -> int:
+        """常驻内存的字节数（码本 + 编码 + 新注册的原始向量，不含内存映射文件）"""
+        return self.codebooks.nbytes + self._codes[:self._count].nbytes + self._extra.encodings.nbytes
+
+    def _vector_rows(self, indices: np.ndarray) -> np.ndarray:
+        """读取指定行的原始向量（索引升序读取内存映射，减少随机访问）"""
+        base_count = len(self._vectors)
+        rows = np.empty((len(indices), self.dim), dtype=np.float64)
+        in_base = indices < base_count
+        rows[in_base] = self._vectors[indices[in_base]]
+        if not in_base.all():
+            rows[~in_base] = self._extra.encodings[indices[~in_base] - base_count]
+        return rows
+
+    def add(self, name: str, encoding: np.ndarray):
+        """添加一个人脸"""
+        self.add_many([name], encoding)
+
+    def add_many(self, names: Iterable[str], encodings: np.ndarray):
+        """批量添加人脸（用已有码本量化，不重新训练）"""
+        names = list(names)
+        encodings = np.asarray(encodings, dtype=np.float64).reshape(-1, self.dim)
+        if len(names) != len(encodings):
+            raise ValueError("人名数量与特征向量数量不一致")
+        codes = encode_vectors(encodings, self.codebooks)
+        end = self._count + len(names)
+        if end > len(self._codes):
+            grown = np.empty((max(end, len(self._codes) * 2, 64), self._codes.shape[1]), dtype=np.uint8)
+            grown[:self._count] = self._codes[:self._count]
+            self._codes = grown
+        self._codes[self._count:end] = codes
+        self._extra.add_many(names, encodings)
+        # 先追加人名再增加计数，并发检索不会越界
+        self.names.extend(names)
+        self._count = end
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        检索每个查询向量的前 k 个最近邻：ADC 粗排 + 原始向量精确重排序
+
+        Args:
+            queries: 查询特征向量 (M, dim)
+            k: 每个查询返回的数量
+
+        Returns:
+            (索引 (M, k), 距离 (M, k))，按精确距离升序
+        """
+        count = self._count
+        codes = self._codes[:count]
+        queries = np.asarray(queries, dtype=np.float64).reshape(-1, self.dim)
+        k = min(k, count)
+        if k <= 0 or len(queries) == 0:
+            return np.empty((len(queries), 0), dtype=np.int64), np.empty((len(queries), 0))
+
+        m, _, dsub = self.codebooks.shape
+        shortlist_size = min(max(k, self.rerank), count)
+        all_indices = np.empty((len(queries), k), dtype=np.int64)
+        all_distances = np.empty((len(queries), k))
+        for qi, query in enumerate(queries.astype(np.float32)):
+            # 距离表：查询的每个子向量到该子空间每个聚类中心的平方距离 (m, ksub)
+            table = ((self.codebooks - query.reshape(m, 1, dsub)) ** 2).sum(axis=2)
+            approx = np.zeros(count, dtype=np.float32)
+            for j in range(m):
+                approx += table[j, codes[:, j]]
+
+            if shortlist_size < count:
+                shortlist = np.argpartition(approx, shortlist_size - 1)[:shortlist_size]
+            else:
+                shortlist = np.arange(count)
+            shortlist.sort()
+            exact = np.linalg.norm(self._vector_rows(shortlist) - queries[qi], axis=1)
+            indices, distances = merge_top_k(shortlist[None, :], exact[None, :], k)
+            all_indices[qi], all_distances[qi] = indices[0], distances[0]
+        return all_indices, all_distances
+
+    def nearest(self, encoding: np.ndarray) -> Optional[Tuple[int, float]]:
+        """查找与特征向量最接近的已知人脸，人脸库为空时返回 None"""
+        indices, distances = self.search(np.asarray(encoding)[None, :], 1)
+        if indices.shape[1] == 0:
+            return None
+        return int(indices[0, 0]), float(distances[0, 0])
+
+    def compact(self):
+        """释放编码缓冲区的预留空间"""
+        if len(self._codes) != self._count:
+            self._codes = np.ascontiguousarray(self._codes[:self._count])
+
+    def prefetch(self) -> int:
+        """
+        顺序读取一遍内存映射的原始向量（每个内存页读一个数），预热页缓存，
+        启动后的首批重排序不再随机读磁盘
+
+        Returns:
+            预读的字节数
+        """
+        rows_per_page = max(1, mmap.PAGESIZE // (self.dim * self._vectors.dtype.itemsize))
+        if len(self._vectors):
+            np.asarray(self._vectors[::rows_per_page, 0]).max()
+        return self._vectors.nbytes
+
+    def save(self, cache_file: str, model_type: str = "hog", count: Optional[int] = None):
+        """
+        整体写出 PQ 文件（向量文件和索引文件都先写临时文件再替换，正在映射旧文件的进程不受影响）
+
+        其他 worker 下次 sync 时会重新加载；只追加新增人脸时用 sync
+
+        Args:
+            cache_file: 特征缓存路径（PQ 文件路径由它派生）
+            model_type: 生成特征时使用的检测模型
+            count: 只保存前 count 个人脸（规则同 FaceGallery.save），默认保存全部
+        """
+        index_file, _ = pq_paths(cache_file)
+        with cache_lock(index_file):
+            self._write_full(cache_file, model_type, count)
+
+    def _write_full(self, cache_file: str, model_type: str, count: Optional[int] = None):
+        index_file, vectors_file = pq_paths(cache_file)
+        if count is None:
+            count = self._count
+        extra = self._extra.encodings[:count - len(self._vectors)]
+        vectors_file.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write(vectors_file, lambda f: (
+            np.asarray(self._vectors, dtype="<f4").tofile(f), np.asarray(extra, dtype="<f4").tofile(f)
+        ))
+        self.vectors_file = vectors_file
+        generation = uuid.uuid4().hex
+        self._write_index(index_file, self._codes[:count], self.names[:count], model_type, generation)
+        self._cache_state = (generation, count, count, file_stamp(index_file))
+
+    def _write_index(self, index_file: Path, codes: np.ndarray, names: List[str], model_type: str, generation: str):
+        atomic_write(index_file, lambda f: np.savez(
+            f,
+            codebooks=self.codebooks,
+            codes=codes,
+            names=np.array(names),
+            count=len(names),
+            model_type=model_type,
+            generation=generation,
+            saved_at=time.time()
+        ))
+
+    def sync(self, cache_file: str, model_type: str = "hog") -> "PQGallery":
+        """
+        与多个 worker 共用的 PQ 文件合并（加文件锁，规则同 FaceGallery.sync）
+
+        本进程新增的原始向量从向量文件当前的行数开始写入，不截断文件；
+        其他 worker 追加的人脸从向量文件读取后用同一码本量化加入本进程人脸库
+
+        Args:
+            cache_file: 特征缓存路径（PQ 文件路径由它派生）
+            model_type: 生成特征时使用的检测模型
+
+        Returns:
+            同步后的人脸库：只有追加时为 self，需要按文件内容重建时为新加载的对象
+        """
+        index_file, vectors_file = pq_paths(cache_file)
+        state = self._cache_state
+        if state is not None and state[2] == self._count and state[3] == file_stamp(index_file):
+            return self
+
+        with cache_lock(index_file):
+            count = self._count
+            if not index_file.exists() or not vectors_file.exists():
+                self._write_full(cache_file, model_type)
+                return self
+
+            with np.load(index_file) as data:
+                generation = str(data["generation"]) if "generation" in data else None
+                file_codes = data["codes"]
+                names = data["names"].tolist()
+
+            replaced = state is None or state[0] != generation or state[1] > len(names)
+            # 本进程人脸库不是从该文件加载时与文件来源相同，不再追加
+            synced = count if state is None else state[2]
+            pending_names = self.names[synced:count]
+            pending = self._vector_rows(np.arange(synced, count))
+            if not replaced and len(names) == state[1]:
+                gallery = self
+            elif not replaced and not pending_names:
+                gallery = self
+                new_rows = np.memmap(
+                    vectors_file, dtype="<f4", mode="r",
+                    offset=state[1] * self.dim * 4, shape=(len(names) - state[1], self.dim)
+                )
+                gallery.add_many(names[state[1]:], np.array(new_rows))
+            else:
+                # 两边都有新增或文件被整体替换：重新加载文件，再追加本进程新增的人脸
+                gallery = PQGallery.load(cache_file, self.rerank)
+                gallery.add_many(pending_names, pending)
+
+            if pending_names:
+                # 从文件中已有的行数开始写入（覆盖上次中断写入的残留），不截断文件
+                with open(vectors_file, 'r+b') as f:
+                    f.seek(len(names) * self.dim * 4)
+                    np.asarray(pending, dtype="<f4").tofile(f)
+                codes = np.vstack([file_codes[:len(names)], encode_vectors(pending, gallery.codebooks)])
+                gallery._write_index(index_file, codes, names + pending_names, model_type, generation)
+            gallery._cache_state = (generation, len(gallery), len(gallery), file_stamp(index_file))
+            return gallery
+
+    @classmethod
+    def build(cls, gallery: FaceGallery, cache_file: str, subspaces: int = 16, rerank: int = 64) -> "PQGallery":
+        """
+        从人脸库训练码本、量化并写出 PQ 文件，返回内存映射原始向量的 PQ 人脸库
+
+        Args:
+            gallery: 全精度人脸库
+            cache_file: 特征缓存路径（PQ 文件路径由它派生）
+            subspaces: 子空间数量
+            rerank: 精确重排序的候选数量
+        """
+        encodings = gallery.encodings
+        codebooks = train_codebooks(encodings, subspaces)
+        codes = encode_vectors(encodings, codebooks)
+        built = cls(gallery.names, codebooks, codes, encodings.astype(np.float32), rerank=rerank)
+        built.save(cache_file)
+        return cls.load(cache_file, rerank)
+
+    @classmethod
+    def load(cls, cache_file: str, rerank: int = 64) -> Optional["PQGallery"]:
+        """
+        加载 PQ 人脸库（原始向量以只读方式内存映射）
+
+        Args:
+            cache_file: 特征缓存路径（PQ 文件路径由它派生）
+            rerank: 精确重排序的候选数量
+
+        Returns:
+            PQ 人脸库，文件不存在时返回 None
+        """
+        index_file, vectors_file = pq_paths(cache_file)
+        if not index_file.exists() or not vectors_file.exists():
+            return None
+        with np.load(index_file) as data:
+            codebooks = data["codebooks"]
+            codes = data["codes"]
+            names = data["names"].tolist()
+            count = int(data["count"])
+            generation = str(data["generation"]) if "generation" in data else None
+        stamp = file_stamp(index_file)
+
+        dim = codebooks.shape[0] * codebooks.shape[2]
+        if count == 0:
+            vectors = np.empty((0, dim), dtype=np.float32)
+        else:
+            vectors = np.memmap(vectors_file, dtype="<f4", mode="r", shape=(count, dim))
+        gallery = cls(names, codebooks, codes, vectors, vectors_file, rerank)
+        gallery._cache_state = (generation, count, count, stamp)
+        return gallery
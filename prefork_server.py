@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+预先 fork 的多 worker 服务
+
+master 进程先加载 dlib 模型（检测器、关键点模型、ResNet 编码模型）和人脸库，
+再 fork 出多个 worker 共享同一个监听端口。模型和人脸库所在的内存页由所有 worker
+写时复制共享；fork 前调用 gc.freeze()，避免垃圾回收改写对象头导致共享页被复制。
+每增加一个 worker 只需要很少的额外内存。
+
+使用方法:
+    python prefork_server.py --port 8001 --workers 4
+
+仅支持 Linux / macOS（依赖 os.fork）。
+"""
+
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+from config import settings
+from log_config import setup_logging
+
+# worker 由 fork 产生，log_config 会在子进程中重新启动写日志线程
+setup_logging(settings.LOG_LEVEL, settings.LOG_FORMAT, settings.LOG_DIR if settings.LOG_TO_FILE else None)
+logger = logging.getLogger("prefork")
+
+
+def preload():
+    """在 master 进程中加载模型和人脸库"""
+    import face_recognition  # noqa: F401  导入即加载全部 dlib 模型
+    from face_detector import get_face_detector
+
+    start = time.time()
+    detector = get_face_detector()
+    # 去掉缓冲区的预留空间，fork 后所有 worker 共享同一块紧凑的特征矩阵
+    detector.gallery.compact()
+    logger.info(f"已在 master 中加载 {len(detector.known_face_names)} 个已知人脸，耗时 {time.time() - start:.1f} 秒")
+
+
+def read_memory_kb(pid: int) -> dict:
+    """读取进程内存统计（Rss/Pss/私有页），单位 KB，仅 Linux 可用"""
+    stats = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("Rss", "Pss", "Private_Clean", "Private_Dirty", "Shared_Clean", "Shared_Dirty"):
+                    stats[key] = int(value.split()[0])
+    except OSError:
+        pass
+    return stats
+
+
+def create_socket(host: str, port: int) -> socket.socket:
+    """创建所有 worker 共享的监听套接字"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock: socket.socket, log_level: str):
+    """worker 进程：在共享套接字上运行 uvicorn"""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    # 日志已由 log_config 配置，不使用 uvicorn 默认的日志配置
+    config = uvicorn.Config(app, log_level=log_level, log_config=None)
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+
+
+def spawn_worker(app, sock: socket.socket, log_level: str) -> int:
+    """fork 一个 worker，返回其 pid"""
+    pid = os.fork()
+    if pid == 0:
+        try:
+            run_worker(app, sock, log_level)
+        finally:
+            os._exit(0)
+    return pid
+
+
+def report_memory(pids):
+    """打印 master 与各 worker 的内存占用"""
+    master = read_memory_kb(os.getpid())
+    if not master:
+        return
+    logger.info(f"master: Rss={master.get('Rss', 0) / 1024:.1f} MB")
+    for pid in pids:
+        stats = read_memory_kb(pid)
+        private = stats.get("Private_Clean", 0) + stats.get("Private_Dirty", 0)
+        logger.info(
+            f"worker {pid}: Rss={stats.get('Rss', 0) / 1024:.1f} MB, "
+            f"Pss={stats.get('Pss', 0) / 1024:.1f} MB, 私有={private / 1024:.1f} MB"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="预先 fork 的多 worker 人脸识别服务")
+    parser.add_argument("--host", default=settings.API_HOST, help=f"监听地址（默认: {settings.API_HOST}）")
+    parser.add_argument("--port", type=int, default=settings.API_PORT, help=f"监听端口（默认: {settings.API_PORT}）")
+    parser.add_argument("--workers", type=int, default=settings.API_WORKERS,
+                        help=f"worker 数量（默认: {settings.API_WORKERS}）")
+    parser.add_argument("--log-level", default="info", help="uvicorn 日志级别")
+    args = parser.parse_args()
+
+    if not hasattr(os, "fork"):
+        print("❌ 错误: 当前平台不支持 fork，请直接使用 uvicorn 启动")
+        sys.exit(1)
+
+    from main import app
+
+    preload()
+
+    # 把 fork 前的所有对象移入永久代，fork 后垃圾回收不再扫描/改写它们
+    gc.collect()
+    gc.freeze()
+
+    sock = create_socket(args.host, args.port)
+    logger.info(f"监听 {args.host}:{args.port}，启动 {args.workers} 个 worker")
+
+    workers = set()
+    for _ in range(args.workers):
+        workers.add(spawn_worker(app, sock, args.log_level))
+
+    stopping = False
+
+    def handle_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, handle_stop)
+
+    time.sleep(2)
+    report_memory(workers)
+
+    # 监控 worker，异常退出时重新 fork（仍共享 master 中已加载的模型）
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        workers.discard(pid)
+        if not stopping:
+            logger.warning(f"worker {pid} 退出（状态 {status}），重新启动")
+            workers.add(spawn_worker(app, sock, args.log_level))
+
+    sock.close()
+    logger.info("所有 worker 已退出")
+
+
+if __name__ == "__main__":
+    main()
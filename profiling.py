@@ -0,0 +1,202 @@
+"""
+性能分析模块
+- ProfileSession: 在运行中的 worker 上按需开启限时性能分析，无需重启
+  - sampling: 定时采样所有线程的调用栈，输出折叠栈格式（flamegraph.pl / speedscope 可直接读取）
+  - cprofile: 对识别路径上的调用做确定性分析，合并后输出 pstats 数据
+    （同一时间只能有一个 cProfile 分析器，并发的调用中只分析一个，其余照常执行）
+- RequestTrace: 单个请求各阶段耗时（解码、检测、编码、比对、绘制）
+"""
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import sys
+import sysconfig
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+# 线程空闲等待时的栈顶函数，采样时跳过（线程池空闲线程、事件循环等待）
+IDLE_FUNCTIONS = {"wait", "select", "poll", "get", "acquire", "accept", "_wait_for_tstate_lock"}
+_STDLIB_DIR = sysconfig.get_paths()["stdlib"]
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class ProfileSession:
+    """限时性能分析会话（同一时间只允许一个）"""
+
+    def __init__(self, mode: str = "sampling", interval_ms: float = 5.0):
+        """
+        Args:
+            mode: "sampling"（采样调用栈）或 "cprofile"（确定性分析识别路径）
+            interval_ms: 采样间隔
+        """
+        if mode not in ("sampling", "cprofile"):
+            raise ValueError(f"不支持的分析模式: {mode}")
+        self.mode = mode
+        self.interval = interval_ms / 1000
+        self.samples = 0
+        self._stacks: Counter = Counter()
+        self._stats: Optional[pstats.Stats] = None
+        self._lock = threading.Lock()
+        self._profiling = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------
+    # 采样
+    # ------------------------------------------------------------------
+
+    def _sample_loop(self):
+        own_id = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if frame.f_code.co_name in IDLE_FUNCTIONS and frame.f_code.co_filename.startswith(_STDLIB_DIR):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self._stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    # ------------------------------------------------------------------
+    # 确定性分析
+    # ------------------------------------------------------------------
+
+    def run(self, func: Callable, *args, **kwargs):
+        """
+        在 cProfile 下执行一次调用，结果合并到本次会话
+
+        Python 3.12 起同时启用两个分析器会抛出 ValueError，因此其他线程正在分析、
+        或分析器无法启用（如调试器、coverage 正在运行）时直接执行，不影响请求
+        """
+        if self.mode != "cprofile" or self._stopped.is_set():
+            return func(*args, **kwargs)
+        if not self._profiling.acquire(blocking=False):
+            return func(*args, **kwargs)
+        try:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                return func(*args, **kwargs)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.disable()
+                with self._lock:
+                    if self._stats is None:
+                        self._stats = pstats.Stats(profiler)
+                    else:
+                        self._stats.add(profiler)
+                    self.samples += 1
+        finally:
+            self._profiling.release()
+
+    # ------------------------------------------------------------------
+    # 控制与输出
+    # ------------------------------------------------------------------
+
+    def start(self):
+        if self.mode == "sampling":
+            self._thread = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def collapsed(self) -> str:
+        """折叠栈文本，每行 "帧;帧;帧 次数" """
+        return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+    def pstats_dump(self) -> bytes:
+        """pstats 二进制数据（可用 pstats.Stats / snakeviz 打开）"""
+        with self._lock:
+            return marshal.dumps(self._stats.stats) if self._stats is not None else marshal.dumps({})
+
+    def pstats_text(self, limit: int = 50) -> str:
+        """按累计耗时排序的 pstats 文本"""
+        with self._lock:
+            if self._stats is None:
+                return "分析期间没有识别请求\n"
+            out = io.StringIO()
+            self._stats.stream = out
+            self._stats.sort_stats("cumulative").print_stats(limit)
+            return out.getvalue()
+
+
+_active_session: Optional[ProfileSession] = None
+_session_lock = threading.Lock()
+
+
+def start_session(mode: str, interval_ms: float = 5.0) -> Optional[ProfileSession]:
+    """开始分析会话，已有会话在运行时返回 None"""
+    global _active_session
+    with _session_lock:
+        if _active_session is not None:
+            return None
+        _active_session = ProfileSession(mode, interval_ms)
+        _active_session.start()
+        return _active_session
+
+
+def stop_session(session: ProfileSession):
+    """结束分析会话"""
+    global _active_session
+    session.stop()
+    with _session_lock:
+        if _active_session is session:
+            _active_session = None
+
+
+def profiled(func: Callable, *args, **kwargs):
+    """执行识别路径上的调用；cProfile 会话进行中时对本次调用做分析"""
+    session = _active_session
+    if session is None:
+        return func(*args, **kwargs)
+    return session.run(func, *args, **kwargs)
+
+
+class RequestTrace:
+    """记录单个请求各阶段的耗时（毫秒）"""
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.stages: Dict[str, float] = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        """记录一个阶段的耗时，同名阶段累加"""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    def summary(self) -> Dict[str, float]:
+        """各阶段耗时及总耗时"""
+        result = {name: round(ms, 3) for name, ms in self.stages.items()}
+        result["total"] = round((time.perf_counter() - self._start) * 1000, 3)
+        return result
+
+    def server_timing(self) -> str:
+        """Server-Timing 响应头（浏览器开发者工具可直接显示）"""
+        return ", ".join(f"{name};dur={ms}" for name, ms in self.summary().items())
@@ -79,11 +79,11 @@ def main():
         print("✗ 添加失败！")
         print("=" * 50)
         print()
-        print("原因: 图片中未检测到人脸")
+        print("原因见上方提示（未检测到人脸、多人照片、人脸过小、过于模糊或已注册）")
         print()
         print("请确保照片满足以下要求:")
         print("  ✓ 真实人脸照片（不是卡通、动漫）")
-        print("  ✓ 正面照片")
+        print("  ✓ 单人正面照片")
         print("  ✓ 清晰度高")
         print("  ✓ 光线充足")
         print("  ✓ 无遮挡")
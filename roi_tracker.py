@@ -0,0 +1,147 @@
+"""
+视频流感兴趣区域（ROI）检测模块
+视频流相邻帧之间人脸位置变化很小，大部分帧只需在上一帧人脸框附近检测，
+每隔若干帧或某个区域丢失人脸时再做一次全图检测
+"""
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+Box = Tuple[int, int, int, int]  # (top, right, bottom, left)
+
+
+class _StreamState:
+    """单个视频流的跟踪状态"""
+
+    __slots__ = ("boxes", "shape", "frames_since_full")
+
+    def __init__(self):
+        self.boxes: List[Box] = []
+        self.shape: Optional[Tuple[int, int]] = None
+        self.frames_since_full = 0
+
+
+def expand_box(box: Box, ratio: float, height: int, width: int) -> Box:
+    """按比例向四周扩展人脸框，并裁剪到图片范围内"""
+    top, right, bottom, left = box
+    pad_y = int((bottom - top) * ratio)
+    pad_x = int((right - left) * ratio)
+    return (
+        max(0, top - pad_y),
+        min(width, right + pad_x),
+        min(height, bottom + pad_y),
+        max(0, left - pad_x),
+    )
+
+
+def merge_regions(regions: List[Box]) -> List[Box]:
+    """
+    合并相互重叠的区域，避免同一张人脸在多个区域中被重复检测
+
+    合并后的区域变大，可能与之前已比较过的区域重叠，因此重复合并直到没有重叠
+    """
+    merged: List[Box] = sorted(regions, key=lambda r: (r[3], r[0]))
+    changed = True
+    while changed:
+        changed = False
+        pending, merged = merged, []
+        for region in pending:
+            for i, other in enumerate(merged):
+                if (region[3] < other[1] and other[3] < region[1] and
+                        region[0] < other[2] and other[0] < region[2]):
+                    merged[i] = (
+                        min(region[0], other[0]),
+                        max(region[1], other[1]),
+                        max(region[2], other[2]),
+                        min(region[3], other[3]),
+                    )
+                    changed = True
+                    break
+            else:
+                merged.append(region)
+    return merged
+
+
+class StreamROITracker:
+    """按视频流记录上一帧的人脸框，只在其扩展区域内检测人脸"""
+
+    def __init__(self, full_scan_interval: int = 10, expand_ratio: float = 0.5, max_streams: int = 1000):
+        """
+        Args:
+            full_scan_interval: 每隔多少帧强制做一次全图检测
+            expand_ratio: 人脸框向四周扩展的比例（相对人脸框宽高）
+            max_streams: 最多同时跟踪的视频流数量，超出后淘汰最久未活动的流
+        """
+        self.full_scan_interval = full_scan_interval
+        self.expand_ratio = expand_ratio
+        self.max_streams = max_streams
+        self._streams: "OrderedDict[str, _StreamState]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_state(self, stream_id: str) -> _StreamState:
+        with self._lock:
+            state = self._streams.get(stream_id)
+            if state is None:
+                state = _StreamState()
+                self._streams[stream_id] = state
+                while len(self._streams) > self.max_streams:
+                    self._streams.popitem(last=False)
+            else:
+                self._streams.move_to_end(stream_id)
+            return state
+
+    def locate_faces(self, stream_id: str, image: np.ndarray, locate) -> List[Box]:
+        """
+        定位当前帧中的人脸
+
+        Args:
+            stream_id: 视频流标识
+            image: 当前帧（RGB numpy array）
+            locate: 人脸定位函数，接收图片返回人脸框列表
+
+        Returns:
+            人脸位置列表 [(top, right, bottom, left), ...]
+        """
+        height, width = image.shape[:2]
+        state = self._get_state(stream_id)
+
+        face_locations = None
+        if (state.boxes and state.shape == (height, width) and
+                state.frames_since_full < self.full_scan_interval):
+            face_locations = self._locate_in_regions(image, state.boxes, locate)
+
+        if face_locations is None:
+            # 全图检测：到达间隔、分辨率变化、上一帧无人脸或某个区域丢失人脸
+            face_locations = locate(image)
+            state.frames_since_full = 0
+        else:
+            state.frames_since_full += 1
+
+        state.boxes = list(face_locations)
+        state.shape = (height, width)
+        return face_locations
+
+    def _locate_in_regions(self, image: np.ndarray, boxes: List[Box], locate) -> Optional[List[Box]]:
+        """在上一帧人脸框的扩展区域内检测，任一区域丢失人脸时返回 None"""
+        height, width = image.shape[:2]
+        regions = merge_regions([
+            expand_box(box, self.expand_ratio, height, width) for box in boxes
+        ])
+
+        face_locations: List[Box] = []
+        for top, right, bottom, left in regions:
+            # 区域内上一帧的人脸数量（按人脸框中心点归属）
+            expected = sum(
+                1 for t, r, b, l in boxes
+                if top <= (t + b) // 2 < bottom and left <= (l + r) // 2 < right
+            )
+            found = locate(np.ascontiguousarray(image[top:bottom, left:right]))
+            if len(found) < max(expected, 1):
+                return None
+            face_locations.extend(
+                (t + top, r + left, b + top, l + left) for t, r, b, l in found
+            )
+        return face_locations
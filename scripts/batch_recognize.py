@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+离线批量人脸识别脚本
+
+功能：
+1. 递归扫描图片目录，或从文件列表读取图片路径
+2. 读取线程预读图片文件，进程池并行解码、定位人脸并提取特征
+3. 主进程按批与人脸库比对（与服务使用同一个特征缓存 / PQ 索引 / 分片清单）
+4. 结果写为 CSV、JSONL 或 Parquet（每张人脸一行，没有人脸或处理失败的图片也各占一行）
+5. 断点续跑：已写出结果的图片记录在检查点文件中，中断后重新运行会跳过这些图片
+6. 输出处理进度和吞吐量
+
+使用方法：
+    python -m scripts.batch_recognize photos/ --output results.csv
+    python -m scripts.batch_recognize --list files.txt --output results.jsonl --workers 8
+"""
+
+import os
+import sys
+import csv
+import io
+import json
+import time
+import queue
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import numpy as np
+
+# 导入配置
+from config import settings
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+FIELDS = ["path", "face_index", "name", "distance", "confidence", "top", "right", "bottom", "left", "error"]
+
+# 工作进程中的人脸检测器（不加载人脸库，只做定位和特征提取）
+_worker_detector = None
+
+
+def iter_image_paths(inputs: List[str], list_file: Optional[str]) -> Iterator[str]:
+    """
+    列出待处理的图片路径
+
+    Args:
+        inputs: 图片文件或目录（目录递归扫描）
+        list_file: 文件列表（每行一个路径，可选）
+
+    Returns:
+        图片路径迭代器（目录内按路径排序，保证多次运行顺序一致）
+    """
+    if list_file:
+        with open(list_file, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    yield line
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for file in sorted(files):
+                    if Path(file).suffix.lower() in IMAGE_EXTENSIONS:
+                        yield os.path.join(root, file)
+        else:
+            yield str(path)
+
+
+def _init_worker(model_type: str):
+    global _worker_detector
+    from face_detector import FaceDetector
+
+    _worker_detector = FaceDetector(model_type=model_type)
+
+
+def process_image(path: str, data: bytes) -> Dict:
+    """
+    在工作进程中解码图片、定位人脸并提取特征
+
+    Args:
+        path: 图片路径
+        data: 图片文件内容
+
+    Returns:
+        {"path", "locations", "encodings", "error"}
+    """
+    from PIL import Image
+
+    try:
+        image = np.array(Image.open(io.BytesIO(data)).convert("RGB"))
+        locations = _worker_detector.locate_faces(image)
+        locations, encodings = _worker_detector.encode_faces(image, locations)
+        encodings = np.asarray(encodings, dtype=np.float64).reshape(-1, 128)
+        return {"path": path, "locations": [tuple(box) for box in locations], "encodings": encodings, "error": ""}
+    except Exception as e:
+        return {"path": path, "locations": [], "encodings": np.empty((0, 128)), "error": str(e)}
+
+
+def start_reader(paths: Iterator[str], prefetch: int) -> "queue.Queue":
+    """
+    读取线程：提前读入图片文件内容，文件 I/O 与识别并行
+
+    队列元素为 (路径, 文件内容或 None, 错误信息)，结束时放入 None
+    """
+    files: queue.Queue = queue.Queue(maxsize=prefetch)
+
+    def read_loop():
+        for path in paths:
+            try:
+                with open(path, "rb") as f:
+                    files.put((path, f.read(), ""))
+            except OSError as e:
+                files.put((path, None, str(e)))
+        files.put(None)
+
+    threading.Thread(target=read_loop, name="reader", daemon=True).start()
+    return files
+
+
+class ResultWriter:
+    """按格式写出识别结果，每批写完后刷新到磁盘"""
+
+    def __init__(self, output: str, fmt: str, append: bool):
+        self.fmt = fmt
+        self.output = output
+        self._file = None
+        self._csv = None
+        self._parquet = None
+
+        if fmt == "parquet":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise RuntimeError("写出 Parquet 需要安装 pyarrow: pip install pyarrow")
+            if append and Path(output).exists():
+                # Parquet 文件不能追加，续跑时写到新的分片文件
+                stem, n = Path(output).with_suffix(""), 1
+                while Path(f"{stem}.{n}.parquet").exists():
+                    n += 1
+                self.output = f"{stem}.{n}.parquet"
+            return
+
+        exists = append and Path(output).exists() and Path(output).stat().st_size > 0
+        self._file = open(output, "a" if append else "w", encoding="utf-8", newline="")
+        if fmt == "csv":
+            self._csv = csv.DictWriter(self._file, fieldnames=FIELDS)
+            if not exists:
+                self._csv.writeheader()
+
+    def write(self, rows: List[Dict]):
+        if self.fmt == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pylist(rows, schema=pa.schema([
+                ("path", pa.string()), ("face_index", pa.int32()), ("name", pa.string()),
+                ("distance", pa.float64()), ("confidence", pa.float64()),
+                ("top", pa.int32()), ("right", pa.int32()), ("bottom", pa.int32()), ("left", pa.int32()),
+                ("error", pa.string())
+            ]))
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(self.output, table.schema)
+            self._parquet.write_table(table)
+            return
+        if self.fmt == "csv":
+            self._csv.writerows(rows)
+        else:
+            for row in rows:
+                self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._parquet is not None:
+            self._parquet.close()
+        if self._file is not None:
+            self._file.close()
+
+
+def load_checkpoint(checkpoint_file: str) -> Set[str]:
+    """读取已完成的图片路径"""
+    if not Path(checkpoint_file).exists():
+        return set()
+    with open(checkpoint_file, encoding="utf-8") as f:
+        return {line.rstrip("\n") for line in f if line.strip()}
+
+
+def result_rows(result: Dict, matches: List, tolerance: float) -> List[Dict]:
+    """将一张图片的识别结果展开为输出行"""
+    empty = {"face_index": -1, "name": "", "distance": None, "confidence": None,
+             "top": None, "right": None, "bottom": None, "left": None}
+    if result["error"] or not result["locations"]:
+        return [{"path": result["path"], **empty, "error": result["error"]}]
+    rows = []
+    for index, ((top, right, bottom, left), candidates) in enumerate(zip(result["locations"], matches)):
+        name, distance, confidence = candidates[0] if candidates else ("Unknown", None, None)
+        if distance is not None and distance > tolerance:
+            name = "Unknown"
+        rows.append({
+            "path": result["path"], "face_index": index, "name": name,
+            "distance": round(distance, 6) if distance is not None else None,
+            "confidence": round(confidence, 4) if confidence is not None else None,
+            "top": top, "right": right, "bottom": bottom, "left": left, "error": ""
+        })
+    return rows
+
+
+def batch_recognize(
+    inputs: List[str],
+    output: str,
+    list_file: Optional[str] = None,
+    fmt: Optional[str] = None,
+    workers: int = 4,
+    batch_size: int = 64,
+    prefetch: int = 64,
+    model_type: str = "hog",
+    restart: bool = False
+) -> Dict[str, float]:
+    """
+    批量识别图片并写出结果
+
+    Args:
+        inputs: 图片文件或目录
+        output: 输出文件
+        list_file: 图片路径列表文件（可选）
+        fmt: 输出格式 csv / jsonl / parquet（默认按输出文件扩展名判断）
+        workers: 识别进程数
+        batch_size: 每批比对和写出的图片数
+        prefetch: 预读的图片数量
+        model_type: 人脸检测模型
+        restart: 忽略检查点，从头开始
+
+    Returns:
+        统计信息
+    """
+    from face_detector import FaceDetector
+
+    fmt = fmt or {".csv": "csv", ".parquet": "parquet"}.get(Path(output).suffix.lower(), "jsonl")
+    checkpoint_file = output + ".checkpoint"
+    if restart:
+        Path(checkpoint_file).unlink(missing_ok=True)
+    done = load_checkpoint(checkpoint_file)
+    if done:
+        print(f"♻️  从检查点继续，跳过 {len(done)} 张已完成的图片")
+
+    # 与服务相同的人脸库加载逻辑（特征缓存 / PQ 索引 / 分片）
+    detector = FaceDetector(model_type=model_type)
+    detector.load_known_faces(settings.KNOWN_FACES_DIR)
+    print(f"✓ 已加载 {len(detector.known_face_names)} 个已知人脸")
+
+    Path(output).parent.mkdir(parents=True, exist_ok=True)
+    writer = ResultWriter(output, fmt, append=bool(done))
+    checkpoint = open(checkpoint_file, "a", encoding="utf-8")
+    paths = (path for path in iter_image_paths(inputs, list_file) if path not in done)
+    files = start_reader(paths, prefetch)
+
+    stats = {"images": 0, "faces": 0, "errors": 0}
+    pending: List[Dict] = []
+    start = last_report = time.time()
+
+    def flush():
+        """整批比对（一次矩阵运算），写出结果后再记录检查点"""
+        nonlocal pending, last_report
+        encodings = [result["encodings"] for result in pending]
+        matches = detector.match_encodings(np.vstack(encodings), top_k=1) if encodings else []
+        rows, offset = [], 0
+        for result in pending:
+            count = len(result["encodings"])
+            rows.extend(result_rows(result, matches[offset:offset + count], detector.tolerance))
+            offset += count
+            stats["images"] += 1
+            stats["faces"] += count
+            stats["errors"] += bool(result["error"])
+        writer.write(rows)
+        checkpoint.write("".join(result["path"] + "\n" for result in pending))
+        checkpoint.flush()
+        pending = []
+
+        now = time.time()
+        if now - last_report >= 5:
+            last_report = now
+            print(f"  已处理 {stats['images']} 张图片，{stats['faces']} 张人脸，"
+                  f"{stats['images'] / (now - start):.1f} 张/秒")
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                             initargs=(model_type,)) as pool:
+        in_flight = set()
+        finished = False
+        try:
+            while not finished or in_flight:
+                # 保持进程池满载，同时限制在途任务数量
+                while not finished and len(in_flight) < workers * 2:
+                    item = files.get()
+                    if item is None:
+                        finished = True
+                        break
+                    path, data, error = item
+                    if data is None:
+                        pending.append({"path": path, "locations": [], "encodings": np.empty((0, 128)),
+                                        "error": error})
+                        continue
+                    in_flight.add(pool.submit(process_image, path, data))
+                if in_flight:
+                    completed, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    pending.extend(future.result() for future in completed)
+                if len(pending) >= batch_size:
+                    flush()
+            if pending:
+                flush()
+        finally:
+            writer.close()
+            checkpoint.close()
+
+    elapsed = time.time() - start
+    stats["seconds"] = round(elapsed, 2)
+    stats["images_per_second"] = round(stats["images"] / elapsed, 2) if elapsed > 0 else 0.0
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='离线批量人脸识别脚本',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例:
+  # 识别目录中的所有图片（递归），输出 CSV
+  python -m scripts.batch_recognize photos/ --output results.csv
+
+  # 从文件列表读取，8 个进程，输出 JSONL
+  python -m scripts.batch_recognize --list files.txt --output results.jsonl --workers 8
+
+  # 输出 Parquet（需要 pyarrow）
+  python -m scripts.batch_recognize photos/ --output results.parquet
+
+中断后使用相同参数重新运行即从检查点（<output>.checkpoint）继续，--restart 从头开始。
+        """
+    )
+    parser.add_argument('inputs', nargs='*', help='图片文件或目录（目录递归扫描）')
+    parser.add_argument('--list', dest='list_file', help='图片路径列表文件（每行一个）')
+    parser.add_argument('--output', required=True, help='输出文件（.csv / .jsonl / .parquet）')
+    parser.add_argument('--format', choices=['csv', 'jsonl', 'parquet'], help='输出格式（默认按扩展名判断）')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='识别进程数（默认: CPU 核数）')
+    parser.add_argument('--batch-size', type=int, default=64, help='每批比对和写出的图片数（默认: 64）')
+    parser.add_argument('--prefetch', type=int, default=64, help='预读的图片数量（默认: 64）')
+    parser.add_argument('--model', choices=['hog', 'cnn'], default=settings.FACE_MODEL,
+                        help=f'人脸检测模型（默认: {settings.FACE_MODEL}）')
+    parser.add_argument('--restart', action='store_true', help='忽略检查点，从头开始')
+    args = parser.parse_args()
+
+    if not args.inputs and not args.list_file:
+        parser.error("请指定图片目录或 --list 文件列表")
+
+    try:
+        stats = batch_recognize(
+            inputs=args.inputs,
+            output=args.output,
+            list_file=args.list_file,
+            fmt=args.format,
+            workers=max(1, args.workers),
+            batch_size=max(1, args.batch_size),
+            prefetch=max(1, args.prefetch),
+            model_type=args.model,
+            restart=args.restart
+        )
+    except RuntimeError as e:
+        print(f"❌ 错误: {e}")
+        sys.exit(1)
+
+    print(f"\n{'='*50}")
+    print("✅ 批量识别完成")
+    print(f"{'='*50}")
+    print(f"  图片: {stats['images']} 张（失败 {stats['errors']} 张）")
+    print(f"  人脸: {stats['faces']} 张")
+    print(f"  耗时: {stats['seconds']} 秒（{stats['images_per_second']} 张/秒）")
+    print(f"  结果文件: {args.output}")
+    print(f"{'='*50}\n")
+
+    sys.exit(0 if stats['errors'] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+人脸库压缩脚本
+
+功能：
+1. 读取特征缓存文件
+2. 找出近似重复的人脸（距离小于阈值）
+3. 同一人的重复人脸只保留最具代表性的一张（与同组其他人脸距离之和最小）
+4. 不同人名之间的重复只列出，需人工确认后处理
+5. 写回缓存文件（原文件备份为 .bak）
+
+人脸库越小，每次比对越快，误识别也越少。
+
+使用方法：
+    python scripts/compact_gallery.py
+    python scripts/compact_gallery.py --threshold 0.25 --dry-run
+
+压缩后需要重启服务才会加载新的人脸库。
+"""
+
+import sys
+import shutil
+import argparse
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import numpy as np
+
+# 导入配置
+from config import settings
+from gallery import FaceGallery
+
+
+def medoid(encodings: np.ndarray) -> int:
+    """返回与其他特征距离之和最小的特征的下标"""
+    distances = np.linalg.norm(encodings[:, None, :] - encodings[None, :, :], axis=2)
+    return int(np.argmin(distances.sum(axis=1)))
+
+
+def plan_compaction(gallery: FaceGallery, threshold: float) -> Tuple[List[int], List[Dict]]:
+    """
+    计算需要删除的重复人脸
+
+    Args:
+        gallery: 人脸库
+        threshold: 判定为重复的最大距离
+
+    Returns:
+        (要删除的索引列表, 跨人名重复组列表)
+    """
+    removed = []
+    conflicts = []
+    for group in gallery.duplicate_groups(threshold):
+        by_name: Dict[str, List[int]] = {}
+        for index in group:
+            by_name.setdefault(gallery.names[index], []).append(index)
+
+        for name, indices in by_name.items():
+            if len(indices) > 1:
+                keep = indices[medoid(gallery.encodings[indices])]
+                removed.extend(i for i in indices if i != keep)
+
+        if len(by_name) > 1:
+            conflicts.append({name: len(indices) for name, indices in by_name.items()})
+
+    return sorted(removed), conflicts
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='人脸库压缩脚本（合并近似重复的人脸）',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例:
+  # 使用默认配置
+  python scripts/compact_gallery.py
+
+  # 只查看结果，不写回
+  python scripts/compact_gallery.py --dry-run
+
+  # 使用更严格的重复阈值
+  python scripts/compact_gallery.py --threshold 0.25
+        """
+    )
+
+    parser.add_argument(
+        '--cache',
+        default=settings.FACE_ENCODINGS_CACHE,
+        help=f'特征缓存文件（默认: {settings.FACE_ENCODINGS_CACHE}）'
+    )
+
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=settings.ENROLL_DUPLICATE_DISTANCE,
+        help=f'判定为重复的最大距离（默认: {settings.ENROLL_DUPLICATE_DISTANCE}）'
+    )
+
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help='只输出压缩计划，不修改缓存文件'
+    )
+
+    args = parser.parse_args()
+
+    gallery = FaceGallery.load(args.cache)
+    if gallery is None:
+        print(f"❌ 错误: 缓存文件不存在: {args.cache}")
+        print("   请先运行 python scripts/precompute_encodings.py")
+        sys.exit(1)
+
+    print(f"\n已加载 {len(gallery)} 个人脸，重复阈值 {args.threshold}")
+    removed, conflicts = plan_compaction(gallery, args.threshold)
+
+    if conflicts:
+        print(f"\n⚠️  发现 {len(conflicts)} 组不同人名之间的重复（未自动处理，请人工确认）:")
+        for conflict in conflicts[:50]:
+            print("  " + ", ".join(f"{name}×{count}" for name, count in conflict.items()))
+        if len(conflicts) > 50:
+            print(f"  ... 另有 {len(conflicts) - 50} 组")
+
+    print(f"\n{'='*50}")
+    print(f"  重复人脸: {len(removed)} 个")
+    print(f"  压缩后: {len(gallery) - len(removed)} 个人脸")
+    print(f"{'='*50}\n")
+
+    if not removed:
+        print("✅ 人脸库中没有同一人的重复人脸")
+        return
+    if args.dry_run:
+        print("（--dry-run 模式，未修改缓存文件）")
+        return
+
+    removed_set = set(removed)
+    compacted = gallery.subset(i for i in range(len(gallery)) if i not in removed_set)
+
+    backup = args.cache + '.bak'
+    shutil.copy2(args.cache, backup)
+    compacted.save(args.cache, settings.FACE_MODEL)
+
+    print(f"✅ 已写回缓存文件: {args.cache}")
+    print(f"   原文件备份: {backup}")
+    print("   重启服务后生效")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+视频文件人脸识别脚本
+
+功能：
+1. 流式解码视频文件（OpenCV 或 ffmpeg），按频率抽帧并在场景变化时额外检测
+2. 同一个人的连续出现合并为轨迹，每条轨迹只提取少量几次特征
+3. 长视频按时间分段多进程并行处理
+4. 输出每条轨迹的身份和时间段，以及每个人出现的时间段汇总（JSON）
+
+与服务使用同一个人脸库（特征缓存 / PQ 索引 / 分片清单）。
+
+使用方法：
+    python scripts/detect_video.py clip.mp4
+    python scripts/detect_video.py clip.mp4 --sample-fps 1 --workers 4 --output tracks.json
+"""
+
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+# 导入配置
+from config import settings
+from video import VideoOptions, process_video
+
+
+def format_seconds(seconds: float) -> str:
+    minutes, seconds = divmod(seconds, 60)
+    return f"{int(minutes):02d}:{seconds:05.2f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='视频文件人脸识别脚本',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例:
+  # 每秒检测 2 帧，输出到终端
+  python scripts/detect_video.py clip.mp4
+
+  # 4 个进程并行，结果保存为 JSON
+  python scripts/detect_video.py clip.mp4 --workers 4 --output tracks.json
+        """
+    )
+    parser.add_argument('video', help='视频文件')
+    parser.add_argument('--output', help='结果 JSON 文件（可选）')
+    parser.add_argument('--sample-fps', type=float, default=settings.VIDEO_SAMPLE_FPS,
+                        help=f'每秒检测的帧数（默认: {settings.VIDEO_SAMPLE_FPS}）')
+    parser.add_argument('--scene-threshold', type=float, default=settings.VIDEO_SCENE_THRESHOLD,
+                        help=f'场景变化阈值 0~1（默认: {settings.VIDEO_SCENE_THRESHOLD}）')
+    parser.add_argument('--max-width', type=int, default=settings.VIDEO_MAX_WIDTH,
+                        help=f'检测前缩小到的最大宽度（默认: {settings.VIDEO_MAX_WIDTH}）')
+    parser.add_argument('--workers', type=int, default=settings.VIDEO_WORKERS,
+                        help=f'并行处理的进程数（默认: {settings.VIDEO_WORKERS}）')
+    parser.add_argument('--model', choices=['hog', 'cnn'], default=settings.FACE_MODEL,
+                        help=f'人脸检测模型（默认: {settings.FACE_MODEL}）')
+    args = parser.parse_args()
+
+    if not Path(args.video).exists():
+        print(f"❌ 错误: 文件不存在: {args.video}")
+        sys.exit(1)
+
+    from face_detector import FaceDetector
+
+    detector = FaceDetector(model_type=args.model)
+    detector.load_known_faces(settings.KNOWN_FACES_DIR)
+    print(f"✓ 已加载 {len(detector.known_face_names)} 个已知人脸")
+
+    options = VideoOptions(
+        sample_fps=args.sample_fps,
+        scan_fps=settings.VIDEO_SCAN_FPS,
+        scene_threshold=args.scene_threshold,
+        max_width=args.max_width,
+        track_samples=settings.VIDEO_TRACK_SAMPLES,
+        model_type=args.model
+    )
+    start = time.time()
+    try:
+        result = process_video(args.video, detector, options, args.workers, settings.VIDEO_MIN_SEGMENT_SECONDS)
+    except (ValueError, RuntimeError) as e:
+        print(f"❌ 错误: {e}")
+        sys.exit(1)
+    elapsed = time.time() - start
+
+    duration = result["duration"] or 0
+    print(f"\n{'='*50}")
+    print(f"✅ 识别完成: {len(result['tracks'])} 条轨迹，{len(result['people'])} 个已知人员")
+    print(f"{'='*50}")
+    for person in result["people"]:
+        spans = ", ".join(
+            f"{format_seconds(a['start'])}-{format_seconds(a['end'])}" for a in person["appearances"]
+        )
+        print(f"  {person['name']}: {spans}")
+    unknown = sum(1 for track in result["tracks"] if track["name"] == "Unknown")
+    if unknown:
+        print(f"  未识别轨迹: {unknown} 条")
+    speed = f"，{duration / elapsed:.1f}x 实时" if duration and elapsed > 0 else ""
+    print(f"  视频时长: {format_seconds(duration)}，耗时 {elapsed:.1f} 秒{speed}")
+    print(f"{'='*50}\n")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"结果已保存到: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
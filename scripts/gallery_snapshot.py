@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+人脸库快照脚本
+
+功能：
+1. export: 把本机人脸库（特征缓存 / PQ 索引，与服务加载方式相同）导出为单个快照文件
+2. import: 导入快照文件并写入本机特征缓存（全量快照替换，增量快照追加）
+3. pull:   从运行中的节点拉取快照，已有人脸库时只拉取增量；
+           导入本机特征缓存，或用 --to 直接导入另一个运行中的节点
+
+新节点导入快照后直接加载特征缓存，不需要从图片重新提取特征。
+
+使用方法：
+    python scripts/gallery_snapshot.py export --output gallery.npz
+    python scripts/gallery_snapshot.py import gallery.npz
+    python scripts/gallery_snapshot.py pull --from http://node-a:8000 --token $ADMIN_TOKEN
+
+导入本机特征缓存后需要重启服务才会加载新的人脸库（pull --to 导入运行中的节点时立即生效）。
+"""
+
+import io
+import sys
+import time
+import argparse
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+# 导入配置
+from config import settings
+from snapshot import SnapshotError, export_snapshot, gallery_checksum, read_snapshot
+
+
+def load_local_detector(model: str, load_gallery: bool = True):
+    """创建检测器并按服务相同的方式加载本机人脸库"""
+    from face_detector import FaceDetector
+
+    detector = FaceDetector(model_type=model)
+    if load_gallery:
+        detector.load_known_faces(settings.KNOWN_FACES_DIR)
+        if detector.shards is not None:
+            print("❌ 错误: 分片模式下人脸库保存在各分片中，请在分片服务的特征缓存上操作")
+            sys.exit(1)
+        print(f"✓ 本机人脸库: {len(detector.gallery)} 个人脸")
+    return detector
+
+
+def save_local(detector):
+    detector.gallery.save(settings.FACE_ENCODINGS_CACHE, detector.model_type)
+    print(f"✓ 已写入特征缓存: {settings.FACE_ENCODINGS_CACHE}")
+    if not settings.ENABLE_FACE_CACHE and settings.GALLERY_STORAGE != "pq":
+        print("⚠️  ENABLE_FACE_CACHE=false，服务启动时不会加载特征缓存")
+
+
+def describe(meta) -> str:
+    kind = f"增量快照（{meta['base_count']} → {meta['count']}）" if meta["kind"] == "delta" else "全量快照"
+    return f"{kind}，{meta['count'] - meta['base_count']} 个人脸，校验和 {meta['checksum'][:12]}"
+
+
+def cmd_export(args):
+    detector = load_local_detector(args.model)
+    start = time.time()
+    try:
+        meta = export_snapshot(detector.gallery, args.output, detector.model_type, args.since, args.base)
+    except SnapshotError as e:
+        print(f"❌ 错误: {e}")
+        return 1
+    size = Path(args.output).stat().st_size / 1024 / 1024
+    print(f"✅ 已导出{describe(meta)}")
+    print(f"  文件: {args.output}（{size:.1f} MB，{time.time() - start:.1f} 秒）")
+    return 0
+
+
+def cmd_import(args):
+    start = time.time()
+    try:
+        snapshot = read_snapshot(args.snapshot)
+        print(f"✓ 快照: {describe(snapshot.meta)}（来自 {snapshot.meta['source']}）")
+        # 全量快照不需要先加载本机人脸库
+        detector = load_local_detector(args.model, load_gallery=snapshot.is_delta)
+        detector.apply_snapshot(snapshot)
+    except SnapshotError as e:
+        print(f"❌ 错误: {e}")
+        return 1
+    save_local(detector)
+    print(f"✅ 导入完成: {len(detector.gallery)} 个人脸（{time.time() - start:.1f} 秒）")
+    return 0
+
+
+def cmd_pull(args):
+    import httpx
+
+    headers = {"X-Admin-Token": args.token}
+    source = args.source.rstrip("/")
+    target = args.to.rstrip("/") if args.to else None
+
+    # 接收方当前状态（增量同步的基准）
+    detector = None
+    if args.full:
+        since, base = 0, None
+    elif target:
+        response = httpx.get(f"{target}/admin/gallery", headers=headers, timeout=args.timeout)
+        response.raise_for_status()
+        state = response.json()
+        since, base = state["count"], state["checksum"]
+    else:
+        detector = load_local_detector(args.model)
+        since, base = len(detector.gallery), gallery_checksum(detector.gallery)
+
+    start = time.time()
+    params = {"since": since, "base": base} if since else {}
+    response = httpx.get(f"{source}/admin/gallery/snapshot", params=params, headers=headers, timeout=args.timeout)
+    if response.status_code == 409:
+        print(f"⚠️  {response.json().get('detail')}，改为拉取全量快照")
+        since = 0
+        response = httpx.get(f"{source}/admin/gallery/snapshot", headers=headers, timeout=args.timeout)
+    response.raise_for_status()
+    print(f"✓ 已下载 {len(response.content) / 1024 / 1024:.1f} MB（{time.time() - start:.1f} 秒）")
+
+    if target:
+        result = httpx.post(
+            f"{target}/admin/gallery/snapshot",
+            files={"file": ("gallery.npz", response.content, "application/octet-stream")},
+            headers=headers,
+            timeout=args.timeout
+        )
+        if result.status_code != 200:
+            print(f"❌ 错误: 导入失败 ({result.status_code}): {result.json().get('detail')}")
+            return 1
+        state = result.json()
+        print(f"✅ 已同步到 {target}: {state['count']} 个人脸，校验和 {state['checksum'][:12]}")
+        return 0
+
+    try:
+        snapshot = read_snapshot(io.BytesIO(response.content))
+        print(f"✓ 快照: {describe(snapshot.meta)}")
+        if detector is None or not snapshot.is_delta:
+            detector = load_local_detector(args.model, load_gallery=snapshot.is_delta)
+        detector.apply_snapshot(snapshot)
+    except SnapshotError as e:
+        print(f"❌ 错误: {e}")
+        return 1
+    save_local(detector)
+    print(f"✅ 同步完成: {len(detector.gallery)} 个人脸（{time.time() - start:.1f} 秒）")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='人脸库快照脚本',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例:
+  # 导出本机人脸库
+  python scripts/gallery_snapshot.py export --output gallery.npz
+
+  # 新节点导入快照（写入特征缓存，之后启动服务）
+  python scripts/gallery_snapshot.py import gallery.npz
+
+  # 从运行中的节点增量同步到本机特征缓存
+  python scripts/gallery_snapshot.py pull --from http://node-a:8000 --token $ADMIN_TOKEN
+
+  # 在两个运行中的节点之间增量同步
+  python scripts/gallery_snapshot.py pull --from http://node-a:8000 --to http://node-b:8000 --token $ADMIN_TOKEN
+
+  # 直接导入运行中的节点
+  curl -H "X-Admin-Token: $ADMIN_TOKEN" -F file=@gallery.npz http://node-b:8000/admin/gallery/snapshot
+        """
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export = subparsers.add_parser("export", help="导出本机人脸库快照")
+    export.add_argument('--output', required=True, help='快照文件')
+    export.add_argument('--since', type=int, default=0, help='只导出第 N 个之后的人脸（增量快照）')
+    export.add_argument('--base', help='接收方前 N 个人脸的校验和（可选，用于确认增量基准一致）')
+    export.set_defaults(func=cmd_export)
+
+    imp = subparsers.add_parser("import", help="导入快照到本机特征缓存")
+    imp.add_argument('snapshot', help='快照文件')
+    imp.set_defaults(func=cmd_import)
+
+    pull = subparsers.add_parser("pull", help="从运行中的节点拉取快照")
+    pull.add_argument('--from', dest='source', required=True, help='来源节点地址')
+    pull.add_argument('--to', help='导入到运行中的节点（默认导入本机特征缓存）')
+    pull.add_argument('--token', default=settings.ADMIN_TOKEN, help='管理员令牌（默认: ADMIN_TOKEN）')
+    pull.add_argument('--full', action='store_true', help='拉取全量快照')
+    pull.add_argument('--timeout', type=float, default=300.0, help='请求超时秒数（默认: 300）')
+    pull.set_defaults(func=cmd_pull)
+
+    for sub in (export, imp, pull):
+        sub.add_argument('--model', choices=['hog', 'cnn'], default=settings.FACE_MODEL,
+                         help=f'人脸检测模型（默认: {settings.FACE_MODEL}）')
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
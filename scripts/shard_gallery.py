@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+人脸库分片管理脚本
+
+功能：
+1. assign     将特征缓存按人名划分为 N 个分片，生成分片文件和清单（manifest.json）
+2. rebalance  调整分片数量，只迁移所属分片发生变化的人脸
+3. serve      在本机按清单启动全部分片服务（用于单机部署和测试）
+4. status     查询各分片的人脸数量和响应时间
+
+分片分配使用 rendezvous hashing，与 sharding.shard_for 一致，
+主服务设置 SHARD_MANIFEST 指向清单文件后即通过各分片检索。
+
+使用方法：
+    python scripts/shard_gallery.py assign --shards 4
+    python scripts/shard_gallery.py serve
+    python scripts/shard_gallery.py status
+    python scripts/shard_gallery.py rebalance --shards 6
+
+rebalance 前请先停止分片服务（分片会在新增人脸后自动保存），完成后重新启动。
+"""
+
+import sys
+import json
+import time
+import signal
+import argparse
+import subprocess
+from pathlib import Path
+from typing import Dict, List
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import numpy as np
+
+# 导入配置
+from config import settings
+from gallery import FaceGallery
+from pq_gallery import PQGallery, pq_paths
+from sharding import load_manifest, shard_for
+
+DEFAULT_OUT_DIR = str(Path(settings.CACHE_DIR) / "shards")
+
+
+def shard_entries(shard_ids: List[str], host: str, base_port: int, out_dir: Path) -> List[Dict]:
+    """生成分片清单条目"""
+    return [
+        {
+            "id": shard_id,
+            "url": f"http://{host}:{base_port + i}",
+            "cache": str(out_dir / f"{shard_id}.pkl")
+        }
+        for i, shard_id in enumerate(shard_ids)
+    ]
+
+
+def split_gallery(names: List[str], encodings: np.ndarray, shard_ids: List[str]) -> Dict[str, FaceGallery]:
+    """按人名将人脸分配到各分片"""
+    owners = [shard_for(name, shard_ids) for name in names]
+    shards = {}
+    for shard_id in shard_ids:
+        indices = [i for i, owner in enumerate(owners) if owner == shard_id]
+        gallery = FaceGallery(capacity=len(indices))
+        if indices:
+            gallery.add_many([names[i] for i in indices], encodings[indices])
+        shards[shard_id] = gallery
+    return shards
+
+
+def load_shard(cache_file: str):
+    """读取分片人脸库（PQ 模式下分片服务保存的是 PQ 文件，优先读取）"""
+    pq = PQGallery.load(cache_file)
+    if pq is not None:
+        return list(pq.names), np.asarray(pq.encodings, dtype=np.float64)
+    gallery = FaceGallery.load(cache_file)
+    if gallery is None:
+        return None
+    return list(gallery.names), np.array(gallery.encodings)
+
+
+def write_shards(shards: Dict[str, FaceGallery], entries: List[Dict], manifest_file: Path):
+    """写出分片文件和清单"""
+    manifest_file.parent.mkdir(parents=True, exist_ok=True)
+    for entry in entries:
+        shards[entry["id"]].save(entry["cache"], settings.FACE_MODEL)
+        # 删除旧的 PQ 文件，分片服务启动时按新的分片文件重建
+        for path in pq_paths(entry["cache"]):
+            path.unlink(missing_ok=True)
+    manifest = {"version": 1, "created": time.time(), "shards": entries}
+    manifest_file.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+def print_distribution(shards: Dict[str, FaceGallery]):
+    total = sum(len(g) for g in shards.values())
+    for shard_id, gallery in shards.items():
+        share = len(gallery) / total * 100 if total else 0
+        print(f"  {shard_id}: {len(gallery)} 个人脸 ({share:.1f}%)")
+
+
+def cmd_assign(args):
+    gallery = FaceGallery.load(args.cache)
+    if gallery is None or len(gallery) == 0:
+        print(f"❌ 错误: 缓存文件不存在或为空: {args.cache}")
+        return 1
+
+    out_dir = Path(args.out_dir)
+    shard_ids = [f"shard-{i}" for i in range(args.shards)]
+    entries = shard_entries(shard_ids, args.host, args.base_port, out_dir)
+    shards = split_gallery(list(gallery.names), np.array(gallery.encodings), shard_ids)
+    manifest_file = out_dir / "manifest.json"
+    write_shards(shards, entries, manifest_file)
+
+    print(f"\n✅ 已将 {len(gallery)} 个人脸划分为 {args.shards} 个分片")
+    print_distribution(shards)
+    print(f"\n分片清单: {manifest_file}")
+    print(f"主服务配置: SHARD_MANIFEST={manifest_file}")
+    return 0
+
+
+def cmd_rebalance(args):
+    manifest_file = Path(args.manifest)
+    manifest = load_manifest(str(manifest_file))
+    old_entries = manifest["shards"]
+
+    # 读取所有现有分片，记录每个人脸原来所在的分片
+    names, encodings, old_owner = [], [], []
+    for entry in old_entries:
+        loaded = load_shard(entry["cache"])
+        if loaded is None:
+            print(f"⚠️  分片文件不存在，按空分片处理: {entry['cache']}")
+            continue
+        shard_names, shard_encodings = loaded
+        names.extend(shard_names)
+        encodings.append(shard_encodings)
+        old_owner.extend([entry["id"]] * len(shard_names))
+    encodings = np.vstack(encodings) if encodings else np.empty((0, 128))
+
+    out_dir = manifest_file.parent
+    shard_ids = [f"shard-{i}" for i in range(args.shards)]
+    # 保留原有分片的地址，新增分片顺延端口
+    known = {entry["id"]: entry for entry in old_entries}
+    entries = shard_entries(shard_ids, args.host, args.base_port, out_dir)
+    for entry in entries:
+        if entry["id"] in known:
+            entry["url"] = known[entry["id"]]["url"]
+
+    shards = split_gallery(names, encodings, shard_ids)
+    moved = sum(
+        1 for name, owner in zip(names, old_owner) if shard_for(name, shard_ids) != owner
+    )
+    write_shards(shards, entries, manifest_file)
+
+    # 删除已移除分片的文件
+    for entry in old_entries:
+        if entry["id"] not in shard_ids:
+            for path in (Path(entry["cache"]), *pq_paths(entry["cache"])):
+                path.unlink(missing_ok=True)
+
+    print(f"\n✅ 分片数量 {len(old_entries)} → {args.shards}，迁移 {moved}/{len(names)} 个人脸")
+    print_distribution(shards)
+    print("\n请重新启动分片服务和主服务")
+    return 0
+
+
+def cmd_serve(args):
+    manifest = load_manifest(args.manifest)
+    root = Path(__file__).parent.parent
+    processes = []
+    for entry in manifest["shards"]:
+        port = entry["url"].rsplit(":", 1)[1].rstrip("/")
+        processes.append(subprocess.Popen([
+            sys.executable, str(root / "shard_server.py"),
+            "--cache", entry["cache"], "--host", args.host, "--port", port
+        ]))
+        print(f"启动 {entry['id']}: {entry['url']} (pid {processes[-1].pid})")
+
+    def stop(signum, frame):
+        for process in processes:
+            process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    return max(process.wait() for process in processes)
+
+
+def cmd_status(args):
+    import httpx
+
+    manifest = load_manifest(args.manifest)
+    print(f"\n{'分片':<12}{'地址':<28}{'人脸数':>10}{'响应时间':>12}")
+    healthy = True
+    for entry in manifest["shards"]:
+        start = time.time()
+        try:
+            info = httpx.get(
+                entry["url"].rstrip("/") + "/info", headers={"X-Shard-Token": settings.SHARD_TOKEN}, timeout=2.0
+            ).json()
+            elapsed = (time.time() - start) * 1000
+            print(f"{entry['id']:<12}{entry['url']:<28}{info['count']:>10}{elapsed:>10.1f}ms")
+        except Exception as e:
+            healthy = False
+            print(f"{entry['id']:<12}{entry['url']:<28}{'不可用':>10}  {e}")
+    return 0 if healthy else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='人脸库分片管理脚本',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例:
+  # 将特征缓存划分为 4 个分片（端口 9101~9104）
+  python scripts/shard_gallery.py assign --shards 4
+
+  # 在本机启动全部分片
+  python scripts/shard_gallery.py serve
+
+  # 查看分片状态
+  python scripts/shard_gallery.py status
+
+  # 扩容到 6 个分片（只迁移约 1/3 的人脸）
+  python scripts/shard_gallery.py rebalance --shards 6
+        """
+    )
+    default_manifest = str(Path(DEFAULT_OUT_DIR) / "manifest.json")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    assign = subparsers.add_parser("assign", help="划分分片并生成清单")
+    assign.add_argument('--cache', default=settings.FACE_ENCODINGS_CACHE,
+                        help=f'特征缓存文件（默认: {settings.FACE_ENCODINGS_CACHE}）')
+    assign.add_argument('--shards', type=int, required=True, help='分片数量')
+    assign.add_argument('--out-dir', default=DEFAULT_OUT_DIR, help=f'分片输出目录（默认: {DEFAULT_OUT_DIR}）')
+    assign.add_argument('--host', default="127.0.0.1", help='分片服务地址（默认: 127.0.0.1）')
+    assign.add_argument('--base-port', type=int, default=9101, help='第一个分片的端口（默认: 9101）')
+    assign.set_defaults(func=cmd_assign)
+
+    rebalance = subparsers.add_parser("rebalance", help="调整分片数量并迁移人脸")
+    rebalance.add_argument('--manifest', default=default_manifest, help=f'分片清单（默认: {default_manifest}）')
+    rebalance.add_argument('--shards', type=int, required=True, help='新的分片数量')
+    rebalance.add_argument('--host', default="127.0.0.1", help='新增分片的服务地址（默认: 127.0.0.1）')
+    rebalance.add_argument('--base-port', type=int, default=9101, help='第一个分片的端口（默认: 9101）')
+    rebalance.set_defaults(func=cmd_rebalance)
+
+    serve = subparsers.add_parser("serve", help="在本机启动全部分片服务")
+    serve.add_argument('--manifest', default=default_manifest, help=f'分片清单（默认: {default_manifest}）')
+    serve.add_argument('--host', default="127.0.0.1", help='监听地址（默认: 127.0.0.1）')
+    serve.set_defaults(func=cmd_serve)
+
+    status = subparsers.add_parser("status", help="查询各分片状态")
+    status.add_argument('--manifest', default=default_manifest, help=f'分片清单（默认: {default_manifest}）')
+    status.set_defaults(func=cmd_status)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+响应序列化模块
+识别结果的 JSON / msgpack 编码
+
+- 安装了 orjson 时用 orjson 编码 JSON（比标准库 json 快一个数量级，直接支持 numpy 类型），
+  未安装时回退到标准库 json
+- 请求头 Accept 包含 application/x-msgpack 且安装了 msgpack 时返回 msgpack 二进制响应
+  （结果图片直接以 JPEG 字节返回，不做 base64 编码）；未安装时按 JSON 返回，客户端以 Content-Type 为准
+- 人脸列表可以使用紧凑布局（layout=compact）：人名、人脸框等按字段组成平行数组，
+  不再为每张人脸生成嵌套对象，人脸多时编码和解析都更快、响应更小
+"""
+import json
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from starlette.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_MEDIA_TYPE = "application/x-msgpack"
+MSGPACK_MEDIA_TYPES = (MSGPACK_MEDIA_TYPE, "application/msgpack", "application/vnd.msgpack")
+
+# 人脸列表布局："objects" 每张人脸一个对象（默认），"compact" 按字段组成平行数组
+SUPPORTED_LAYOUTS = ("objects", "compact")
+
+
+def _default(obj):
+    """标准库 json / msgpack 不支持的类型"""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"无法序列化的类型: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """编码为 UTF-8 JSON（紧凑格式，不转义中文）"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def packb(content: Any) -> bytes:
+    """
+    编码为 msgpack
+
+    Raises:
+        RuntimeError: 未安装 msgpack
+    """
+    if msgpack is None:
+        raise RuntimeError("未安装 msgpack")
+    return msgpack.packb(content, default=_default, use_bin_type=True)
+
+
+def accepts_msgpack(accept: Optional[str]) -> bool:
+    """Accept 请求头是否要求 msgpack（且服务端可以提供）"""
+    return msgpack is not None and bool(accept) and any(t in accept for t in MSGPACK_MEDIA_TYPES)
+
+
+class FastJSONResponse(JSONResponse):
+    """使用 orjson（可用时）编码的 JSONResponse"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class MsgpackResponse(Response):
+    """msgpack 二进制响应"""
+
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        return packb(content)
+
+
+def negotiated_response(content: Any, accept: Optional[str], headers: Optional[Dict[str, str]] = None) -> Response:
+    """按 Accept 请求头返回 msgpack 或 JSON 响应（附带 Vary: Accept）"""
+    headers = {**(headers or {}), "Vary": "Accept"}
+    if accepts_msgpack(accept):
+        return MsgpackResponse(content, headers=headers)
+    return FastJSONResponse(content, headers=headers)
+
+
+def shape_faces(
+    face_locations: Sequence,
+    face_names: Sequence[str],
+    matches: Optional[List[list]] = None,
+    layout: str = "objects"
+) -> Dict[str, Any]:
+    """
+    组织响应中的人脸列表
+
+    Args:
+        face_locations: 人脸位置 [(top, right, bottom, left), ...]
+        face_names: 人名列表
+        matches: 每张人脸的候选人 [(人名, 距离, 置信度), ...]，为 None 时不返回距离和候选人
+        layout: "objects" 返回 {"faces": [{"name", "location", ...}]}；
+                "compact" 返回 {"layout": "compact", "names": [...], "boxes": [[top, right, bottom, left], ...]}，
+                有候选人时附加 distances、confidences（无匹配时为 null）和 candidates（[[人名, 距离, 置信度], ...]）
+
+    Returns:
+        合并到响应中的字段
+    """
+    if layout == "compact":
+        shaped = {
+            "layout": "compact",
+            "names": list(face_names),
+            "boxes": [[int(v) for v in location] for location in face_locations]
+        }
+        if matches is not None:
+            shaped["distances"] = [round(c[0][1], 6) if c else None for c in matches]
+            shaped["confidences"] = [round(c[0][2], 4) if c else None for c in matches]
+            shaped["candidates"] = [
+                [[name, round(distance, 6), round(confidence, 4)] for name, distance, confidence in candidates]
+                for candidates in matches
+            ]
+        return shaped
+
+    faces = [
+        {"name": name, "location": {"top": top, "right": right, "bottom": bottom, "left": left}}
+        for (top, right, bottom, left), name in zip(face_locations, face_names)
+    ]
+    if matches is not None:
+        for face, candidates in zip(faces, matches):
+            if not candidates:
+                face["candidates"] = []
+                continue
+            face["distance"] = round(candidates[0][1], 6)
+            face["confidence"] = round(candidates[0][2], 4)
+            face["candidates"] = [
+                {"name": name, "distance": round(distance, 6), "confidence": round(confidence, 4)}
+                for name, distance, confidence in candidates
+            ]
+    return {"faces": faces}
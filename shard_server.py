@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+人脸库分片服务
+每个进程加载一个分片的特征缓存（由 scripts/shard_gallery.py 生成），只提供特征向量检索，
+不加载 dlib 模型。主服务通过 sharding.ShardCoordinator 并发查询所有分片。
+除 /health 外的接口都需要请求头 X-Shard-Token（与主服务配置相同的 SHARD_TOKEN）或 X-Admin-Token。
+
+使用方法:
+    python shard_server.py --cache data/shards/shard-0.pkl --port 9101
+
+    # 或按分片清单在本机启动全部分片
+    python scripts/shard_gallery.py serve --manifest data/shards/manifest.json
+"""
+
+import argparse
+import hmac
+import logging
+import threading
+import time
+from typing import List, Optional, Union
+
+import numpy as np
+from fastapi import Depends, FastAPI, Header, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+
+from config import settings
+from embeddings import decode_embedding, decode_embeddings
+from gallery import FaceGallery
+from log_config import setup_logging
+from pq_gallery import PQGallery
+
+logger = logging.getLogger("shard")
+
+# 新增人脸后延迟保存的时间（秒），合并连续的注册请求
+SAVE_DELAY_SECONDS = 5.0
+
+
+def load_shard_gallery(cache_file: str):
+    """按 GALLERY_STORAGE 加载分片人脸库，缓存不存在时返回空人脸库"""
+    if settings.GALLERY_STORAGE == "pq":
+        pq = PQGallery.load(cache_file, settings.GALLERY_PQ_RERANK)
+        if pq is not None:
+            return pq
+        gallery = FaceGallery.load(cache_file)
+        if gallery is not None and len(gallery) > 0:
+            return PQGallery.build(
+                gallery, cache_file, settings.GALLERY_PQ_SUBSPACES, settings.GALLERY_PQ_RERANK
+            )
+    dtype = "float16" if settings.GALLERY_STORAGE == "float16" else "float64"
+    return FaceGallery.load(cache_file, dtype) or FaceGallery(dtype=dtype)
+
+
+def require_token(
+    x_shard_token: Optional[str] = Header(None),
+    x_admin_token: Optional[str] = Header(None)
+):
+    """
+    校验分片共享密钥（SHARD_TOKEN）或管理员令牌（ADMIN_TOKEN），两者都未配置时拒绝访问
+
+    Raises:
+        HTTPException: 403 令牌缺失或不匹配
+    """
+    for token, expected in ((x_shard_token, settings.SHARD_TOKEN), (x_admin_token, settings.ADMIN_TOKEN)):
+        if expected and token is not None and hmac.compare_digest(token, expected):
+            return
+    raise HTTPException(status_code=403, detail="需要分片令牌")
+
+
+class SearchRequest(BaseModel):
+    """分片检索请求"""
+    embeddings: List[Union[str, List[float]]]
+    dtype: str = "float32"
+    top_k: int = 5
+
+
+class AddRequest(BaseModel):
+    """分片添加人脸请求"""
+    name: str
+    embedding: Union[str, List[float]]
+    dtype: str = "float32"
+
+
+def create_app(cache_file: str) -> FastAPI:
+    """创建分片服务应用"""
+    app = FastAPI(title="人脸库分片服务")
+    gallery = load_shard_gallery(cache_file)
+    write_lock = threading.Lock()
+    dirty = threading.Event()
+    logger.info(f"分片 {cache_file} 加载了 {len(gallery)} 个人脸")
+
+    def save_loop():
+        while True:
+            dirty.wait()
+            time.sleep(SAVE_DELAY_SECONDS)
+            dirty.clear()
+            # 写锁内只取快照（当前人脸数），写文件时不阻塞注册；人脸库只追加，保存期间新增的人脸留到下次保存
+            with write_lock:
+                count = len(gallery)
+            try:
+                gallery.save(cache_file, settings.FACE_MODEL, count)
+            except Exception as e:
+                logger.error(f"保存分片失败: {e}")
+                dirty.set()
+
+    threading.Thread(target=save_loop, name="shard-save", daemon=True).start()
+
+    @app.post("/search", dependencies=[Depends(require_token)])
+    async def search(request: SearchRequest):
+        try:
+            queries = decode_embeddings(request.embeddings, request.dtype)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        indices, distances = await run_in_threadpool(gallery.search, queries, max(1, request.top_k))
+        names = gallery.names
+        return {
+            "names": [[names[i] for i in row] for row in indices],
+            "distances": np.round(distances, 6).tolist()
+        }
+
+    @app.post("/add", dependencies=[Depends(require_token)])
+    def add(request: AddRequest):
+        # 普通函数，在线程池中执行，等待写锁时不阻塞事件循环
+        try:
+            encoding = decode_embedding(request.embedding, request.dtype)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        with write_lock:
+            gallery.add(request.name, encoding)
+        dirty.set()
+        return {"success": True, "count": len(gallery)}
+
+    @app.get("/names", dependencies=[Depends(require_token)])
+    async def names():
+        return {"names": list(gallery.names[:len(gallery)])}
+
+    @app.get("/info", dependencies=[Depends(require_token)])
+    async def info():
+        return {"cache": cache_file, "count": len(gallery), "storage": settings.GALLERY_STORAGE}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy"}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="人脸库分片服务")
+    parser.add_argument("--cache", required=True, help="分片特征缓存文件")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址（默认: 127.0.0.1）")
+    parser.add_argument("--port", type=int, default=9101, help="监听端口（默认: 9101）")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    setup_logging(settings.LOG_LEVEL, settings.LOG_FORMAT)
+    uvicorn.run(create_app(args.cache), host=args.host, port=args.port, log_level="warning", log_config=None)
+
+
+if __name__ == "__main__":
+    main()
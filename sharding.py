@@ -0,0 +1,205 @@
+"""
+人脸库分片模块
+人脸库按人名划分到多个分片，每个分片由独立的进程（shard_server.py，可在本机或其他节点）提供检索；
+协调器把查询并发发送到所有分片，合并各分片的前 k 个结果。
+
+- 分片分配使用最高随机权重哈希（rendezvous hashing）：增减分片时只有约 1/N 的人脸需要迁移
+- 单个分片超时或出错时使用其余分片的结果，不影响整体响应
+- 分片清单（manifest.json）由 scripts/shard_gallery.py 生成和维护
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from embeddings import encode_embedding
+
+logger = logging.getLogger(__name__)
+
+# 人脸总数的缓存时间（秒），健康检查频繁调用时不必每次询问所有分片
+COUNT_CACHE_SECONDS = 30.0
+# 获取单个分片人脸数的超时时间（秒）
+COUNT_TIMEOUT_SECONDS = 2.0
+
+
+def shard_for(name: str, shard_ids: Sequence[str]) -> str:
+    """
+    计算人名所属的分片（rendezvous hashing）
+
+    Args:
+        name: 人名
+        shard_ids: 全部分片 ID
+
+    Returns:
+        分片 ID
+    """
+    return max(
+        shard_ids,
+        key=lambda shard_id: hashlib.sha1(f"{shard_id}:{name}".encode("utf-8")).digest()
+    )
+
+
+def load_manifest(manifest_file: str) -> Dict:
+    """读取分片清单"""
+    with open(manifest_file, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if not manifest.get("shards"):
+        raise ValueError(f"分片清单中没有分片: {manifest_file}")
+    return manifest
+
+
+class ShardCoordinator:
+    """分片检索协调器（scatter-gather）"""
+
+    def __init__(self, shards: List[Dict], timeout_ms: int = 300, token: str = ""):
+        """
+        Args:
+            shards: 分片列表 [{"id": ..., "url": ...}, ...]
+            timeout_ms: 单次检索等待分片响应的最长时间
+            token: 分片服务的共享密钥（SHARD_TOKEN），随每个请求在 X-Shard-Token 中发送
+        """
+        import httpx
+
+        self.shards = shards
+        self.shard_ids = [shard["id"] for shard in shards]
+        self.timeout = timeout_ms / 1000
+        # 连接池复用到各分片的连接
+        self._client = httpx.Client(
+            timeout=self.timeout,
+            headers={"X-Shard-Token": token} if token else None,
+            limits=httpx.Limits(max_connections=len(shards) * 16, max_keepalive_connections=len(shards) * 4)
+        )
+        self._pool = ThreadPoolExecutor(max_workers=len(shards) * 4, thread_name_prefix="shard")
+        self._lock = threading.Lock()
+        self._stats = {shard_id: {"ok": 0, "timeouts": 0, "errors": 0} for shard_id in self.shard_ids}
+        self._names: Optional[List[str]] = None
+        self._count: Optional[Tuple[float, int]] = None  # (获取时间, 人脸总数)
+
+    @classmethod
+    def from_manifest(cls, manifest_file: str, timeout_ms: int = 300, token: str = "") -> "ShardCoordinator":
+        """根据分片清单创建协调器"""
+        return cls(load_manifest(manifest_file)["shards"], timeout_ms, token)
+
+    def _record(self, shard_id: str, outcome: str):
+        with self._lock:
+            self._stats[shard_id][outcome] += 1
+
+    def _post(self, shard: Dict, path: str, payload: Dict) -> Dict:
+        response = self._client.post(shard["url"].rstrip("/") + path, json=payload)
+        response.raise_for_status()
+        return response.json()
+
+    def search(self, queries: np.ndarray, k: int) -> List[List[Tuple[str, float]]]:
+        """
+        在所有分片中检索，合并每个查询的前 k 个结果
+
+        Args:
+            queries: 查询特征向量 (M, 128)
+            k: 每个查询返回的数量
+
+        Returns:
+            每个查询的 [(人名, 距离), ...]，按距离升序
+
+        Raises:
+            RuntimeError: 所有分片都没有在超时内响应
+        """
+        queries = np.asarray(queries, dtype=np.float64).reshape(-1, 128)
+        payload = {
+            "embeddings": [encode_embedding(query, "float32") for query in queries],
+            "dtype": "float32",
+            "top_k": k
+        }
+        futures = {self._pool.submit(self._post, shard, "/search", payload): shard for shard in self.shards}
+        done, not_done = wait(futures, timeout=self.timeout)
+
+        merged: List[List[Tuple[str, float]]] = [[] for _ in range(len(queries))]
+        answered = 0
+        for future, shard in futures.items():
+            if future in not_done:
+                future.cancel()
+                self._record(shard["id"], "timeouts")
+                logger.warning(f"分片 {shard['id']} 超时")
+                continue
+            try:
+                result = future.result()
+            except Exception as e:
+                self._record(shard["id"], "errors")
+                logger.warning(f"分片 {shard['id']} 检索失败: {e}")
+                continue
+            self._record(shard["id"], "ok")
+            answered += 1
+            for row, (names, distances) in enumerate(zip(result["names"], result["distances"])):
+                merged[row].extend(zip(names, distances))
+
+        if answered == 0:
+            raise RuntimeError("所有分片均不可用")
+        return [sorted(candidates, key=lambda c: c[1])[:k] for candidates in merged]
+
+    def add(self, name: str, encoding: np.ndarray):
+        """
+        将人脸添加到所属分片
+
+        Raises:
+            httpx.HTTPError: 分片不可用（调用方可重试）
+        """
+        shard_id = shard_for(name, self.shard_ids)
+        shard = next(shard for shard in self.shards if shard["id"] == shard_id)
+        self._post(shard, "/add", {"name": name, "embedding": encode_embedding(encoding, "float32")})
+        with self._lock:
+            if self._names is not None:
+                self._names.append(name)
+            if self._count is not None:
+                self._count = (self._count[0], self._count[1] + 1)
+
+    def _shard_count(self, shard: Dict) -> int:
+        response = self._client.get(shard["url"].rstrip("/") + "/info", timeout=COUNT_TIMEOUT_SECONDS)
+        response.raise_for_status()
+        return int(response.json()["count"])
+
+    def count(self) -> int:
+        """
+        所有分片的人脸总数（并发读取各分片 /info，缓存 COUNT_CACHE_SECONDS 秒）
+
+        不可用的分片不计入，结果同样缓存，分片故障时不会每次调用都重新等待超时
+        """
+        with self._lock:
+            cached = self._count
+        if cached is not None and time.monotonic() - cached[0] < COUNT_CACHE_SECONDS:
+            return cached[1]
+        futures = {self._pool.submit(self._shard_count, shard): shard for shard in self.shards}
+        total = 0
+        for future, shard in futures.items():
+            try:
+                total += future.result()
+            except Exception as e:
+                logger.warning(f"获取分片 {shard['id']} 人脸数失败: {e}")
+        with self._lock:
+            self._count = (time.monotonic(), total)
+        return total
+
+    def names(self) -> List[str]:
+        """所有分片的人名列表（首次调用时从各分片获取，之后随添加更新）"""
+        if self._names is None:
+            names = []
+            for shard in self.shards:
+                try:
+                    response = self._client.get(shard["url"].rstrip("/") + "/names", timeout=10.0)
+                    response.raise_for_status()
+                    names.extend(response.json()["names"])
+                except Exception as e:
+                    # 不缓存不完整的列表，下次调用重新获取
+                    logger.warning(f"获取分片 {shard['id']} 人名列表失败: {e}")
+                    return names
+            with self._lock:
+                self._names = names
+        return self._names
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """各分片的成功、超时、出错次数"""
+        with self._lock:
+            return {shard_id: dict(counts) for shard_id, counts in self._stats.items()}
@@ -0,0 +1,201 @@
+"""
+人脸库快照模块
+把人脸库（人名、特征向量、元数据、PQ 码本和编码）导出为单个文件，
+新节点直接导入即可提供服务，不需要重新从图片提取特征
+
+- 全量快照：整个人脸库
+- 增量快照：某个状态之后新增的人脸（人脸库只追加，前 N 行不变），用于节点间增量同步
+- 人脸库状态校验和：人名和 float32 特征向量的 SHA-256，与存储精度 / 是否 PQ 无关，
+  用于校验增量快照的基准状态和导入后的结果（float16 存储的节点只能与同样精度的节点增量同步）
+
+文件格式（未压缩的 .npz，allow_pickle=False 即可读取）:
+    meta        JSON 元数据（类型、数量、校验和、检测模型、导出时间等）
+    names       人名
+    encodings   float32 特征向量
+    codebooks   PQ 码本（可选，来源节点为 PQ 模式时）
+    codes       PQ 编码（可选）
+"""
+import hashlib
+import json
+import socket
+import time
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, Optional, Sequence, Union
+
+import numpy as np
+
+SNAPSHOT_VERSION = 1
+
+# 计算校验和时每次处理的行数
+HASH_BLOCK_ROWS = 65536
+
+
+class SnapshotError(ValueError):
+    """快照文件损坏或与本地人脸库不匹配"""
+
+    def __init__(self, message: str, conflict: bool = False):
+        super().__init__(message)
+        # True 表示增量快照的基准与本地人脸库不一致（需要全量快照），False 表示文件本身无效
+        self.conflict = conflict
+
+
+class GalleryHasher:
+    """
+    人脸库状态校验和
+
+    人名和特征向量分别流式计算 SHA-256，结果与分块方式无关：
+    先计算前 N 行再追加增量，与一次计算全部行得到的校验和相同
+    """
+
+    def __init__(self):
+        self._names = hashlib.sha256()
+        self._vectors = hashlib.sha256()
+        self.count = 0
+
+    def update(self, names: Sequence[str], encodings: np.ndarray) -> "GalleryHasher":
+        for start in range(0, len(names), HASH_BLOCK_ROWS):
+            end = min(start + HASH_BLOCK_ROWS, len(names))
+            self._names.update(b"".join(name.encode("utf-8") + b"\x00" for name in names[start:end]))
+            self._vectors.update(np.ascontiguousarray(encodings[start:end], dtype="<f4").tobytes())
+        self.count += len(names)
+        return self
+
+    def hexdigest(self) -> str:
+        return hashlib.sha256(self._names.digest() + self._vectors.digest()).hexdigest()
+
+
+def gallery_checksum(gallery, count: Optional[int] = None) -> str:
+    """人脸库前 count 行（默认全部）的状态校验和"""
+    count = len(gallery) if count is None else count
+    return GalleryHasher().update(gallery.names[:count], gallery.encodings[:count]).hexdigest()
+
+
+def _index_checksum(codebooks: np.ndarray, codes: np.ndarray) -> str:
+    digest = hashlib.sha256(np.ascontiguousarray(codebooks).tobytes())
+    digest.update(np.ascontiguousarray(codes).tobytes())
+    return digest.hexdigest()
+
+
+@dataclass
+class Snapshot:
+    """读取后的快照内容"""
+    meta: Dict
+    names: list
+    encodings: np.ndarray
+    codebooks: Optional[np.ndarray] = None
+    codes: Optional[np.ndarray] = None
+
+    @property
+    def is_delta(self) -> bool:
+        return self.meta["kind"] == "delta"
+
+
+def export_snapshot(
+    gallery,
+    output: Union[str, BinaryIO],
+    model_type: str = "hog",
+    since: int = 0,
+    base_checksum: Optional[str] = None
+) -> Dict:
+    """
+    导出人脸库快照
+
+    导出期间可以继续注册人脸：开始时读取一次数量，只导出这之前的行
+
+    Args:
+        gallery: FaceGallery 或 PQGallery
+        output: 输出文件路径或二进制文件对象
+        model_type: 生成特征时使用的检测模型
+        since: 大于 0 时导出增量快照（第 since 行之后新增的人脸）
+        base_checksum: 增量快照的基准校验和（接收方前 since 行的校验和），用于确认两边的前 since 行一致
+
+    Returns:
+        快照元数据
+
+    Raises:
+        SnapshotError: since 超出人脸库大小或基准校验和不一致（conflict=True）
+    """
+    count = len(gallery)
+    if since < 0 or since > count:
+        raise SnapshotError(f"增量基准 {since} 超出人脸库大小 {count}", conflict=True)
+    names = list(gallery.names[:count])
+    encodings = gallery.encodings
+
+    hasher = GalleryHasher().update(names[:since], encodings[:since])
+    if since > 0 and base_checksum is not None and hasher.hexdigest() != base_checksum:
+        raise SnapshotError("增量基准与本节点人脸库不一致，需要全量快照", conflict=True)
+    base = hasher.hexdigest()
+    delta = np.asarray(encodings[since:count], dtype=np.float32)
+    checksum = hasher.update(names[since:], delta).hexdigest()
+
+    meta = {
+        "version": SNAPSHOT_VERSION,
+        "kind": "delta" if since > 0 else "full",
+        "base_count": since,
+        "base_checksum": base,
+        "count": count,
+        "checksum": checksum,
+        "dim": int(gallery.dim),
+        "model_type": model_type,
+        "source": socket.gethostname(),
+        "created_at": time.time()
+    }
+    arrays = {"names": np.array(names[since:], dtype=str), "encodings": delta}
+    # PQ 节点附带码本和编码，PQ 模式的新节点不需要重新训练（增量快照只附带新增行的编码）
+    codebooks = getattr(gallery, "codebooks", None)
+    if codebooks is not None:
+        arrays["codebooks"] = codebooks
+        arrays["codes"] = gallery.codes[since:count]
+        meta["index_checksum"] = _index_checksum(arrays["codebooks"], arrays["codes"])
+
+    np.savez(output, meta=np.array(json.dumps(meta)), **arrays)
+    return meta
+
+
+def read_snapshot(source: Union[str, BinaryIO]) -> Snapshot:
+    """
+    读取快照文件并检查完整性
+
+    Raises:
+        SnapshotError: 文件无法读取、版本不支持或内容与校验和不符
+    """
+    try:
+        with np.load(source, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            names = data["names"].tolist()
+            encodings = data["encodings"]
+            codebooks = data["codebooks"] if "codebooks" in data.files else None
+            codes = data["codes"] if "codes" in data.files else None
+    except Exception as e:
+        raise SnapshotError(f"无法读取快照文件: {e}")
+
+    if meta.get("version") != SNAPSHOT_VERSION:
+        raise SnapshotError(f"不支持的快照版本: {meta.get('version')}")
+    if len(names) != meta["count"] - meta["base_count"] or len(encodings) != len(names):
+        raise SnapshotError("快照中的人脸数量与元数据不一致")
+    if codebooks is not None and _index_checksum(codebooks, codes) != meta.get("index_checksum"):
+        raise SnapshotError("PQ 索引校验和不一致，文件可能已损坏")
+    if not meta["base_count"]:
+        # 全量快照可以直接校验内容；增量快照在应用时与本地人脸库一起校验
+        if GalleryHasher().update(names, encodings).hexdigest() != meta["checksum"]:
+            raise SnapshotError("快照校验和不一致，文件可能已损坏")
+    return Snapshot(meta, names, encodings.reshape(len(names), meta["dim"]), codebooks, codes)
+
+
+def verify_delta(gallery, snapshot: Snapshot):
+    """
+    检查增量快照能否应用到本地人脸库（本地状态等于基准，应用后校验和等于快照记录的值）
+
+    Raises:
+        SnapshotError: 基准不一致（conflict=True）或增量内容损坏
+    """
+    meta = snapshot.meta
+    if len(gallery) != meta["base_count"]:
+        raise SnapshotError(
+            f"本地人脸库有 {len(gallery)} 个人脸，增量快照的基准是 {meta['base_count']} 个", conflict=True
+        )
+    hasher = GalleryHasher().update(gallery.names[:len(gallery)], gallery.encodings)
+    if hasher.hexdigest() != meta["base_checksum"]:
+        raise SnapshotError("本地人脸库与增量快照的基准不一致，需要全量快照", conflict=True)
+    if hasher.update(snapshot.names, snapshot.encodings).hexdigest() != meta["checksum"]:
+        raise SnapshotError("快照校验和不一致，文件可能已损坏")
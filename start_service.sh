@@ -51,7 +51,7 @@ fi
 echo "正在加载人脸数据..."
 for i in {1..30}; do
     sleep 5
-    if curl -s http://localhost:8001/health > /dev/null 2>&1; then
+    if curl -sf http://localhost:8001/ready > /dev/null 2>&1; then
         echo ""
         echo "========================================"
         echo "✓ 服务启动成功！"
@@ -59,7 +59,7 @@ for i in {1..30}; do
         echo ""
 
         # 获取人脸数量
-        FACE_COUNT=$(curl -s http://localhost:8001/health | grep -oP '"known_faces_count":\K\d+')
+        FACE_COUNT=$(curl -s http://localhost:8001/ready | grep -oP '"known_faces_count":\K\d+')
 
         echo "服务信息:"
         echo "  - 服务端口: 8001"
@@ -75,6 +75,7 @@ for i in {1..30}; do
         echo "  - 查看日志: tail -f service.log"
         echo "  - 停止服务: pkill -f 'python main.py'"
         echo "  - 查看状态: curl http://localhost:8001/health"
+        echo "  - 就绪检查: curl http://localhost:8001/ready"
         echo ""
         exit 0
     fi
@@ -4,7 +4,14 @@ let canvas = null;
 let ctx = null;
 let stream = null;
 let isDetecting = false;
-let detectionInterval = null;
+let detectionTimer = null;
+let nextFrameDelay = 500;   // 下一帧发送间隔（毫秒），由服务端根据负载调整
+let captureWidth = 0;       // 采集宽度，0 表示使用摄像头原始分辨率
+let captureFormat = 'image/jpeg';   // 帧编码格式，由服务端建议和浏览器支持决定
+let captureQuality = 0.8;   // 帧编码质量，由服务端建议
+let captureGrayscale = false;   // 是否发送灰度帧
+// 视频流标识，服务端据此只在上一帧人脸附近检测
+const streamId = 'stream-' + Date.now().toString(36) + '-' + Math.random().toString(36).slice(2, 10);
 
 // 初始化
 document.addEventListener('DOMContentLoaded', function() {
@@ -85,9 +92,29 @@ function initRealtimeDetection() {
     stopBtn.addEventListener('click', stopDetection);
 }
 
+// 获取服务端检测需要的采集参数（分辨率、编码格式和质量），不发送服务端用不到的像素
+async function loadStreamCapabilities() {
+    try {
+        const response = await fetch('/api/stream/capabilities');
+        if (!response.ok) return;
+        const caps = await response.json();
+        captureWidth = caps.capture_width || captureWidth;
+        captureQuality = caps.quality || captureQuality;
+        captureGrayscale = !!caps.grayscale;
+        nextFrameDelay = caps.next_delay_ms || nextFrameDelay;
+        // 浏览器不支持的格式 toDataURL 会返回 PNG，逐个测试
+        const probe = document.createElement('canvas');
+        probe.width = probe.height = 1;
+        captureFormat = (caps.formats || []).find(f => probe.toDataURL(f).startsWith('data:' + f)) || 'image/jpeg';
+    } catch (error) {
+        console.warn('获取视频流采集参数失败，使用默认值:', error);
+    }
+}
+
 async function startDetection() {
     try {
         updateStatus('正在启动摄像头...', 'info');
+        await loadStreamCapabilities();
 
         // 检查浏览器是否支持摄像头访问
         if (!navigator.mediaDevices || !navigator.mediaDevices.getUserMedia) {
@@ -124,8 +151,7 @@ async function startDetection() {
 
         // 等待视频加载
         video.onloadedmetadata = () => {
-            canvas.width = video.videoWidth;
-            canvas.height = video.videoHeight;
+            resizeCanvas();
 
             isDetecting = true;
             document.getElementById('startBtn').disabled = true;
@@ -133,8 +159,8 @@ async function startDetection() {
 
             updateStatus('正在识别中...', 'success');
 
-            // 开始定期检测（每500ms检测一次）
-            detectionInterval = setInterval(detectFromVideo, 500);
+            // 开始检测（上一帧返回后才发送下一帧，间隔由服务端建议）
+            scheduleNextFrame(0);
         };
 
     } catch (error) {
@@ -180,13 +206,12 @@ async function retryWithLowerResolution() {
         video.play();
 
         video.onloadedmetadata = () => {
-            canvas.width = video.videoWidth;
-            canvas.height = video.videoHeight;
+            resizeCanvas();
             isDetecting = true;
             document.getElementById('startBtn').disabled = true;
             document.getElementById('stopBtn').disabled = false;
             updateStatus('正在识别中（低分辨率模式）...', 'success');
-            detectionInterval = setInterval(detectFromVideo, 500);
+            scheduleNextFrame(0);
         };
     } catch (err) {
         showCameraError('即使降低分辨率也无法访问摄像头<br>错误: ' + err.message);
@@ -208,10 +233,10 @@ function showCameraError(message) {
 function stopDetection() {
     isDetecting = false;
 
-    // 停止检测间隔
-    if (detectionInterval) {
-        clearInterval(detectionInterval);
-        detectionInterval = null;
+    // 停止检测定时器
+    if (detectionTimer) {
+        clearTimeout(detectionTimer);
+        detectionTimer = null;
     }
 
     // 停止视频流
@@ -235,46 +260,94 @@ function stopDetection() {
     updateStatus('已停止识别', 'info');
 }
 
+// 按采集宽度调整 canvas 尺寸（保持视频宽高比）
+function resizeCanvas() {
+    const width = captureWidth > 0 ? Math.min(captureWidth, video.videoWidth) : video.videoWidth;
+    canvas.width = width;
+    canvas.height = Math.round(video.videoHeight * width / video.videoWidth);
+}
+
+// 安排下一帧检测（同一时间最多只有一个请求在途）
+function scheduleNextFrame(delay) {
+    if (!isDetecting) return;
+    if (detectionTimer) {
+        clearTimeout(detectionTimer);
+    }
+    detectionTimer = setTimeout(detectFromVideo, delay);
+}
+
+// 根据服务端建议调整帧间隔和采集分辨率
+function applyClientHint(hint) {
+    if (!hint) return;
+    nextFrameDelay = hint.next_delay_ms;
+    if (hint.quality) {
+        captureQuality = hint.quality;
+    }
+    if (hint.capture_width && hint.capture_width !== captureWidth) {
+        captureWidth = hint.capture_width;
+        resizeCanvas();
+    }
+}
+
 async function detectFromVideo() {
     if (!isDetecting) return;
 
+    let delay = nextFrameDelay;
+
     try {
-        // 将视频帧绘制到 canvas
+        // 将视频帧绘制到 canvas（按服务端建议缩放，可选灰度）
+        ctx.filter = captureGrayscale ? 'grayscale(1)' : 'none';
         ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
+        // 记录本帧尺寸：applyClientHint 可能在显示结果前调整 canvas，人脸框按发送时的尺寸换算
+        const frameWidth = canvas.width;
+        const frameHeight = canvas.height;
 
-        // 获取 base64 图片数据
-        const imageData = canvas.toDataURL('image/jpeg', 0.8);
+        // 按服务端建议的格式和质量编码
+        const imageData = canvas.toDataURL(captureFormat, captureQuality);
 
         // 发送到后端进行检测
         const formData = new FormData();
         formData.append('image_data', imageData);
+        formData.append('stream_id', streamId);
 
         const response = await fetch('/api/detect_stream', {
             method: 'POST',
             body: formData
         });
 
+        // 服务器限流或繁忙时按 Retry-After 退避
+        if (response.status === 429 || response.status === 503) {
+            const retryAfter = parseFloat(response.headers.get('Retry-After')) || 1;
+            delay = Math.max(delay, retryAfter * 1000);
+            return;
+        }
+
         const result = await response.json();
 
         if (result.success) {
+            applyClientHint(result.client_hint);
+            delay = nextFrameDelay;
+
             // 更新显示
-            displayRealtimeResults(result);
+            displayRealtimeResults(result, frameWidth, frameHeight);
         }
 
     } catch (error) {
         console.error('检测失败:', error);
+    } finally {
+        scheduleNextFrame(delay);
     }
 }
 
-function displayRealtimeResults(result) {
+function displayRealtimeResults(result, frameWidth, frameHeight) {
     const overlay = document.getElementById('face-overlay');
     overlay.innerHTML = '';
 
     if (result.face_count > 0) {
         // 计算视频元素的实际显示尺寸
         const videoRect = video.getBoundingClientRect();
-        const scaleX = videoRect.width / canvas.width;
-        const scaleY = videoRect.height / canvas.height;
+        const scaleX = videoRect.width / frameWidth;
+        const scaleY = videoRect.height / frameHeight;
 
         result.faces.forEach(face => {
             const loc = face.location;
@@ -445,6 +518,17 @@ async function addNewFace() {
             nameInput.value = '';
             fileInput.value = '';
             document.getElementById('addFaceBox').querySelector('p').textContent = '选择人脸图片';
+
+            // 注册在后台完成，轮询任务状态
+            const job = await waitForJob(result.job_id);
+            if (job.warnings && job.warnings.length > 0) {
+                showAlert(`已处理: ${name}（${job.warnings[0].warning}）`, 'success');
+            } else if (job.done > 0 || job.skipped > 0) {
+                showAlert(`成功添加人脸: ${name}`, 'success');
+            } else {
+                const reason = job.errors && job.errors.length > 0 ? job.errors[0].error : '未知错误';
+                showAlert(`添加失败: ${reason}`, 'error');
+            }
             loadKnownFaces();
         } else {
             showAlert('添加失败', 'error');
@@ -456,6 +540,17 @@ async function addNewFace() {
     }
 }
 
+async function waitForJob(jobId, intervalMs = 1000) {
+    while (true) {
+        const response = await fetch(`/api/jobs/${jobId}`);
+        const job = await response.json();
+        if (!job.success || job.status === 'completed') {
+            return job;
+        }
+        await new Promise(resolve => setTimeout(resolve, intervalMs));
+    }
+}
+
 async function loadKnownFaces() {
     const listDiv = document.getElementById('knownFacesList');
     listDiv.innerHTML = '<p>加载中...</p>';
@@ -2,247 +2,215 @@
 """
 测试识别准确性
 使用测试集验证系统的识别能力
+
+- 测试图片的特征只提取一次（进程池并行，缓存到 CACHE_DIR/eval_encodings.npz）
+- 一次评估所有容差值：每个容差值的误识率 FAR、拒识率 FRR、识别率，以及推荐容差值
+- 当前容差值（settings.FACE_TOLERANCE）下的逐图结果和 ROC / DET 曲线保存到 test_results.json
+
+使用方法:
+    python test_accuracy.py
+    python test_accuracy.py --workers 8 --target-far 0.001 --plot roc.png
 """
 import os
-import cv2
-from face_detector import get_face_detector
-from pathlib import Path
+import argparse
 import json
 from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from config import settings
+from evaluation import (
+    DEFAULT_THRESHOLDS, compute_probe_encodings, curves, nearest_distances, recommend_threshold, sweep_thresholds
+)
+from face_detector import get_face_detector
+
+
+def list_test_images(test_dir: str):
+    """测试集图片及真实人名（陌生人脸为 None）"""
+    paths, expected = [], []
+    for subdir, known in (("known_faces", True), ("unknown_faces", False)):
+        directory = os.path.join(test_dir, subdir)
+        for file in sorted(os.listdir(directory)):
+            if file.lower().endswith(('.jpg', '.jpeg', '.png')):
+                paths.append(os.path.join(directory, file))
+                expected.append(Path(file).stem if known else None)
+    return paths, expected
+
+
+def plot_curves(curve_data, tolerance_point, output: str):
+    """绘制 ROC / DET 曲线（需要 matplotlib）"""
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("⚠️  未安装 matplotlib，跳过绘图")
+        return
 
-def test_accuracy():
+    roc = np.array(curve_data["roc"]).reshape(-1, 3)
+    det = np.array(curve_data["det"]).reshape(-1, 3)
+    fig, (ax_roc, ax_det) = plt.subplots(1, 2, figsize=(12, 5))
+    ax_roc.plot(roc[:, 0], roc[:, 1], drawstyle="steps-post")
+    ax_roc.set_xlabel("FAR")
+    ax_roc.set_ylabel("Identification rate")
+    ax_roc.set_title("ROC")
+    ax_det.plot(np.maximum(det[:, 0], 1e-4), np.maximum(det[:, 1], 1e-4), drawstyle="steps-post")
+    ax_det.set_xscale("log")
+    ax_det.set_yscale("log")
+    ax_det.set_xlabel("FAR")
+    ax_det.set_ylabel("FNIR")
+    ax_det.set_title("DET")
+    for ax in (ax_roc, ax_det):
+        ax.scatter([tolerance_point["far"]], [tolerance_point["dir"] if ax is ax_roc else 1 - tolerance_point["dir"]],
+                   color="red", label=f"tolerance={tolerance_point['threshold']}")
+        ax.grid(True, alpha=0.3)
+        ax.legend()
+    fig.tight_layout()
+    fig.savefig(output, dpi=120)
+    print(f"曲线已保存到: {output}")
+
+
+def test_accuracy(test_dir: str = 'test_set', workers: int = 4, target_far: float = 0.01,
+                  plot: str = None, result_file: str = 'test_results.json'):
     print("=" * 70)
     print("人脸识别准确性测试")
     print("=" * 70)
     print()
 
-    # 初始化检测器
-    print("正在加载人脸检测器...")
-    detector = get_face_detector()
-    print(f"✓ 已加载 {len(detector.known_face_names)} 个已知人脸")
-    print()
-
-    # 测试集路径
-    test_dir = 'test_set'
-    known_dir = os.path.join(test_dir, 'known_faces')
-    unknown_dir = os.path.join(test_dir, 'unknown_faces')
-
     if not os.path.exists(test_dir):
         print("错误: 测试集不存在")
         print("请先运行: venv/bin/python create_test_set.py")
         return
 
-    # 统计结果
-    results = {
-        'known_faces': {
-            'total': 0,
-            'correct': 0,
-            'wrong': 0,
-            'not_detected': 0,
-            'details': []
-        },
-        'unknown_faces': {
-            'total': 0,
-            'correct_reject': 0,
-            'false_positive': 0,
-            'not_detected': 0,
-            'details': []
-        }
-    }
-
-    # 测试已知人脸
-    print("=" * 70)
-    print("测试1: 已知人脸识别测试")
-    print("=" * 70)
+    # 初始化检测器
+    print("正在加载人脸检测器...")
+    detector = get_face_detector()
+    if detector.shards is not None:
+        print("错误: 分片模式下无法读取人脸库特征，请在分片前的特征缓存上评估")
+        return
+    print(f"✓ 已加载 {len(detector.known_face_names)} 个已知人脸")
     print()
-    print("目标: 识别出正确的名字")
+
+    # 提取测试图片特征（带缓存）
+    paths, expected = list_test_images(test_dir)
+    print(f"正在提取 {len(paths)} 张测试图片的特征（{workers} 个进程）...")
+    cache_file = os.path.join(settings.CACHE_DIR, "eval_encodings.npz")
+    probes = compute_probe_encodings(paths, cache_file, detector.model_type, workers)
     print()
 
-    known_faces = [f for f in os.listdir(known_dir) if f.endswith('.jpg')]
-    results['known_faces']['total'] = len(known_faces)
-
-    for i, face_file in enumerate(known_faces, 1):
-        expected_name = face_file[:-4]  # 去掉.jpg
-        filepath = os.path.join(known_dir, face_file)
-
-        # 读取并识别
-        image = cv2.imread(filepath)
-        face_locations, face_names = detector.detect_faces(image)
-
-        print(f"[{i}/{len(known_faces)}] {face_file:30s}", end=' ')
-
-        if len(face_locations) == 0:
-            print("✗ 未检测到人脸")
-            results['known_faces']['not_detected'] += 1
-            results['known_faces']['details'].append({
-                'file': face_file,
-                'expected': expected_name,
-                'result': 'NOT_DETECTED'
-            })
-        elif face_names[0] == expected_name:
-            print(f"✓ 正确: {face_names[0]}")
-            results['known_faces']['correct'] += 1
-            results['known_faces']['details'].append({
-                'file': face_file,
-                'expected': expected_name,
-                'result': face_names[0],
-                'status': 'CORRECT'
-            })
-        else:
-            print(f"✗ 错误: 识别为 {face_names[0]}，应为 {expected_name}")
-            results['known_faces']['wrong'] += 1
-            results['known_faces']['details'].append({
-                'file': face_file,
-                'expected': expected_name,
-                'result': face_names[0],
-                'status': 'WRONG'
-            })
+    # 与人脸库比对一次，之后所有容差值只做比较
+    gallery_names = detector.gallery.names[:len(detector.gallery)]
+    nearest = nearest_distances(probes, detector.gallery.encodings, gallery_names, expected)
+    detected = ~np.isnan(probes).any(axis=1)
+    is_known = np.array([name is not None for name in expected])
+    best_names = [gallery_names[i] if i >= 0 else None for i in nearest["best_index"]]
+    name_correct = np.array([name is not None and name == best for name, best in zip(expected, best_names)])
 
-    print()
-    print(f"已知人脸测试结果:")
-    print(f"  总数: {results['known_faces']['total']}")
-    print(f"  正确: {results['known_faces']['correct']} "
-          f"({results['known_faces']['correct']/results['known_faces']['total']*100:.1f}%)")
-    print(f"  错误: {results['known_faces']['wrong']}")
-    print(f"  未检测: {results['known_faces']['not_detected']}")
-    print()
+    tolerance = detector.tolerance
+    thresholds = np.union1d(DEFAULT_THRESHOLDS, [tolerance])
+    sweep = sweep_thresholds(nearest["best_distance"], name_correct, is_known, detected, thresholds)
+    recommended = recommend_threshold(sweep, target_far)
 
-    # 测试陌生人脸
+    # 阈值扫描表
     print("=" * 70)
-    print("测试2: 陌生人脸拒绝测试")
+    print("容差值扫描")
     print("=" * 70)
     print()
-    print("目标: 识别为 Unknown（拒绝识别）")
-    print()
-
-    unknown_faces = [f for f in os.listdir(unknown_dir) if f.endswith('.jpg')]
-    results['unknown_faces']['total'] = len(unknown_faces)
-
-    for i, face_file in enumerate(unknown_faces, 1):
-        filepath = os.path.join(unknown_dir, face_file)
-
-        # 读取并识别
-        image = cv2.imread(filepath)
-        face_locations, face_names = detector.detect_faces(image)
-
-        print(f"[{i}/{len(unknown_faces)}] {face_file:30s}", end=' ')
-
-        if len(face_locations) == 0:
-            print("✗ 未检测到人脸")
-            results['unknown_faces']['not_detected'] += 1
-            results['unknown_faces']['details'].append({
-                'file': face_file,
-                'result': 'NOT_DETECTED'
-            })
-        elif face_names[0] == 'Unknown':
-            print(f"✓ 正确拒绝（Unknown）")
-            results['unknown_faces']['correct_reject'] += 1
-            results['unknown_faces']['details'].append({
-                'file': face_file,
-                'result': 'Unknown',
-                'status': 'CORRECT_REJECT'
-            })
+    print(f"{'容差值':>8}{'FAR':>10}{'FRR':>10}{'误识别':>10}{'识别率':>10}{'准确率':>10}")
+    for i, t in enumerate(thresholds):
+        marker = " ← 当前" if np.isclose(t, tolerance) else (" ← 推荐" if np.isclose(t, recommended["threshold"]) else "")
+        print(f"{t:>10.2f}{sweep['far'][i]:>10.3f}{sweep['frr'][i]:>10.3f}{sweep['misid'][i]:>10.3f}"
+              f"{sweep['dir'][i]:>10.3f}{sweep['accuracy'][i]:>10.3f}{marker}")
+    print()
+
+    # 当前容差值下的逐图结果
+    current = int(np.flatnonzero(np.isclose(thresholds, tolerance))[0])
+    details = []
+    for path, name, best, distance, genuine, found in zip(
+            paths, expected, best_names, nearest["best_distance"], nearest["genuine_distance"], detected):
+        result = best if found and distance <= tolerance else ("NOT_DETECTED" if not found else "Unknown")
+        if not found:
+            status = "NOT_DETECTED"
+        elif name is None:
+            status = "CORRECT_REJECT" if result == "Unknown" else "FALSE_POSITIVE"
         else:
-            print(f"✗ 误识别为: {face_names[0]}")
-            results['unknown_faces']['false_positive'] += 1
-            results['unknown_faces']['details'].append({
-                'file': face_file,
-                'result': face_names[0],
-                'status': 'FALSE_POSITIVE'
-            })
-
-    print()
-    print(f"陌生人脸测试结果:")
-    print(f"  总数: {results['unknown_faces']['total']}")
-    print(f"  正确拒绝: {results['unknown_faces']['correct_reject']} "
-          f"({results['unknown_faces']['correct_reject']/results['unknown_faces']['total']*100:.1f}%)")
-    print(f"  误识别: {results['unknown_faces']['false_positive']}")
-    print(f"  未检测: {results['unknown_faces']['not_detected']}")
-    print()
+            status = "CORRECT" if result == name else ("REJECTED" if result == "Unknown" else "WRONG")
+        details.append({
+            "file": os.path.basename(path),
+            "expected": name or "Unknown",
+            "result": result,
+            "distance": round(float(distance), 6) if found else None,
+            # 与同名人脸的最近距离（拒识或误识别时可以看出差多少）
+            "genuine_distance": round(float(genuine), 6) if found and np.isfinite(genuine) else None,
+            "status": status
+        })
+
+    total_tests = int(detected.sum())
+    accuracy = float(sweep["accuracy"][current]) * 100
+    not_detected = len(paths) - total_tests
 
-    # 总体统计
     print("=" * 70)
     print("总体统计")
     print("=" * 70)
     print()
-
-    total_tests = results['known_faces']['total'] + results['unknown_faces']['total']
-    total_correct = (results['known_faces']['correct'] +
-                     results['unknown_faces']['correct_reject'])
-    total_errors = (results['known_faces']['wrong'] +
-                    results['unknown_faces']['false_positive'])
-    total_not_detected = (results['known_faces']['not_detected'] +
-                          results['unknown_faces']['not_detected'])
-
-    accuracy = total_correct / total_tests * 100 if total_tests > 0 else 0
-
-    print(f"总测试数: {total_tests}")
-    print(f"正确数: {total_correct}")
-    print(f"错误数: {total_errors}")
-    print(f"未检测: {total_not_detected}")
+    print(f"当前容差值: {tolerance}（settings.FACE_TOLERANCE）")
+    print(f"测试图片: {len(paths)}（未检测到人脸 {not_detected}）")
+    print(f"误识率 FAR: {sweep['far'][current]:.3f}")
+    print(f"拒识率 FRR: {sweep['frr'][current]:.3f}")
+    print(f"识别率: {sweep['dir'][current]:.3f}")
     print()
     print(f"✨ 总体准确率: {accuracy:.2f}%")
     print()
-
-    # 评级
-    if accuracy >= 95:
-        rating = "优秀 ⭐⭐⭐⭐⭐"
-    elif accuracy >= 90:
-        rating = "良好 ⭐⭐⭐⭐"
-    elif accuracy >= 80:
-        rating = "中等 ⭐⭐⭐"
-    elif accuracy >= 70:
-        rating = "及格 ⭐⭐"
-    else:
-        rating = "需要改进 ⭐"
-
-    print(f"评级: {rating}")
+    print(f"推荐容差值: {recommended['threshold']:.2f}（{recommended['rule']}，"
+          f"FAR {recommended['far']:.3f}，FRR {recommended['frr']:.3f}，识别率 {recommended['dir']:.3f}）")
     print()
 
-    # 保存结果
-    results['summary'] = {
-        'total_tests': total_tests,
-        'total_correct': total_correct,
-        'total_errors': total_errors,
-        'total_not_detected': total_not_detected,
-        'accuracy': accuracy,
-        'rating': rating,
-        'timestamp': datetime.now().isoformat()
+    curve_data = curves(nearest["best_distance"], name_correct, is_known, detected)
+    results = {
+        'details': details,
+        'sweep': [
+            {key: round(float(sweep[key][i]), 6) for key in ('far', 'frr', 'misid', 'dir', 'fnir', 'accuracy')}
+            | {'threshold': float(t)}
+            for i, t in enumerate(thresholds)
+        ],
+        'recommended': recommended,
+        'curves': curve_data,
+        'summary': {
+            'tolerance': tolerance,
+            'total_tests': total_tests,
+            'total_not_detected': not_detected,
+            'far': float(sweep['far'][current]),
+            'frr': float(sweep['frr'][current]),
+            'accuracy': accuracy,
+            'timestamp': datetime.now().isoformat()
+        }
     }
-
-    result_file = 'test_results.json'
     with open(result_file, 'w', encoding='utf-8') as f:
         json.dump(results, f, ensure_ascii=False, indent=2)
-
     print(f"详细结果已保存到: {result_file}")
-    print()
 
-    # 建议
-    print("=" * 70)
-    print("优化建议")
-    print("=" * 70)
+    if plot:
+        plot_curves(curve_data, {"threshold": tolerance, "far": float(sweep['far'][current]),
+                                 "dir": float(sweep['dir'][current])}, plot)
     print()
 
-    if results['known_faces']['wrong'] > 0:
-        print("⚠️  已知人脸识别错误:")
-        print("   - 可能原因: 照片质量、光线、角度差异")
-        print("   - 建议: 为每个人添加多张不同角度的照片")
-        print()
-
-    if results['unknown_faces']['false_positive'] > 0:
-        print("⚠️  陌生人脸误识别:")
-        print("   - 可能原因: 相似度阈值过低")
-        print("   - 建议: 调整 face_detector.py 中的 tolerance 参数")
-        print("   - 当前: 0.6，可以改为 0.5（更严格）")
+    if not np.isclose(recommended['threshold'], tolerance):
+        print("=" * 70)
+        print("优化建议")
+        print("=" * 70)
         print()
-
-    if total_not_detected > 0:
-        print("⚠️  部分人脸未检测到:")
-        print("   - 可能原因: 照片质量差、分辨率低、遮挡")
-        print("   - 建议: 使用高质量的正面照片")
+        print(f"⚠️  可将容差值调整为 {recommended['threshold']:.2f}: 设置环境变量 FACE_TOLERANCE={recommended['threshold']:.2f}")
         print()
-
     print("=" * 70)
 
+
 if __name__ == "__main__":
-    test_accuracy()
+    parser = argparse.ArgumentParser(description='人脸识别准确性测试（容差值扫描）')
+    parser.add_argument('--test-dir', default='test_set', help='测试集目录（默认: test_set）')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='特征提取进程数（默认: CPU 核数）')
+    parser.add_argument('--target-far', type=float, default=0.01, help='推荐容差值时允许的最大误识率（默认: 0.01）')
+    parser.add_argument('--plot', help='保存 ROC / DET 曲线图片（需要 matplotlib）')
+    parser.add_argument('--output', default='test_results.json', help='结果文件（默认: test_results.json）')
+    args = parser.parse_args()
+    test_accuracy(args.test_dir, args.workers, args.target_far, args.plot, args.output)
@@ -2,13 +2,16 @@
 # -*- coding: utf-8 -*-
 """
 API识别速度测试脚本
-测试通过HTTP API的识别速度
+测试通过HTTP API的识别速度（使用 face_client 连接池，连续请求复用长连接）
 """
 
 import time
-import requests
 from pathlib import Path
 
+from face_client import FaceAPIError, FaceClient
+
+API_URL = "http://localhost:8001"
+
 def format_time(seconds):
     """格式化时间"""
     if seconds < 1:
@@ -16,50 +19,41 @@ def format_time(seconds):
     else:
         return f"{seconds:.3f} 秒"
 
-def test_api_speed(image_path, api_url):
+def test_api_speed(image_path, client):
     """测试API识别速度"""
     print(f"\n{'='*70}")
     print(f"测试图片: {image_path}")
-    print(f"API地址: {api_url}")
+    print(f"API地址: {client.base_url}/api/detect")
     print(f"{'='*70}")
 
     # 读取图片文件
-    with open(image_path, 'rb') as f:
-        files = {'file': (Path(image_path).name, f, 'image/jpeg')}
-
-        # 记录开始时间
-        start_time = time.time()
-
-        # 发送请求
-        response = requests.post(api_url, files=files)
-
-        # 记录结束时间
-        end_time = time.time()
-
-    elapsed_time = end_time - start_time
-
-    # 解析响应
-    if response.status_code == 200:
-        data = response.json()
+    image = Path(image_path).read_bytes()
 
+    # 记录开始时间
+    start_time = time.time()
+    try:
+        data = client.detect(image)
+    except FaceAPIError as e:
+        elapsed_time = time.time() - start_time
         print(f"\n⏱️  总耗时: {format_time(elapsed_time)}")
-        print(f"✅ 识别成功")
-        print(f"📊 检测到人脸数: {data.get('face_count', 0)}")
+        print(f"❌ 请求失败: HTTP {e.status_code}")
+        print(f"响应: {e.detail}")
+        return elapsed_time, False
+    elapsed_time = time.time() - start_time
 
-        if 'faces' in data:
-            for i, face in enumerate(data['faces'], 1):
-                print(f"\n人脸 {i}:")
-                print(f"  - 姓名: {face.get('name', 'Unknown')}")
-                print(f"  - 位置: Top={face['location']['top']}, Left={face['location']['left']}")
+    print(f"\n⏱️  总耗时: {format_time(elapsed_time)}")
+    print("✅ 识别成功")
+    print(f"📊 检测到人脸数: {data.get('face_count', 0)}")
 
-        return elapsed_time, True
-    else:
-        print(f"\n⏱️  总耗时: {format_time(elapsed_time)}")
-        print(f"❌ 请求失败: HTTP {response.status_code}")
-        print(f"响应: {response.text}")
-        return elapsed_time, False
+    if 'faces' in data:
+        for i, face in enumerate(data['faces'], 1):
+            print(f"\n人脸 {i}:")
+            print(f"  - 姓名: {face.get('name', 'Unknown')}")
+            print(f"  - 位置: Top={face['location']['top']}, Left={face['location']['left']}")
 
-def test_multiple(image_paths, api_url, count=5):
+    return elapsed_time, True
+
+def test_multiple(image_paths, client, count=5):
     """测试多次请求的平均速度"""
     print(f"\n{'='*70}")
     print(f"批量测试: {count} 次请求")
@@ -74,41 +68,30 @@ def test_multiple(image_paths, api_url, count=5):
 
         print(f"\n[{i+1}/{count}] 测试: {Path(image_path).name}")
 
-        with open(image_path, 'rb') as f:
-            files = {'file': (Path(image_path).name, f, 'image/jpeg')}
-
-            start_time = time.time()
-            try:
-                response = requests.post(api_url, files=files, timeout=30)
-                end_time = time.time()
-
-                elapsed_time = end_time - start_time
-                times.append(elapsed_time)
-
-                if response.status_code == 200:
-                    data = response.json()
-                    success_count += 1
-                    face_count = data.get('face_count', 0)
-                    print(f"  ✅ 成功 - 耗时: {format_time(elapsed_time)} - 人脸数: {face_count}")
-                else:
-                    print(f"  ❌ 失败 - 耗时: {format_time(elapsed_time)} - HTTP {response.status_code}")
-
-            except Exception as e:
-                end_time = time.time()
-                elapsed_time = end_time - start_time
-                times.append(elapsed_time)
-                print(f"  ❌ 错误 - 耗时: {format_time(elapsed_time)} - {str(e)}")
+        image = Path(image_path).read_bytes()
+        start_time = time.time()
+        try:
+            data = client.detect(image)
+            elapsed_time = time.time() - start_time
+            times.append(elapsed_time)
+            success_count += 1
+            face_count = data.get('face_count', 0)
+            print(f"  ✅ 成功 - 耗时: {format_time(elapsed_time)} - 人脸数: {face_count}")
+        except FaceAPIError as e:
+            elapsed_time = time.time() - start_time
+            times.append(elapsed_time)
+            print(f"  ❌ 失败 - 耗时: {format_time(elapsed_time)} - {e}")
 
     # 统计结果
     if times:
         print(f"\n{'='*70}")
-        print(f"📊 批量测试统计")
+        print("📊 批量测试统计")
         print(f"{'='*70}")
         print(f"总测试数: {len(times)}")
         print(f"成功数: {success_count}")
         print(f"失败数: {len(times) - success_count}")
         print(f"成功率: {success_count / len(times) * 100:.1f}%")
-        print(f"\n⏱️  速度统计:")
+        print("\n⏱️  速度统计:")
         print(f"  - 最快: {format_time(min(times))}")
         print(f"  - 最慢: {format_time(max(times))}")
         print(f"  - 平均: {format_time(sum(times) / len(times))}")
@@ -116,32 +99,44 @@ def test_multiple(image_paths, api_url, count=5):
 
     return times
 
+def test_concurrent(image_paths, client, count=20, concurrency=4):
+    """并发测试：同时进行 concurrency 个请求（共用连接池），统计吞吐量"""
+    print(f"\n{'='*70}")
+    print(f"并发测试: {count} 次请求，并发 {concurrency}")
+    print(f"{'='*70}")
+
+    images = [Path(image_paths[i % len(image_paths)]).read_bytes() for i in range(count)]
+    start_time = time.time()
+    failed = sum(1 for _, result in client.detect_many(images, concurrency=concurrency)
+                 if isinstance(result, FaceAPIError))
+    elapsed_time = time.time() - start_time
+
+    print(f"成功数: {count - failed}，失败数: {failed}")
+    print(f"⏱️  总计: {format_time(elapsed_time)}，吞吐量: {count / elapsed_time:.1f} 张/秒")
+
+
 def main():
     print("="*70)
     print("人脸识别 API 速度测试")
     print("="*70)
 
-    # API地址
-    api_url = "http://localhost:8001/api/detect"
+    # 计时测试不自动重试，避免把重试等待计入耗时
+    client = FaceClient(API_URL, max_retries=0)
 
     # 检查服务是否运行
     print("\n🔄 检查服务状态...")
     try:
-        response = requests.get("http://localhost:8001/health", timeout=5)
-        if response.status_code == 200:
-            data = response.json()
-            print(f"✅ 服务正常运行")
-            print(f"📊 已加载人脸数: {data.get('known_faces_count', 0)}")
-        else:
-            print(f"⚠️  服务响应异常: HTTP {response.status_code}")
-    except Exception as e:
+        data = client.health()
+        print("✅ 服务正常运行")
+        print(f"📊 已加载人脸数: {data.get('known_faces_count', 0)}")
+    except FaceAPIError as e:
         print(f"❌ 无法连接到服务: {e}")
         return
 
     # 测试单张图片
     test_image = "自定义证件照_20240902.jpg"
     if Path(test_image).exists():
-        test_api_speed(test_image, api_url)
+        test_api_speed(test_image, client)
     else:
         print(f"\n⚠️  测试图片不存在: {test_image}")
 
@@ -161,8 +156,10 @@ def main():
     if len(test_images) > 0:
         print(f"\n\n找到 {len(test_images)} 张测试图片")
         print("进行批量测试（10次）...")
-        test_multiple(test_images, api_url, count=10)
+        test_multiple(test_images, client, count=10)
+        test_concurrent(test_images, client)
 
+    client.close()
     print(f"\n{'='*70}")
     print("测试完成！")
     print(f"{'='*70}")
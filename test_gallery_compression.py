@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试压缩人脸库的内存占用、检索速度和召回率
+对比 float64（精确）、float16、PQ（ADC 粗排 + 内存映射原始向量重排序）三种存储方式，
+召回率 recall@1 以 float64 精确检索的最近邻为准
+
+默认使用合成特征（每个身份一个中心，查询为中心加噪声），
+也可以用 --cache 指定真实的特征缓存作为人脸库
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from gallery import FaceGallery
+from pq_gallery import PQGallery
+
+
+def synthetic_gallery(n_faces, n_queries, seed=0):
+    """生成合成人脸库和查询（同一人距离约 0.3，不同人距离约 1.0）"""
+    rng = np.random.default_rng(seed)
+    encodings = rng.normal(0.0, 0.06, size=(n_faces, 128))
+    targets = rng.integers(0, n_faces, size=n_queries)
+    queries = encodings[targets] + rng.normal(0.0, 0.025, size=(n_queries, 128))
+    return [f"person_{i}" for i in range(n_faces)], encodings, queries
+
+
+def cached_gallery(cache_file, n_queries, seed=0):
+    """从真实特征缓存加载人脸库，查询为随机人脸加噪声"""
+    gallery = FaceGallery.load(cache_file)
+    if gallery is None or len(gallery) == 0:
+        raise SystemExit(f"❌ 缓存文件不存在或为空: {cache_file}")
+    rng = np.random.default_rng(seed)
+    targets = rng.integers(0, len(gallery), size=n_queries)
+    queries = gallery.encodings[targets] + rng.normal(0.0, 0.025, size=(n_queries, 128))
+    return list(gallery.names), np.array(gallery.encodings), queries
+
+
+def measure(gallery, queries, reference=None):
+    """逐个查询测量平均耗时，并计算 recall@1"""
+    top1 = np.empty(len(queries), dtype=np.int64)
+    start = time.time()
+    for i, query in enumerate(queries):
+        indices, _ = gallery.search(query[None, :], 1)
+        top1[i] = indices[0, 0]
+    elapsed = (time.time() - start) / len(queries)
+    recall = float(np.mean(top1 == reference)) if reference is not None else 1.0
+    return elapsed, recall, top1
+
+
+def run(names, encodings, queries, subspaces, rerank, work_dir):
+    """对一种人脸库规模测试三种存储方式"""
+    n = len(names)
+    print(f"\n{'='*70}")
+    print(f"人脸数量: {n}，查询数量: {len(queries)}")
+    print(f"{'='*70}")
+    print(f"{'存储方式':<16}{'常驻内存':>12}{'磁盘':>12}{'构建耗时':>12}{'单次检索':>12}{'recall@1':>10}")
+
+    results = {}
+    exact_top1 = None
+    for dtype in ("float64", "float16"):
+        start = time.time()
+        gallery = FaceGallery(capacity=n, dtype=dtype)
+        gallery.add_many(names, encodings)
+        build = time.time() - start
+        elapsed, recall, top1 = measure(gallery, queries, exact_top1)
+        if exact_top1 is None:
+            exact_top1 = top1
+        memory = gallery._buffer.nbytes + gallery._norms.nbytes
+        results[dtype] = (memory, 0, build, elapsed, recall)
+
+    full = FaceGallery(capacity=n)
+    full.add_many(names, encodings)
+    cache_file = str(Path(work_dir) / f"bench_{n}.pkl")
+    start = time.time()
+    pq = PQGallery.build(full, cache_file, subspaces=subspaces, rerank=rerank)
+    build = time.time() - start
+    elapsed, recall, _ = measure(pq, queries, exact_top1)
+    results[f"pq{subspaces}+rerank{rerank}"] = (pq.memory_bytes, pq.vectors_file.stat().st_size, build, elapsed, recall)
+
+    for label, (memory, disk, build, elapsed, recall) in results.items():
+        print(
+            f"{label:<16}{memory / 1024 / 1024:>10.1f}MB{disk / 1024 / 1024:>10.1f}MB"
+            f"{build:>11.2f}s{elapsed * 1000:>10.2f}ms{recall:>10.3f}"
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="压缩人脸库的内存、速度与召回率测试")
+    parser.add_argument("--sizes", default="10000,100000", help="人脸库规模，逗号分隔（默认: 10000,100000）")
+    parser.add_argument("--queries", type=int, default=200, help="查询数量（默认: 200）")
+    parser.add_argument("--subspaces", type=int, default=16, help="PQ 子空间数量（默认: 16）")
+    parser.add_argument("--rerank", type=int, default=64, help="PQ 重排序候选数量（默认: 64）")
+    parser.add_argument("--cache", help="使用真实特征缓存作为人脸库（忽略 --sizes）")
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("压缩人脸库测试")
+    print("=" * 70)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        if args.cache:
+            run(*cached_gallery(args.cache, args.queries), args.subspaces, args.rerank, work_dir)
+        else:
+            for size in (int(s) for s in args.sizes.split(",")):
+                run(*synthetic_gallery(size, args.queries), args.subspaces, args.rerank, work_dir)
+
+    print("\n说明: 常驻内存不含内存映射的原始向量文件（由操作系统按需换入，可在多个 worker 间共享）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
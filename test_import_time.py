@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+启动导入耗时测试
+使用 python -X importtime 测量 import main 的耗时，检查是否在预算之内，
+并确认 face_recognition / dlib / supabase 等重量级模块没有在导入阶段加载
+"""
+
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+# 导入耗时预算（毫秒），可通过环境变量调整
+IMPORT_TIME_BUDGET_MS = float(os.getenv("IMPORT_TIME_BUDGET_MS", "1500"))
+
+# 不允许在导入阶段加载的重量级模块
+HEAVY_MODULES = ("face_recognition", "face_recognition_models", "dlib", "supabase")
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure_import_time(module: str = "main"):
+    """
+    在子进程中测量模块导入耗时
+
+    Returns:
+        (模块总耗时毫秒, {模块名: 自身耗时微秒})
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=Path(__file__).parent,
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{result.stderr}")
+
+    total_us = 0
+    self_times = {}
+    for line in result.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        self_times[name] = int(self_us)
+        # 顶层模块前只有一个空格，子模块按层级缩进
+        if name == module and len(indent) <= 1:
+            total_us = int(cumulative_us)
+
+    return total_us / 1000, self_times
+
+
+def test_import_time():
+    """import main 在预算内完成，且不加载重量级模块"""
+    total_ms, self_times = measure_import_time("main")
+
+    loaded_heavy = [
+        name for name in self_times
+        if name.split(".")[0] in HEAVY_MODULES
+    ]
+    assert not loaded_heavy, f"导入阶段加载了重量级模块: {loaded_heavy}"
+    assert total_ms <= IMPORT_TIME_BUDGET_MS, \
+        f"import main 耗时 {total_ms:.1f} ms，超出预算 {IMPORT_TIME_BUDGET_MS:.0f} ms"
+
+
+def main():
+    print("=" * 70)
+    print("启动导入耗时测试")
+    print("=" * 70)
+
+    total_ms, self_times = measure_import_time("main")
+    print(f"\nimport main 总耗时: {total_ms:.1f} ms (预算 {IMPORT_TIME_BUDGET_MS:.0f} ms)")
+
+    print("\n自身耗时最长的 10 个模块:")
+    for name, us in sorted(self_times.items(), key=lambda item: item[1], reverse=True)[:10]:
+        print(f"  {us / 1000:8.2f} ms  {name}")
+
+    try:
+        test_import_time()
+        print("\n✅ 通过")
+    except AssertionError as e:
+        print(f"\n❌ 失败: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
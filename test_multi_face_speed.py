@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+多人照片识别速度测试
+将测试集中的人脸拼成一张合影（1~N 张人脸），比较：
+- 逐张人脸：face_recognition.face_encodings 每张人脸调用一次特征网络，逐个比对
+- 批量：FaceDetector.encode_faces 一次提取全部特征，一次矩阵运算比对
+- 并行：ENCODE_WORKERS 个进程按区域分组提取（人脸数 >= ENCODE_PARALLEL_MIN_FACES 时）
+
+使用方法:
+    python test_multi_face_speed.py
+    ENCODE_WORKERS=4 python test_multi_face_speed.py
+"""
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from config import settings
+from face_detector import get_face_detector
+
+FACE_COUNTS = [1, 5, 10, 20, 40, 80]
+TILE = 200
+ROUNDS = 3
+
+
+def make_group_photo(face_files, n):
+    """把 n 张人脸图片拼成网格合影"""
+    columns = int(np.ceil(np.sqrt(n)))
+    rows = int(np.ceil(n / columns))
+    canvas = Image.new("RGB", (columns * TILE, rows * TILE), (255, 255, 255))
+    for i in range(n):
+        face = Image.open(face_files[i % len(face_files)]).convert("RGB").resize((TILE, TILE))
+        canvas.paste(face, ((i % columns) * TILE, (i // columns) * TILE))
+    return np.array(canvas)
+
+
+def per_face(detector, image, locations):
+    """原来的做法：逐张人脸提取特征并比对"""
+    import face_recognition
+
+    encodings = face_recognition.face_encodings(image, locations)
+    return [detector.match_encodings(np.asarray([encoding]), top_k=1) for encoding in encodings]
+
+
+def batched(detector, image, locations):
+    """批量提取特征，一次比对"""
+    _, encodings = detector.encode_faces(image, locations)
+    return detector.match_encodings(encodings, top_k=1)
+
+
+def timed(func, *args):
+    times = []
+    for _ in range(ROUNDS):
+        start = time.time()
+        func(*args)
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main():
+    print("=" * 70)
+    print("多人照片识别速度测试")
+    print("=" * 70)
+
+    face_files = sorted(Path("test_set/known_faces").glob("*.jpg"))
+    if not face_files:
+        print("❌ 错误: 测试集不存在，请先运行 create_test_set.py")
+        return
+
+    detector = get_face_detector()
+    print(f"✓ 人脸库: {len(detector.known_face_names)} 个人脸")
+    print(f"  并行提取: ENCODE_WORKERS={settings.ENCODE_WORKERS}，"
+          f"ENCODE_PARALLEL_MIN_FACES={settings.ENCODE_PARALLEL_MIN_FACES}")
+    print()
+    print(f"{'人脸数':>8}{'逐张(ms)':>14}{'批量(ms)':>14}{'每张人脸(ms)':>16}{'加速':>8}")
+
+    for n in FACE_COUNTS:
+        image = make_group_photo(face_files, n)
+        locations = detector.locate_faces(image)
+        if not locations:
+            print(f"{n:>8}  未检测到人脸")
+            continue
+        # 预热（并行模式首次调用会启动进程池）
+        batched(detector, image, locations)
+        old = timed(per_face, detector, image, locations)
+        new = timed(batched, detector, image, locations)
+        print(f"{len(locations):>8}{old * 1000:>14.1f}{new * 1000:>14.1f}"
+              f"{new * 1000 / len(locations):>16.2f}{old / new:>7.2f}x")
+
+    print()
+    print("✅ 测试完成")
+
+
+if __name__ == "__main__":
+    main()
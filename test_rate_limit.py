@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+限流测试
+普通接口与视频流帧的限流器共用一个令牌桶存储（与 main.py 相同），检查：
+  - 清理已补满的令牌桶时，不会删除另一个限流器中尚未补满的令牌桶（否则突发限制可被绕过）
+  - 补满后的令牌桶会被清理，存储不会无限增长
+内存存储和 SQLite 存储各测试一遍
+"""
+
+import sys
+import tempfile
+from pathlib import Path
+
+from admission import MemoryBucketStore, RateLimiter, SQLiteBucketStore
+
+# 与默认配置相同：普通接口 60 次/分钟，视频流帧 240 次/分钟，突发 10 次
+API_PER_MINUTE = 60
+STREAM_PER_MINUTE = 240
+BURST = 10
+
+
+def allowed_count(store, limiter: RateLimiter, key: str, now: float, attempts: int = 20) -> int:
+    """同一时刻连续请求 attempts 次，返回放行的次数"""
+    return sum(store.take(key, limiter.rate, limiter.capacity, now)[0] for _ in range(attempts))
+
+
+def bucket_count(store) -> int:
+    if isinstance(store, SQLiteBucketStore):
+        return store._conn.execute("SELECT COUNT(*) FROM buckets").fetchone()[0]
+    return len(store._buckets)
+
+
+def check_shared_store(store):
+    """两个限流器共用一个存储"""
+    api = RateLimiter(API_PER_MINUTE, BURST, store)
+    stream = RateLimiter(STREAM_PER_MINUTE, BURST, store)
+    start = 1_000_000.0
+
+    assert allowed_count(store, api, "api:x", start) == BURST
+
+    # 3 秒后另一个客户端的视频流帧触发清理（视频流限流器约 2.5 秒补满）
+    store._last_sweep = 0.0
+    assert allowed_count(store, stream, "stream:y", start + 3, attempts=1) == 1
+
+    # api:x 只补充了约 3 个令牌，不能被当作新桶重新放行 10 次
+    allowed = allowed_count(store, api, "api:x", start + 3)
+    assert allowed == 3, f"api:x 放行了 {allowed} 次，应为 3 次"
+
+    # 两个令牌桶都补满后被清理
+    store._last_sweep = 0.0
+    assert allowed_count(store, stream, "stream:z", start + 100, attempts=1) == 1
+    remaining = bucket_count(store)
+    assert remaining == 1, f"清理后剩余 {remaining} 个令牌桶，应只剩 stream:z"
+
+
+def test_memory_store():
+    check_shared_store(MemoryBucketStore())
+
+
+def test_sqlite_store():
+    with tempfile.TemporaryDirectory() as tmp:
+        check_shared_store(SQLiteBucketStore(str(Path(tmp) / "rate_limit.db")))
+
+
+def main():
+    print("=" * 70)
+    print("限流测试（两个限流器共用一个令牌桶存储）")
+    print("=" * 70)
+
+    failed = False
+    for name, test in (("内存存储", test_memory_store), ("SQLite 存储", test_sqlite_store)):
+        try:
+            test()
+            print(f"✅ {name}")
+        except AssertionError as e:
+            print(f"❌ {name}: {e}")
+            failed = True
+    if failed:
+        sys.exit(1)
+    print("\n✅ 通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试识别结果的序列化耗时和响应大小
+对比不同人脸数量下：
+  - 人脸列表布局：objects（每张人脸一个对象）/ compact（平行数组）
+  - 编码方式：标准库 json / orjson / msgpack（未安装的跳过）
+耗时包含组织人脸列表和编码两部分；--image-kb 大于 0 时附带结果图片
+（JSON 为 base64 data URL，msgpack 为 JPEG 字节），模拟 /api/detect 的响应
+"""
+
+import argparse
+import base64
+import json
+import time
+
+import numpy as np
+
+import serialization
+from serialization import shape_faces
+
+
+def synthetic_result(n_faces, top_k, seed=0):
+    """生成 n_faces 张人脸的位置、人名和前 top_k 个候选人"""
+    rng = np.random.default_rng(seed)
+    locations = []
+    for _ in range(n_faces):
+        top, left = (int(v) for v in rng.integers(0, 3000, size=2))
+        size = int(rng.integers(40, 300))
+        locations.append((top, left + size, top + size, left))
+    matches = [
+        [(f"人员_{int(rng.integers(0, 10000))}", float(d), float(1 - d)) for d in np.sort(rng.uniform(0.2, 0.8, top_k))]
+        for _ in range(n_faces)
+    ]
+    names = [candidates[0][0] if candidates[0][1] < 0.6 else "Unknown" for candidates in matches]
+    return locations, names, matches
+
+
+def encoders():
+    """可用的编码方式 {名称: (编码函数, 图片是否为字节)}"""
+    available = {
+        # 与 Starlette JSONResponse 相同的参数
+        "json": (lambda content: json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), False)
+    }
+    if serialization.orjson is not None:
+        available["orjson"] = (serialization.dumps, False)
+    if serialization.msgpack is not None:
+        available["msgpack"] = (serialization.packb, True)
+    return available
+
+
+def measure(encode, locations, names, matches, layout, image, repeat):
+    """组织响应并编码，返回 (平均耗时毫秒, 响应字节数)"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        content = {"success": True, "face_count": len(locations), **shape_faces(locations, names, matches, layout)}
+        if image is not None:
+            content["result_image"] = image
+        body = encode(content)
+    return (time.perf_counter() - start) / repeat * 1000, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测试识别结果的序列化耗时和响应大小")
+    parser.add_argument("--faces", type=int, nargs="+", default=[1, 10, 100, 1000], help="人脸数量")
+    parser.add_argument("--top-k", type=int, default=5, help="每张人脸的候选人数量（0 表示不返回候选人）")
+    parser.add_argument("--image-kb", type=int, default=0, help="结果图片大小（KB），0 表示不附带图片")
+    parser.add_argument("--repeat", type=int, default=0, help="每种组合的重复次数（默认按人脸数量自动选择）")
+    args = parser.parse_args()
+
+    available = encoders()
+    skipped = [name for name in ("orjson", "msgpack") if name not in available]
+    jpeg = np.random.default_rng(0).bytes(args.image_kb * 1024) if args.image_kb > 0 else None
+    data_url = f"data:image/jpeg;base64,{base64.b64encode(jpeg).decode('ascii')}" if jpeg else None
+
+    print("=" * 70)
+    print(f"识别结果序列化测试（top_k={args.top_k}，结果图片 {args.image_kb} KB）")
+    if skipped:
+        print(f"⚠️  未安装: {', '.join(skipped)}，跳过")
+    print("=" * 70)
+
+    for n_faces in args.faces:
+        locations, names, matches = synthetic_result(n_faces, max(args.top_k, 1))
+        matches = matches if args.top_k > 0 else None
+        repeat = args.repeat or max(5, 20000 // max(n_faces, 1))
+        print(f"\n人脸数量: {n_faces}（重复 {repeat} 次）")
+        print(f"{'编码':<10}{'布局':<10}{'耗时(ms)':>12}{'大小(KB)':>12}{'相对 json':>12}")
+        baseline = None
+        for name, (encode, binary_image) in available.items():
+            for layout in ("objects", "compact"):
+                image = jpeg if binary_image else data_url
+                elapsed, size = measure(encode, locations, names, matches, layout, image, repeat)
+                if baseline is None:
+                    baseline = elapsed
+                print(f"{name:<10}{layout:<10}{elapsed:>12.3f}{size / 1024:>12.1f}{baseline / elapsed:>11.1f}x")
+
+    print("\n✅ 测试完成")
+
+
+if __name__ == "__main__":
+    main()
@@ -42,8 +42,7 @@ def test_with_n_faces(n_faces, test_image_path, all_faces_dir):
                 rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
                 encodings = face_recognition.face_encodings(rgb_image)
                 if encodings:
-                    detector.known_face_encodings.append(encodings[0])
-                    detector.known_face_names.append(face_path.stem)
+                    detector.gallery.add(face_path.stem, encodings[0])
             except Exception as e:
                 pass
 
@@ -0,0 +1,471 @@
+"""
+视频文件人脸识别模块
+- 流式解码：优先使用 OpenCV，未安装时使用 ffmpeg 子进程输出原始 RGB 帧，不把整个视频读入内存
+- 按固定频率抽帧检测；画面突变（场景切换）时额外检测一帧
+- 检测框按 IoU 关联成轨迹，每条轨迹只间隔提取少量几次特征，不逐帧编码
+- 长视频按时间分段由多个进程并行处理，分段边界处位置相接的轨迹合并
+- 身份在主进程中确定：所有轨迹的特征一次与人脸库比对，每条轨迹按多数投票取人名
+"""
+import json
+import math
+import multiprocessing
+import shutil
+import subprocess
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from roi_tracker import Box, StreamROITracker
+
+# 场景变化检测用的缩略图宽度
+THUMBNAIL_WIDTH = 64
+
+
+class VideoOptions:
+    """视频处理参数"""
+
+    def __init__(
+        self,
+        sample_fps: float = 2.0,
+        scan_fps: float = 6.0,
+        scene_threshold: float = 0.12,
+        max_width: int = 1280,
+        track_samples: int = 3,
+        sample_interval: float = 1.0,
+        iou_threshold: float = 0.3,
+        max_gap: float = 2.0,
+        model_type: str = "hog"
+    ):
+        """
+        Args:
+            sample_fps: 每秒检测的帧数
+            scan_fps: 解码帧率（用于发现场景变化，变化时在两次定时检测之间额外检测）
+            scene_threshold: 与上一检测帧的缩略图平均差异（0~1）超过该值视为场景变化
+            max_width: 检测前把帧缩小到的最大宽度
+            track_samples: 每条轨迹最多提取特征的次数
+            sample_interval: 同一轨迹两次提取特征的最小间隔（秒）
+            iou_threshold: 检测框与轨迹关联的最小 IoU
+            max_gap: 轨迹允许的最长消失时间（秒），超过后结束该轨迹
+            model_type: 人脸检测模型
+        """
+        self.sample_fps = sample_fps
+        self.scan_fps = max(scan_fps, sample_fps)
+        self.scene_threshold = scene_threshold
+        self.max_width = max_width
+        self.track_samples = track_samples
+        self.sample_interval = sample_interval
+        self.iou_threshold = iou_threshold
+        self.max_gap = max_gap
+        self.model_type = model_type
+
+
+# ----------------------------------------------------------------------
+# 解码
+# ----------------------------------------------------------------------
+
+def _backend() -> str:
+    try:
+        import cv2  # noqa: F401
+        return "cv2"
+    except ImportError:
+        pass
+    if shutil.which("ffmpeg") and shutil.which("ffprobe"):
+        return "ffmpeg"
+    raise RuntimeError("解码视频需要 opencv-python-headless 或 ffmpeg")
+
+
+def probe_video(path: str) -> Dict:
+    """
+    读取视频的帧率、时长和分辨率
+
+    Raises:
+        ValueError: 无法读取视频
+    """
+    if _backend() == "cv2":
+        import cv2
+
+        capture = cv2.VideoCapture(path)
+        if not capture.isOpened():
+            raise ValueError("无法打开视频文件")
+        fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+        frames = capture.get(cv2.CAP_PROP_FRAME_COUNT)
+        info = {
+            "fps": fps,
+            "duration": frames / fps if frames > 0 else None,
+            "width": int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            "height": int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        }
+        capture.release()
+        return info
+
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_streams", "-show_format", "-of", "json", path],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise ValueError(f"无法读取视频文件: {result.stderr.strip()}")
+    data = json.loads(result.stdout)
+    if not data.get("streams"):
+        raise ValueError("文件中没有视频流")
+    stream = data["streams"][0]
+    numerator, _, denominator = stream.get("avg_frame_rate", "25/1").partition("/")
+    fps = float(numerator) / float(denominator or 1) if float(denominator or 1) else 25.0
+    duration = stream.get("duration") or data.get("format", {}).get("duration")
+    return {
+        "fps": fps or 25.0,
+        "duration": float(duration) if duration else None,
+        "width": int(stream["width"]),
+        "height": int(stream["height"]),
+    }
+
+
+def frame_size(info: Dict, max_width: int) -> Tuple[int, int, float]:
+    """检测用帧的宽、高（偶数，ffmpeg 缩放要求）及相对原始分辨率的缩放比例"""
+    scale = min(1.0, max_width / info["width"])
+    width = max(2, int(info["width"] * scale) // 2 * 2)
+    height = max(2, int(info["height"] * scale) // 2 * 2)
+    return width, height, width / info["width"]
+
+
+def iter_frames(
+    path: str, info: Dict, start: float, end: Optional[float], scan_fps: float, max_width: int
+) -> Iterator[Tuple[float, np.ndarray]]:
+    """
+    流式读取 [start, end) 时间段内按 scan_fps 抽取的帧
+
+    Returns:
+        (时间戳秒, RGB 帧) 迭代器，帧已缩小到 max_width 以内
+    """
+    width, height, scale = frame_size(info, max_width)
+
+    if _backend() == "cv2":
+        import cv2
+
+        capture = cv2.VideoCapture(path)
+        fps = info["fps"]
+        step = max(1, int(round(fps / scan_fps)))
+        if start > 0:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, int(start * fps))
+        try:
+            # grab 只解码不转换，跳过的帧开销很小
+            while capture.grab():
+                frame_number = int(capture.get(cv2.CAP_PROP_POS_FRAMES)) - 1
+                timestamp = frame_number / fps
+                if end is not None and timestamp >= end:
+                    break
+                if timestamp < start or frame_number % step:
+                    continue
+                ok, frame = capture.retrieve()
+                if not ok:
+                    break
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                if scale < 1.0:
+                    frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+                yield timestamp, frame
+        finally:
+            capture.release()
+        return
+
+    command = ["ffmpeg", "-nostdin", "-v", "error", "-ss", f"{start:.3f}", "-i", path]
+    if end is not None:
+        command += ["-t", f"{end - start:.3f}"]
+    command += ["-vf", f"fps={scan_fps},scale={width}:{height}", "-f", "rawvideo", "-pix_fmt", "rgb24", "pipe:1"]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    frame_bytes = width * height * 3
+    try:
+        index = 0
+        while True:
+            data = process.stdout.read(frame_bytes)
+            if len(data) < frame_bytes:
+                break
+            # frombuffer 返回只读数组，复制一份供 dlib 使用
+            yield start + index / scan_fps, np.frombuffer(data, dtype=np.uint8).reshape(height, width, 3).copy()
+            index += 1
+    finally:
+        process.kill()
+        process.wait()
+
+
+def thumbnail(frame: np.ndarray) -> np.ndarray:
+    """灰度缩略图（场景变化检测）"""
+    step = max(1, frame.shape[1] // THUMBNAIL_WIDTH)
+    return frame[::step, ::step].mean(axis=2, dtype=np.float32)
+
+
+# ----------------------------------------------------------------------
+# 轨迹
+# ----------------------------------------------------------------------
+
+def box_iou(a: Box, b: Box) -> float:
+    """两个人脸框的交并比"""
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    inter = max(0, right - left) * max(0, bottom - top)
+    union = (a[1] - a[3]) * (a[2] - a[0]) + (b[1] - b[3]) * (b[2] - b[0]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+class Track:
+    """一个人在视频中连续出现的轨迹"""
+
+    __slots__ = ("start", "end", "first_box", "box", "detections", "encodings", "last_encoded")
+
+    def __init__(self, timestamp: float, box: Box):
+        self.start = timestamp
+        self.end = timestamp
+        self.first_box = box
+        self.box = box
+        self.detections = 1
+        self.encodings: List[np.ndarray] = []
+        self.last_encoded = -math.inf
+
+
+class IoUTracker:
+    """按 IoU 把每帧的检测框关联到已有轨迹"""
+
+    def __init__(self, options: VideoOptions):
+        self.options = options
+        self.tracks: List[Track] = []
+
+    def update(self, timestamp: float, boxes: List[Box]) -> List[Tuple[Track, Box]]:
+        """
+        关联当前帧的检测框
+
+        Returns:
+            需要提取特征的 (轨迹, 人脸框)：新轨迹，以及距上次提取超过间隔且次数未满的轨迹
+        """
+        active = [track for track in self.tracks if timestamp - track.end <= self.options.max_gap]
+        pairs = sorted(
+            ((box_iou(track.box, box), t, b) for t, track in enumerate(active) for b, box in enumerate(boxes)),
+            reverse=True
+        )
+        matched_tracks, matched_boxes = set(), {}
+        for iou, t, b in pairs:
+            if iou < self.options.iou_threshold:
+                break
+            if t in matched_tracks or b in matched_boxes:
+                continue
+            matched_tracks.add(t)
+            matched_boxes[b] = active[t]
+
+        to_encode = []
+        for b, box in enumerate(boxes):
+            track = matched_boxes.get(b)
+            if track is None:
+                track = Track(timestamp, box)
+                self.tracks.append(track)
+            else:
+                track.end = timestamp
+                track.box = box
+                track.detections += 1
+            if (len(track.encodings) < self.options.track_samples and
+                    timestamp - track.last_encoded >= self.options.sample_interval):
+                track.last_encoded = timestamp
+                to_encode.append((track, box))
+        return to_encode
+
+
+# ----------------------------------------------------------------------
+# 分段处理
+# ----------------------------------------------------------------------
+
+_segment_detector = None
+
+
+def process_segment(path: str, info: Dict, start: float, end: Optional[float],
+                    options: VideoOptions, detector=None) -> List[Dict]:
+    """
+    检测并跟踪一个时间段内的人脸（可在工作进程中执行，不需要人脸库）
+
+    Returns:
+        轨迹列表（人脸框为缩放后帧中的坐标，特征为 (k, 128) 矩阵）
+    """
+    global _segment_detector
+    if detector is None:
+        if _segment_detector is None:
+            from face_detector import FaceDetector
+
+            _segment_detector = FaceDetector(model_type=options.model_type)
+        detector = _segment_detector
+
+    roi_tracker = StreamROITracker()
+    tracker = IoUTracker(options)
+    scene, last_thumbnail, last_analyzed = 0, None, -math.inf
+    for timestamp, frame in iter_frames(path, info, start, end, options.scan_fps, options.max_width):
+        small = thumbnail(frame)
+        changed = (last_thumbnail is not None and small.shape == last_thumbnail.shape and
+                   float(np.abs(small - last_thumbnail).mean()) / 255 > options.scene_threshold)
+        if not changed and timestamp - last_analyzed < 1.0 / options.sample_fps:
+            continue
+        last_thumbnail, last_analyzed = small, timestamp
+        if changed:
+            # 场景切换后上一场景的人脸位置无效，换一个 ROI 流标识强制全图检测
+            scene += 1
+
+        boxes = roi_tracker.locate_faces(f"scene-{scene}", frame, detector.locate_faces)
+        to_encode = tracker.update(timestamp, [tuple(box) for box in boxes])
+        if to_encode:
+            _, encodings = detector.encode_faces(frame, [box for _, box in to_encode])
+            for (track, _), encoding in zip(to_encode, encodings):
+                track.encodings.append(encoding)
+
+    return [
+        {
+            "start": track.start,
+            "end": track.end,
+            "first_box": track.first_box,
+            "box": track.box,
+            "detections": track.detections,
+            "encodings": np.asarray(track.encodings, dtype=np.float64).reshape(-1, 128),
+        }
+        for track in tracker.tracks
+    ]
+
+
+def split_segments(duration: Optional[float], workers: int, min_seconds: float) -> List[Tuple[float, Optional[float]]]:
+    """按进程数把视频分成若干时间段（每段不短于 min_seconds）"""
+    if not duration or workers <= 1:
+        return [(0.0, None)]
+    count = max(1, min(workers, int(duration // min_seconds)))
+    bounds = [duration * i / count for i in range(count)] + [None]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def merge_boundary_tracks(tracks: List[Dict], boundaries: List[float], options: VideoOptions) -> List[Dict]:
+    """合并在分段边界处断开的轨迹（前一段末尾与后一段开头位置相接）"""
+    tracks = sorted(tracks, key=lambda t: t["start"])
+    for boundary in boundaries:
+        ending = [t for t in tracks if boundary - options.max_gap <= t["end"] < boundary]
+        starting = [t for t in tracks if boundary <= t["start"] <= boundary + options.max_gap]
+        for before in ending:
+            candidates = [
+                after for after in starting
+                if box_iou(before["box"], after["first_box"]) >= options.iou_threshold
+            ]
+            if not candidates:
+                continue
+            after = max(candidates, key=lambda t: box_iou(before["box"], t["first_box"]))
+            before["end"] = after["end"]
+            before["box"] = after["box"]
+            before["detections"] += after["detections"]
+            before["encodings"] = np.vstack([before["encodings"], after["encodings"]])
+            starting.remove(after)
+            tracks.remove(after)
+    return tracks
+
+
+_video_pool = None
+_video_pool_lock = threading.Lock()
+
+
+def _get_video_pool(workers: int) -> ProcessPoolExecutor:
+    global _video_pool
+    if _video_pool is None:
+        with _video_pool_lock:
+            if _video_pool is None:
+                _video_pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+    return _video_pool
+
+
+# ----------------------------------------------------------------------
+# 识别
+# ----------------------------------------------------------------------
+
+def identify_tracks(tracks: List[Dict], detector, scale: float) -> List[Dict]:
+    """
+    为每条轨迹确定身份：所有轨迹的特征一次比对，按多数投票取人名
+
+    Returns:
+        可直接序列化的轨迹摘要，人脸框换算回原始分辨率
+    """
+    counts = [len(track["encodings"]) for track in tracks]
+    encodings = np.vstack([track["encodings"] for track in tracks]) if tracks else np.empty((0, 128))
+    matches = detector.match_encodings(encodings, top_k=1) if len(encodings) else []
+
+    summaries, offset = [], 0
+    for index, (track, count) in enumerate(zip(tracks, counts)):
+        votes = [
+            candidates[0] for candidates in matches[offset:offset + count]
+            if candidates and candidates[0][1] <= detector.tolerance
+        ]
+        offset += count
+        name, distance, confidence = "Unknown", None, None
+        if votes:
+            name = Counter(vote[0] for vote in votes).most_common(1)[0][0]
+            distance = min(vote[1] for vote in votes if vote[0] == name)
+            confidence = float(np.mean([vote[2] for vote in votes if vote[0] == name]))
+        top, right, bottom, left = (int(round(v / scale)) for v in track["box"])
+        summaries.append({
+            "track_id": index,
+            "name": name,
+            "distance": round(distance, 6) if distance is not None else None,
+            "confidence": round(confidence, 4) if confidence is not None else None,
+            "votes": len(votes),
+            "samples": count,
+            "start": round(track["start"], 3),
+            "end": round(track["end"], 3),
+            "detections": track["detections"],
+            "location": {"top": top, "right": right, "bottom": bottom, "left": left},
+        })
+    return summaries
+
+
+def people_summary(tracks: List[Dict], max_gap: float) -> List[Dict]:
+    """按人名汇总出现的时间段（间隔不超过 max_gap 的时间段合并）"""
+    ranges: Dict[str, List[List[float]]] = {}
+    for track in sorted(tracks, key=lambda t: t["start"]):
+        if track["name"] == "Unknown":
+            continue
+        spans = ranges.setdefault(track["name"], [])
+        if spans and track["start"] - spans[-1][1] <= max_gap:
+            spans[-1][1] = max(spans[-1][1], track["end"])
+        else:
+            spans.append([track["start"], track["end"]])
+    return [
+        {"name": name, "appearances": [{"start": s, "end": e} for s, e in spans],
+         "total_seconds": round(sum(e - s for s, e in spans), 3)}
+        for name, spans in ranges.items()
+    ]
+
+
+def process_video(path: str, detector, options: VideoOptions, workers: int = 1,
+                  min_segment_seconds: float = 30.0) -> Dict:
+    """
+    识别视频文件中出现的人
+
+    Args:
+        path: 视频文件路径
+        detector: 已加载人脸库的 FaceDetector（单进程时也用于检测）
+        options: 处理参数
+        workers: 并行处理的进程数
+        min_segment_seconds: 每个进程处理的最短时长
+
+    Returns:
+        {"duration", "fps", "width", "height", "tracks", "people"}
+
+    Raises:
+        ValueError: 无法读取视频
+        RuntimeError: 没有可用的视频解码器
+    """
+    info = probe_video(path)
+    segments = split_segments(info["duration"], workers, min_segment_seconds)
+    if len(segments) == 1:
+        tracks = process_segment(path, info, 0.0, None, options, detector)
+    else:
+        pool = _get_video_pool(workers)
+        futures = [pool.submit(process_segment, path, info, start, end, options) for start, end in segments]
+        tracks = [track for future in futures for track in future.result()]
+        tracks = merge_boundary_tracks(tracks, [start for start, _ in segments[1:]], options)
+
+    summaries = identify_tracks(tracks, detector, frame_size(info, options.max_width)[2])
+    return {
+        "duration": info["duration"],
+        "fps": info["fps"],
+        "width": info["width"],
+        "height": info["height"],
+        "tracks": summaries,
+        "people": people_summary(summaries, options.max_gap),
+    }
@@ -0,0 +1,99 @@
+"""
+启动预热模块
+模型和人脸库加载完成后，先用合成数据把识别流程完整运行一遍，再把 worker 标记为就绪，
+避免重启后的首批请求承担模型页面换入、dlib 缓冲区分配等一次性开销：
+
+- 每个图片宽度（WARMUP_IMAGE_SIZES）运行一次人脸检测（HOG 图像金字塔按图片尺寸分配缓冲区）
+- 每个人脸数（WARMUP_BATCH_SIZES）运行一次特征提取、人脸库比对和结果标注
+  （关键点模型、ResNet 网络的批量缓冲区；人脸多时还会启动并行提取特征的进程池）
+- 顺序读取一遍内存映射的人脸库文件（PQ 模式的原始向量），首批重排序不再随机读磁盘
+
+各阶段耗时记录在 RequestTrace 中（毫秒），由 /metrics 返回
+"""
+import io
+import logging
+import math
+from typing import List, Sequence
+
+import numpy as np
+
+from profiling import RequestTrace
+
+logger = logging.getLogger(__name__)
+
+# 预热比对时每张人脸的候选数量
+WARMUP_TOP_K = 5
+
+
+def synthetic_image(width: int, seed: int = 0) -> np.ndarray:
+    """生成 4:3 的合成 RGB 图片（随机纹理，检测器会完整扫描图像金字塔）"""
+    height = width * 3 // 4
+    return np.random.default_rng(seed).integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+
+
+def face_grid(width: int, height: int, count: int) -> List[tuple]:
+    """把 count 个人脸框排成网格（最小 40 像素）"""
+    columns = math.ceil(math.sqrt(count))
+    cell = max(40, min(width, height) // columns)
+    size = cell * 4 // 5
+    locations = []
+    for i in range(count):
+        top, left = (i // columns) * cell % max(height - size, 1), (i % columns) * cell % max(width - size, 1)
+        locations.append((top, left + size, top + size, left))
+    return locations
+
+
+def run_warmup(detector, image_sizes: Sequence[int], batch_sizes: Sequence[int], trace: RequestTrace) -> List[str]:
+    """
+    用合成数据运行一遍识别流程
+
+    单个阶段失败只记录下来，不影响其他阶段（预热失败不应阻止服务就绪）
+
+    Args:
+        detector: 已加载的 FaceDetector
+        image_sizes: 检测预热的图片宽度
+        batch_sizes: 特征提取和比对预热的单张图片人脸数
+        trace: 记录各阶段耗时
+
+    Returns:
+        失败阶段的错误信息
+    """
+    errors = []
+    images = {width: synthetic_image(width) for width in sorted(set(image_sizes)) if width > 0}
+    if not images:
+        images = {640: synthetic_image(640)}
+
+    for width, image in images.items():
+        try:
+            with trace.stage(f"detect_{width}"):
+                detector.locate_faces(image)
+        except Exception as e:
+            errors.append(f"detect_{width}: {e}")
+
+    image = images[max(images)]
+    for count in sorted(set(batch_sizes)):
+        if count <= 0:
+            continue
+        locations = face_grid(image.shape[1], image.shape[0], count)
+        try:
+            with trace.stage(f"encode_{count}"):
+                locations, encodings = detector.encode_faces(image, locations)
+            with trace.stage(f"match_{count}"):
+                names = detector.names_from_matches(detector.match_encodings(encodings, top_k=WARMUP_TOP_K))
+            with trace.stage(f"annotate_{count}"):
+                detector.draw_faces(image, locations, names).save(io.BytesIO(), format="JPEG")
+        except Exception as e:
+            errors.append(f"batch_{count}: {e}")
+
+    prefetch = getattr(detector.gallery, "prefetch", None) if detector.shards is None else None
+    if prefetch is not None:
+        try:
+            with trace.stage("gallery_prefetch"):
+                size = prefetch()
+            logger.info(f"已预读内存映射人脸库 {size / 1024 / 1024:.1f} MB")
+        except Exception as e:
+            errors.append(f"gallery_prefetch: {e}")
+
+    for error in errors:
+        logger.warning(f"预热阶段失败: {error}")
+    return errors